@@ -24,7 +24,8 @@ class TMSourceHightlighter(QtGui.QSyntaxHighlighter):
         brush = QtGui.QBrush( Qt.darkMagenta, Qt.SolidPattern )
         keyword.setForeground( brush )
         keyword.setFontWeight( QtGui.QFont.Bold )
-        keywords = QtCore.QStringList( ['INITIAL', 'FINAL', 'BLANK', 'HALT'])
+        keywords = QtCore.QStringList( ['INITIAL', 'FINAL', 'BLANK', 'HALT',
+                                         'IMPORT', 'CALL'])
         
         for word in keywords:
             pattern = QtCore.QRegExp("^\s*\\b" + word + "\\b")
@@ -1,35 +1,79 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import io
+import os
+import sys
 import copy
+import time
+import array
+import struct
+import hashlib
 import inspect
+import itertools
 import tmexceptions
 
 
 class TuringMachine:
     """
     Represents a turing machine, to work propertly there are some restrictions:
-        - symbols on input alphabet and tape alphabet must be one char length
+        - symbols on input alphabet and tape alphabet must be strings, with
+          no whitespace if some of them has more than one char
         - transition function must be a dictionary with the following format:
                         (state, symbol) : (state, symbol, movement)
         - tape movements are defined by the following "constants":
             - MOVE_LEFT
             - MOVE_RIGHT
             - NON_MOVEMENT
+            
+    The symbols are interned to dense integer codes when the machine is
+    created. If the tape alphabet fits in MAX_COMPACT_SYMBOLS codes, the tape
+    is stored as a bytearray of symbol codes (compact tape), otherwise as an
+    array of 2 or 4 bytes codes. If all the symbols are one char strings,
+    their codes are the chars themselves, so the compact tape holds the tape
+    text
+    
+    If some symbol has more than one char, strings given to setTape are split
+    by whitespace into symbols
     """
 
     MOVE_RIGHT = 1
     MOVE_LEFT = 2
     NON_MOVEMENT = 3
     HEAD_MOVEMENTS = frozenset((MOVE_LEFT, MOVE_RIGHT, NON_MOVEMENT))
+    
+    # run() return values
+    END_HALT = 0
+    END_MAX_STEPS = 1
+    END_UNKNOWN_TRANSITION = 2
+    END_DEADLINE = 3
+    END_MAX_TAPE_CELLS = 4
+    END_MAX_TAPE_MEMORY = 5
+    END_BREAKPOINT = 6
+    END_OUT_OF_BOUNDS = 7
+    # Only returned by decideHalting
+    END_LOOP = 8
+    
+    # Breakpoint kinds, see addBreakpoint
+    BREAK_STATE = 'state'
+    BREAK_TRANSITION = 'transition'
+    BREAK_CELL = 'cell'
+    BREAK_HEAD = 'head'
+    BREAK_STEP = 'step'
+    BREAKPOINT_KINDS = frozenset((BREAK_STATE, BREAK_TRANSITION, BREAK_CELL,
+                                  BREAK_HEAD, BREAK_STEP))
+    
+    MAX_COMPACT_SYMBOLS = 256
+    MAX_SHORT_SYMBOLS = 65536
+    BLANK_BLOCK_SIZE = 4096
 
     #
     #
     def __init__(self, states, in_alphabet, tape_alphabet, trans_function,
-                 istate, fstates, hstate, blank):
+                 istate, fstates, hstate, blank, checked=False):
         """
         TuringMachine(states, in_alphabet, tape_alphabet, trans_function,
-                    istate, fstate, hstate, blank)
+                    istate, fstate, hstate, blank, checked=False)
         Initialize an instance of TuringMachine with the given data
             - states:
                 Iterable with the possible states
@@ -48,6 +92,10 @@ class TuringMachine:
                 Halt state. If reached, execution stops inmediatly
             - blank: 
                 Default symbol in all unespecified tape possitions
+            - checked:
+                True if every transition is already known to be valid (as
+                the ones collected by TuringMachineBuilder), so they are
+                not validated again
         """
         self._states = frozenset(states)
         self._in_alphabet = frozenset(in_alphabet)
@@ -58,18 +106,54 @@ class TuringMachine:
         self._hstate = hstate
         self._blank = blank
 
-        self._checkData()
+        self._checkData(not checked)
+        self._initTapeCodes()
+        self._initCodeTrans()
+        self._initExecution()
         
+    #
+    #
+    def _initExecution(self):
+        """
+        Initializes the tape, the current state and all the execution
+        settings
+        """
         # Machine tape, head and current state
         self._tape = None
         self._head = 0
-        self._cur_state = istate
+        self._cur_state = self._istate
+        # Amount of cells added at the left of the tape set by setTape
+        self._origin = 0
         self._nexecuted_steps = 0
+        # Steps that entered a state different from the one they left
+        self._nstate_changes = 0
         
         # Set of observers
         # is a list because other structures like set forces to implement
         # the __hash__ operation
         self._observers = []
+        
+        # Alternative execution engine used by run, see setEngine
+        self._engine = None
+        self._fingerprint = None
+        # isWordAccepted results cache, see setResultCache
+        self._result_cache = None
+        
+        # Breakpoints by kind, see addBreakpoint. Empty if there are none
+        self._breakpoints = {}
+        self._last_breakpoint = None
+        # Executed steps when the last breakpoint stopped before a step
+        self._break_at = None
+        # Runtime metrics sampled by run, see setMetrics
+        self._metrics = None
+        # Cells of the bounded tape mode, see setTapeBound. The current tape
+        # is bounded if it was set with a bound
+        self._bound = None
+        self._bounded_tape = False
+        self._bounded_trans = None
+        self._marker_code = None
+        # Automaton used by isWordAccepted, see setAutomaton
+        self._automaton = None
 
     #
     #
@@ -84,16 +168,17 @@ class TuringMachine:
         """
         if self.isAtHaltState():
             raise tmexceptions.HaltStateException('Current state is halt state')
-        if self._tape == None:
+        if self._tape is None:
             raise tmexceptions.UnsetTapeException(
                 'Tape must be set before perform an step')
                 
+        # The internal tape holds symbol codes
         cur = (self._cur_state, self._tape[self._head])
         for obs in self._observers:
-            obs.onStepStart(cur[0], cur[1])
+            obs.onStepStart(cur[0], self._decodeSymbol(cur[1]))
             
         try:
-            state, sym, movement = self._trans_function[cur]
+            state, sym, movement = self._code_trans[cur]
             
             self._tape[self._head] = sym
             self._cur_state = state
@@ -102,41 +187,91 @@ class TuringMachine:
             
             if movement == TuringMachine.MOVE_LEFT:
                 if self._head == 0:
-                    self._tape.insert(0, self._blank)
+                    if self._bounded_tape:
+                        self._outOfBounds(cur)
+                    self._tape.insert(0, self._blank_code)
+                    self._origin += 1
                 else:
                     self._head -= 1                    
                     
             elif movement == TuringMachine.MOVE_RIGHT:
                 self._head += 1
                 if self._head == len(self._tape):
-                    self._tape.append(self._blank)                
+                    if self._bounded_tape:
+                        self._head -= 1
+                        self._outOfBounds(cur)
+                    self._tape.append(self._blank_code)
         
             # Notify observers
             for obs in self._observers:
-                obs.onStepEnd(state, sym, movement)
+                obs.onStepEnd(state, self._decodeSymbol(sym), movement)
                 
                 if prev_head_pos != self._head:
                     obs.onHeadMoved(self._head, prev_head_pos)
                 
             self._nexecuted_steps += 1        
+            if state != cur[0]:
+                self._nstate_changes += 1
         
         except KeyError:
             raise tmexceptions.UnknownTransitionException(
-                'There are no transition for %s' % str(cur))
+                'There are no transition for %s' %
+                str((cur[0], self._decodeSymbol(cur[1]))))
 
     #
     #
-    def run(self, max_steps=None):
+    def run(self, max_steps=None, profiler=None, governor=None):
         """
-        run(max_steps=None): int
+        run(max_steps=None, profiler=None, governor=None): int
         
         Perform steps until 'halt' or 'max steps'        
         
+        If a profiler (tmprofile.TuringMachineProfiler) is given, every
+        executed step is counted on it
+        
+        If a governor (tmgovernor.TuringMachineGovernor) is given, its limits
+        are checked every governor.check_interval steps. When a limit is
+        exceeded the machine stops at a consistent point, so calling run
+        again resumes the execution
+        
+        If metrics are set (see setMetrics) they are sampled at the same
+        points, every metrics.sample_steps steps without a governor
+        
         Return values:
-            0 - Ends by halt state
-            1 - Ends by max steps limit
-            2 - Ends by unknown transition
+            0 - Ends by halt state (END_HALT)
+            1 - Ends by max steps limit (END_MAX_STEPS)
+            2 - Ends by unknown transition (END_UNKNOWN_TRANSITION)
+            3 - Ends by governor deadline (END_DEADLINE)
+            4 - Ends by governor tape cells limit (END_MAX_TAPE_CELLS)
+            5 - Ends by governor tape memory limit (END_MAX_TAPE_MEMORY)
+            6 - Ends by a breakpoint (END_BREAKPOINT)
+            7 - Ends before moving the head out of a bounded tape
+                (END_OUT_OF_BOUNDS)
         """
+        if governor is not None or self._metrics is not None:
+            return self._runGoverned(max_steps, profiler, governor)
+        return self._runSlice(max_steps, profiler)
+        
+    #
+    #
+    def _runSlice(self, max_steps, profiler):
+        """
+        Same as run without governor and metrics
+        """
+        if self._breakpoints:
+            if profiler is not None:
+                raise Exception('Breakpoints can not be used with a profiler')
+            return self._runBreakpoints(max_steps)
+            
+        if profiler is not None:
+            return self._runProfiled(max_steps, profiler)
+            
+        if self._bounded_tape and not self._observers:
+            return self._runBounded(max_steps)
+            
+        if self._engine is not None and not self._observers:
+            return self._engine(self, max_steps)
+            
         try:
             if max_steps:
                 try:
@@ -155,7 +290,300 @@ class TuringMachine:
                 
         except tmexceptions.UnknownTransitionException:
             return 2
+        except tmexceptions.OutOfBoundsException:
+            return TuringMachine.END_OUT_OF_BOUNDS
 
+    #
+    #
+    def _runGoverned(self, max_steps, profiler, governor):
+        """
+        Same as run but in slices of governor.check_interval steps, checking
+        the governor limits and sampling the metrics between slices. Without
+        governor the slices are of metrics.sample_steps steps
+        """
+        metrics = self._metrics
+        if governor is None:
+            deadline = max_cells = max_bytes = None
+            interval = metrics.sample_steps
+        else:
+            if governor.max_steps:
+                if max_steps:
+                    max_steps = min(max_steps, governor.max_steps)
+                else:
+                    max_steps = governor.max_steps
+                    
+            deadline = governor.getDeadline()
+            max_cells = governor.max_tape_cells
+            max_bytes = governor.max_tape_bytes
+            interval = governor.check_interval
+        nsteps = 0
+        
+        while True:
+            nslice = interval
+            if max_steps:
+                if nsteps >= max_steps:
+                    return TuringMachine.END_MAX_STEPS
+                nslice = min(nslice, max_steps - nsteps)
+                
+            prev_steps = self._nexecuted_steps
+            prev_changes = self._nstate_changes
+            end_cond = self._runSlice(nslice, profiler)
+            nsteps += self._nexecuted_steps - prev_steps
+            if metrics is not None:
+                metrics.sample(self, self._nexecuted_steps - prev_steps,
+                               self._nstate_changes - prev_changes)
+            
+            if end_cond != TuringMachine.END_MAX_STEPS:
+                return end_cond
+            if max_cells and len(self._tape) > max_cells:
+                return TuringMachine.END_MAX_TAPE_CELLS
+            if max_bytes and self.getTapeMemorySize() > max_bytes:
+                return TuringMachine.END_MAX_TAPE_MEMORY
+            if deadline is not None and time.time() >= deadline:
+                return TuringMachine.END_DEADLINE
+                
+    #
+    #
+    def _runBreakpoints(self, max_steps):
+        """
+        Same as run but stopping at the breakpoints. The breakpoints checked
+        before a step (transition and step) are ignored on the first step if
+        the previous run stopped at them
+        """
+        if self._tape is None:
+            raise tmexceptions.UnsetTapeException(
+                'Tape must be set before perform an step')
+                
+        bps = self._breakpoints
+        states = bps.get(TuringMachine.BREAK_STATE, ())
+        transitions = dict(((k[0], self.getSymbolCode(k[1])), k)
+                           for k in bps.get(TuringMachine.BREAK_TRANSITION,
+                                            ()))
+        cells = bps.get(TuringMachine.BREAK_CELL, ())
+        heads = bps.get(TuringMachine.BREAK_HEAD, ())
+        steps = bps.get(TuringMachine.BREAK_STEP, ())
+        
+        resumed = self._break_at == self._nexecuted_steps
+        self._break_at = None
+        
+        nsteps = 0
+        try:
+            while True:
+                if max_steps and nsteps == max_steps:
+                    return TuringMachine.END_MAX_STEPS
+                if self._cur_state == self._hstate:
+                    return TuringMachine.END_HALT
+                    
+                key = (self._cur_state, self._tape[self._head])
+                if not resumed:
+                    hit = None
+                    if self._nexecuted_steps in steps:
+                        hit = (TuringMachine.BREAK_STEP, self._nexecuted_steps)
+                    elif key in transitions:
+                        hit = (TuringMachine.BREAK_TRANSITION, transitions[key])
+                    if hit is not None:
+                        self._last_breakpoint = hit
+                        self._break_at = self._nexecuted_steps
+                        return TuringMachine.END_BREAKPOINT
+                resumed = False
+                
+                pos = self._head - self._origin
+                self.step()
+                nsteps += 1
+                
+                hit = None
+                if self._cur_state in states:
+                    hit = (TuringMachine.BREAK_STATE, self._cur_state)
+                elif pos in cells and \
+                     self._tape[pos + self._origin] != key[1]:
+                    hit = (TuringMachine.BREAK_CELL, pos)
+                elif (self._head - self._origin) in heads and \
+                     self._head - self._origin != pos:
+                    hit = (TuringMachine.BREAK_HEAD, self._head - self._origin)
+                if hit is not None:
+                    self._last_breakpoint = hit
+                    return TuringMachine.END_BREAKPOINT
+                    
+        except tmexceptions.UnknownTransitionException:
+            return TuringMachine.END_UNKNOWN_TRANSITION
+        except tmexceptions.OutOfBoundsException:
+            return TuringMachine.END_OUT_OF_BOUNDS
+            
+    #
+    #
+    def _runBounded(self, max_steps):
+        """
+        Same as run on a bounded tape without observers. The tape never
+        grows, an end marker appended during the run has no transitions so
+        the head leaving the tape by any side (the index -1 is the marker
+        too) stops the lookups
+        """
+        tape = self._tape
+        trans_function = self._bounded_trans
+        state = self._cur_state
+        head = self._head
+        
+        nsteps = 0
+        nchanges = 0
+        last = key = None
+        end_cond = TuringMachine.END_MAX_STEPS
+        
+        tape.append(self._marker_code)
+        try:
+            try:
+                for nsteps in (xrange(max_steps) if max_steps
+                               else itertools.count()):
+                    key = (state, tape[head])
+                    state, sym, delta = trans_function[key]
+                    tape[head] = sym
+                    head += delta
+                    if state != key[0]:
+                        nchanges += 1
+                    last = key
+                else:
+                    nsteps = max_steps
+            except KeyError:
+                if state == self._hstate:
+                    end_cond = TuringMachine.END_HALT
+                else:
+                    end_cond = TuringMachine.END_UNKNOWN_TRANSITION
+        finally:
+            tape.pop()
+            
+        # Undo the step that moved the head out of the tape
+        if head < 0 or head >= len(tape):
+            head -= trans_function[last][2]
+            tape[head] = last[1]
+            if state != last[0]:
+                nchanges -= 1
+            state = last[0]
+            nsteps -= 1
+            end_cond = TuringMachine.END_OUT_OF_BOUNDS
+            
+        self._cur_state = state
+        self._head = head
+        self._nexecuted_steps += nsteps
+        self._nstate_changes += nchanges
+        return end_cond
+            
+    #
+    #
+    def _runProfiled(self, max_steps, profiler):
+        """
+        Same as run but counting on the profiler the fired transitions and
+        the head visits.
+        
+        Head positions are relative to the first symbol given to setTape
+        """
+        if self._tape is None:
+            raise tmexceptions.UnsetTapeException(
+                'Tape must be set before perform an step')
+                
+        trans_index = profiler.trans_index
+        hits = profiler.hits
+        rshift = profiler.region_shift
+        right = profiler.right_regions
+        left = profiler.left_regions
+        trans_function = self._code_trans
+        blank = self._blank_code
+        
+        nsteps = 0
+        
+        try:
+            while True:
+                if max_steps and nsteps == max_steps:
+                    return 1
+                if self._cur_state == self._hstate:
+                    return 0
+                    
+                key = (self._cur_state, self._tape[self._head])
+                
+                if self._observers or self._bounded_tape:
+                    self.step()
+                else:
+                    # Same as step() without observers notification
+                    try:
+                        state, sym, movement = trans_function[key]
+                    except KeyError:
+                        raise tmexceptions.UnknownTransitionException(
+                            'There are no transition for %s' %
+                            str((key[0], self._decodeSymbol(key[1]))))
+                    self._tape[self._head] = sym
+                    self._cur_state = state
+                    if movement == TuringMachine.MOVE_LEFT:
+                        if self._head == 0:
+                            self._tape.insert(0, blank)
+                            self._origin += 1
+                        else:
+                            self._head -= 1
+                    elif movement == TuringMachine.MOVE_RIGHT:
+                        self._head += 1
+                        if self._head == len(self._tape):
+                            self._tape.append(blank)
+                    self._nexecuted_steps += 1
+                    if state != key[0]:
+                        self._nstate_changes += 1
+                    
+                nsteps += 1
+                hits[trans_index[key]] += 1
+                
+                region = (self._head - self._origin) >> rshift
+                if region >= 0:
+                    if region >= len(right):
+                        right.extend([0] * (region + 1 - len(right)))
+                    right[region] += 1
+                else:
+                    region = -region - 1
+                    if region >= len(left):
+                        left.extend([0] * (region + 1 - len(left)))
+                    left[region] += 1
+                    
+        except tmexceptions.UnknownTransitionException:
+            return 2
+        except tmexceptions.OutOfBoundsException:
+            return TuringMachine.END_OUT_OF_BOUNDS
+            
+    #
+    #
+    def decideHalting(self, sample_steps=1024, max_configurations=None):
+        """
+        decideHalting(sample_steps=1024, max_configurations=None): int
+        
+        Runs the machine on its bounded tape (see setTapeBound) until it
+        stops or repeats a configuration, which proves that it never halts.
+        Returns the run end condition (END_HALT, END_UNKNOWN_TRANSITION or
+        END_OUT_OF_BOUNDS), or END_LOOP if it never halts
+        
+        The configurations (state, head and tape) are recorded packed as
+        strings every sample_steps steps. The sampled configurations repeat
+        as well, so a loop is detected at most sample_steps times its length
+        after it starts. If max_configurations configurations are recorded
+        without a decision it returns END_MAX_STEPS
+        """
+        if not self._bounded_tape:
+            raise Exception('Halting can only be decided on a bounded tape')
+        if sample_steps <= 0:
+            raise Exception('Sample steps must be greater than 0')
+            
+        state_ids = dict((s, i) for i, s in enumerate(sorted(self._states)))
+        seen = set()
+        while True:
+            if self._array_type is None:
+                cells = str(self._tape)
+            else:
+                cells = self._tape.tostring()
+            config = struct.pack('<II', state_ids[self._cur_state],
+                                 self._head) + cells
+            if config in seen:
+                return TuringMachine.END_LOOP
+            if max_configurations and len(seen) >= max_configurations:
+                return TuringMachine.END_MAX_STEPS
+            seen.add(config)
+            
+            end_cond = self.run(sample_steps)
+            if end_cond != TuringMachine.END_MAX_STEPS:
+                return end_cond
+            
     #
     #
     def getCurrentState(self):
@@ -200,7 +628,7 @@ class TuringMachine:
         if pos < 0 or pos >= len(self._tape):
             return self._blank
             
-        return self._tape[pos]
+        return self._decodeSymbol(self._tape[pos])
         
     #
     #
@@ -219,16 +647,109 @@ class TuringMachine:
         """
         return self._head
         
+    #
+    #
+    def getTapeBounds(self):
+        """
+        Returns the (first, last) cell positions of the internal tape,
+        relative to the first symbol given to setTape. Every cell visited by
+        the head since setTape is between them
+        """
+        if self._tape is None:
+            return (0, -1)
+        return (-self._origin, len(self._tape) - self._origin - 1)
+        
     #
     #
     def getTapeIterator(self):
         """
-        Returns an iterator of the internal tape
+        Returns an iterator of the internal tape symbols
         """
-        if self._tape:
-            return iter(self._tape)
-        else:
+        if not self._tape:
             raise Exception('Tape must be set before try to get its iterator')
+            
+        return itertools.imap(self._code_syms.__getitem__, self._tape)
+        
+    #
+    #
+    def getTapeView(self):
+        """
+        Returns a memoryview of the internal compact tape, without copying it.
+        Every byte is the code of a symbol (see getSymbolCode), for one char
+        symbols the view holds the tape text
+        
+        Raises an Exception if the tape is not compact
+        """
+        if not self._tape:
+            raise Exception('Tape must be set before try to get its view')
+        if self._array_type is not None:
+            raise Exception('Tape is not compact')
+        return memoryview(self._tape)
+        
+    #
+    #
+    def getSymbolCode(self, symbol):
+        """
+        Returns the integer code that represents symbol in the internal tape
+        
+        Raises an InvalidSymbolException if symbol is not in the tape alphabet
+        """
+        if symbol not in self._tape_alphabet:
+            raise tmexceptions.InvalidSymbolException(
+                'Invalid tape symbol %s' % str(symbol))
+        return self._sym_codes[symbol]
+        
+    #
+    #
+    def getTapeMemorySize(self):
+        """
+        Returns the amount of bytes used by the internal tape representation
+        """
+        if self._tape is None:
+            return 0
+        return sys.getsizeof(self._tape)
+        
+    #
+    #
+    def getFingerprint(self):
+        """
+        Returns an hexadecimal SHA-1 of the machine definition (states,
+        alphabets, transition function, initial, final and halt states and
+        blank symbol). Equal machines have equal fingerprints
+        """
+        if self._fingerprint is None:
+            definition = (sorted(self._states), sorted(self._in_alphabet),
+                          sorted(self._tape_alphabet),
+                          sorted(self._trans_function.iteritems()),
+                          self._istate, sorted(self._fstates), self._hstate,
+                          self._blank)
+            self._fingerprint = hashlib.sha1(repr(definition)).hexdigest()
+        return self._fingerprint
+        
+    #
+    #
+    def getInputAlphabet(self):
+        """
+        Returns the input alphabet
+        """
+        return self._in_alphabet
+        
+    #
+    #
+    def getTapeAlphabet(self):
+        """
+        Returns the tape alphabet
+        """
+        return self._tape_alphabet
+        
+    #
+    #
+    def getTransitionFunction(self):
+        """
+        Returns a copy of the transition function dictionary
+            (state, symbol) : (state, symbol, movement)
+        """
+        return copy.copy(self._trans_function)
         
     #
     #
@@ -239,6 +760,16 @@ class TuringMachine:
         """
         return self._nexecuted_steps
         
+    #
+    #
+    def getStateChangesCounter(self):
+        """
+        Return the amount of executed steps that entered a state different
+        from the one they left. The words decided by an automaton (see
+        setAutomaton) add their steps but not their state changes
+        """
+        return self._nstate_changes
+        
     #
     #
     def isAtHaltState(self):
@@ -261,37 +792,120 @@ class TuringMachine:
         """
         Returns true only if tape is set        
         """
-        return self._tape != None
+        return self._tape is not None
 
     #
     #
-    def isWordAccepted(self, word, max_steps=None):
+    def isTapeCompact(self):
+        """
+        Returns true if the tape is stored as a bytearray of symbol codes
+        """
+        return self._array_type is None
+        
+    #
+    #
+    def hasMultiCharSymbols(self):
+        """
+        Returns True if some tape symbol is a string of more than one char.
+        The words of these machines are written with the symbols separated
+        by whitespace
+        """
+        return self._split_words
+
+    #
+    #
+    def isWordAccepted(self, word, max_steps=None, governor=None):
         """
         Return values are:
             True - Ends by halt state or undefined transition at a final state
             False - Ends by halt state or undefined transition at a non final state
-            None - Ends by max_steps
-        """
-        
-        old_tape = self._tape
-        old_state = self._cur_state
-        old_head = self._head
+            None - Ends by max_steps or by any of the governor limits
+            
+        Breakpoints are ignored, the word always runs until it is decided
+        or a limit is reached
+            
+        If there is a result cache (see setResultCache) the known results
+        are returned without running the machine. Results are only cached
+        when the machine is at its initial state
         
-        self.setTape(word)
-        end_cond = self.run(max_steps)
-        self._tape = old_tape
+        If there is an automaton (see setAutomaton) it decides the word
+        instead of running the machine, unless there is a governor or
+        anything watching the steps (observers or metrics)
+        """
+        cache = self._result_cache
+        if self._cur_state != self._istate or self._bound is not None:
+            cache = None
+        if cache is not None:
+            limit = max_steps
+            if governor is not None and governor.max_steps:
+                limit = min(limit or governor.max_steps, governor.max_steps)
+            found, accepted = cache.lookup(self, word, limit)
+            if found:
+                return accepted
+            prev_steps = self._nexecuted_steps
+            
+        if self._automaton is not None and governor is None and \
+           not self._observers and \
+           self._metrics is None and self._bound is None:
+            accepted, steps = self._automaton.run(word, max_steps,
+                                                  self._cur_state)
+            self._nexecuted_steps += steps
+            # Without limit a loop returns None with 0 steps
+            if cache is not None and (accepted is not None or max_steps):
+                cache.store(self, word, accepted, steps)
+            return accepted
         
-        if end_cond == 0 or end_cond == 2:        
-            accepted = self.isAtFinalState()
-        else:
-            accepted = None
+        saved = self._enterWord(word)
+        try:
+            end_cond = self.run(max_steps, None, governor)
+            accepted = self._wordResult(end_cond)
+        finally:
+            self._leaveWord(saved)
         
-        self._tape = old_tape
-        self._cur_state = old_state
-        self._head = old_head
+        # Undecided by time or tape limits are not deterministic
+        if cache is not None and (accepted is not None or end_cond == 1):
+            cache.store(self, word, accepted, self._nexecuted_steps - prev_steps)
         
         return accepted
 
+    #
+    #
+    def _enterWord(self, word):
+        """
+        Sets word on the tape to decide it, as isWordAccepted does, with the
+        breakpoints disabled. Returns the previous execution context, to be
+        restored with _leaveWord
+        """
+        saved = (self._tape, self._cur_state, self._head, self._origin,
+                 self._bounded_tape, self._breakpoints)
+        self._breakpoints = {}
+        try:
+            self.setTape(word)
+        except:
+            self._leaveWord(saved)
+            raise
+        return saved
+        
+    #
+    #
+    def _wordResult(self, end_cond):
+        """
+        Returns the isWordAccepted result of a run ended by end_cond
+        """
+        if end_cond == TuringMachine.END_HALT or \
+           end_cond == TuringMachine.END_UNKNOWN_TRANSITION:
+            return self.isAtFinalState()
+        return None
+        
+    #
+    #
+    def _leaveWord(self, saved):
+        """
+        Restores the execution context returned by _enterWord
+        """
+        (self._tape, self._cur_state, self._head, self._origin,
+         self._bounded_tape, self._breakpoints) = saved
+        
     #
     #
     def setTape(self, tape, head_pos=0):
@@ -309,28 +923,320 @@ class TuringMachine:
             Does not reset the executed steps counter
         """
         
-        for s in tape:
-            if s not in self._tape_alphabet:
-                raise tmexceptions.InvalidSymbolException(
-                    'Invalid tape symbol %s' % str(s))
+        self._placeTape(self._encodeTape(tape), head_pos)
+        
+    #
+    #
+    def setTapeFromBuffer(self, buf, head_pos=0):
+        """
+        setTapeFromBuffer(buf, head_pos:int)
+        Same as setTape for a buffer of one char symbols (str, bytearray,
+        mmap, memoryview...). The buffer is copied once into the internal
+        tape and validated in one pass
+        
+        The tape alphabet symbols must be one char strings
+        
+        If buf contains an invalid symbol raises an InvalidSymbolException
+        """
+        self._checkTextTape()
+        cells = bytearray(buf)
+        self._checkTextCells(cells)
+        self._placeTape(cells, head_pos)
+        
+    #
+    #
+    def loadTape(self, fname, head_pos=0):
+        """
+        loadTape(fname:str, head_pos:int)
+        Same as setTape with the content of the given file, one char per
+        symbol. The file is read directly into the internal tape. A trailing
+        end of line is ignored if it's not a tape symbol
+        
+        The tape alphabet symbols must be one char strings
+        
+        If the file contains an invalid symbol raises an 
+        InvalidSymbolException
+        """
+        self._checkTextTape()
+        
+        f = io.open(fname, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            # Blanks before the head are allocated with the tape
+            npad = max(0, -head_pos)
+            cells = bytearray((self._blank_code,)) * npad + bytearray(size)
+            nread = f.readinto(memoryview(cells)[npad:])
+            if nread != size:
+                del cells[npad + nread:]
+        finally:
+            f.close()
+            
+        for eol in ('\n', '\r'):
+            if cells[-1:] == eol and eol not in self._text_alphabet:
+                del cells[-1]
+        
+        self._checkTextCells(cells)
+        self._placeTape(cells, head_pos, npad > 0)
+        
+    #
+    #
+    def saveTape(self, fname):
+        """
+        saveTape(fname:str): int
+        Writes the tape from the first to the last non blank symbol to the
+        given file, one char per symbol, without copying it. Returns the
+        amount of written symbols
+        
+        The tape alphabet symbols must be one char strings
+        """
+        if self._tape is None:
+            raise tmexceptions.UnsetTapeException(
+                'Tape must be set before save it')
+        self._checkTextTape()
+        
+        lo, hi = self._nonBlankBounds()
+        f = io.open(fname, 'wb')
+        try:
+            f.write(memoryview(self._tape)[lo:hi])
+        finally:
+            f.close()
+        return hi - lo
+        
+    #
+    #
+    def detachTape(self):
+        """
+        detachTape(): bytearray or array
+        Returns the internal tape from the first to the last non blank
+        symbol, as symbol codes (see getSymbolCode), and leaves the machine
+        without tape. The blanks are removed in place, the tape is not
+        copied
+        
+        The cells can be given to setTapeCells of a machine with the same
+        symbol codes
+        """
+        if self._tape is None:
+            raise tmexceptions.UnsetTapeException(
+                'Tape must be set before detach it')
+                
+        lo, hi = self._nonBlankBounds()
+        cells = self._tape
+        self._tape = None
+        self._bounded_tape = False
+        del cells[hi:]
+        del cells[:lo]
+        return cells
         
+    #
+    #
+    def setTapeCells(self, cells, head_pos=0):
+        """
+        setTapeCells(cells, head_pos:int)
+        Same as setTape for cells of symbol codes of this machine (see
+        getSymbolCode), as returned by detachTape: a bytearray if the tape is
+        compact, otherwise an array of the same type. The cells become the
+        internal tape, they are not copied nor validated
+        """
+        if self._array_type is None:
+            valid = isinstance(cells, bytearray)
+        else:
+            valid = isinstance(cells, array.array) and \
+                    cells.typecode == self._array_type
+        if not valid:
+            raise Exception('Cells do not match the internal tape type')
+        self._placeTape(cells, head_pos)
+        
+    #
+    #
+    def _placeTape(self, cells, head_pos, padded=False):
+        """
+        Set cells as the internal tape with the head at head_pos. If head pos
+        is out of the tape it grows with blanks. If padded is True the blanks
+        before a negative head_pos are already at the start of cells
+        
+        With a bound the tape grows with blanks up to the bound
+        """
+        self._bounded_tape = self._bound is not None
+        if self._bounded_tape:
+            if head_pos < 0 or head_pos >= self._bound or \
+               len(cells) > self._bound:
+                raise Exception('The tape does not fit in the bound of %d '
+                                'cells' % self._bound)
+            cells.extend(self._blankCells(self._bound - len(cells)))
+            self._tape = cells
+            self._head = head_pos
+            self._origin = 0
+            
         # If head pos is out of tape make tape grow with blanks 
-        if head_pos < 0:
-            self._tape = [self._blank] * (-head_pos)
-            self._tape.extend(tape)
+        elif head_pos < 0:
+            if padded:
+                self._tape = cells
+            else:
+                self._tape = self._blankCells(-head_pos)
+                self._tape.extend(cells)
             self._head = 0
-        elif head_pos >= len(tape):
-            self._tape = list(tape)
-            if not self._tape: self._tape = [self._blank] # Empty tape
-            self._tape.extend( [self._blank] * (head_pos - len(tape)) )
+            self._origin = -head_pos
+        elif head_pos >= len(cells):
+            self._tape = cells
+            self._tape.extend(self._blankCells(head_pos + 1 - len(cells)))
             self._head = head_pos
+            self._origin = 0
         else:
-            self._tape = list(tape)
+            self._tape = cells
             self._head = head_pos
+            self._origin = 0
             
         for obs in self._observers:
             obs.onTapeChanged(head_pos)
 
+    #
+    #
+    def setEngine(self, engine):
+        """
+        setEngine(engine)
+        Set an alternative execution engine for run and isWordAccepted, or
+        None to use step() again
+        
+        engine(tm, max_steps) must behave as run(max_steps) and return the same
+        values. It's not used while there are observers attached or when
+        running with a profiler (see tmcompiler and tmoptimize)
+        """
+        self._engine = engine
+        
+    #
+    #
+    def addBreakpoint(self, kind, value):
+        """
+        addBreakpoint(kind, value)
+        Adds a breakpoint, run() stops with END_BREAKPOINT:
+            - BREAK_STATE, state: after a step entering state
+            - BREAK_TRANSITION, (state, symbol): before firing the transition
+            - BREAK_CELL, pos: after a step changing the symbol of the cell
+            - BREAK_HEAD, pos: after a step moving the head to the cell
+            - BREAK_STEP, n: before executing a step when the executed steps
+              counter is n
+        Cell positions are relative to the first symbol given to setTape.
+        Breakpoints are checked by run(), not by step()
+        
+        Raises an Exception if the breakpoint is not valid for this machine
+        """
+        if kind not in TuringMachine.BREAKPOINT_KINDS:
+            raise Exception('Invalid breakpoint kind %s' % str(kind))
+        if kind == TuringMachine.BREAK_STATE and value not in self._states:
+            raise Exception('Invalid state %s' % str(value))
+        if kind == TuringMachine.BREAK_TRANSITION and \
+           value not in self._trans_function:
+            raise Exception('There are no transition for %s' % str(value))
+        if kind in (TuringMachine.BREAK_CELL, TuringMachine.BREAK_HEAD,
+                    TuringMachine.BREAK_STEP) and \
+           not isinstance(value, (int, long)):
+            raise Exception('Breakpoint position must be an integer')
+            
+        self._breakpoints.setdefault(kind, set()).add(value)
+        
+    #
+    #
+    def removeBreakpoint(self, kind, value):
+        """
+        Removes the given breakpoint if it exists
+        """
+        values = self._breakpoints.get(kind)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del self._breakpoints[kind]
+                
+    #
+    #
+    def clearBreakpoints(self):
+        """
+        Removes all the breakpoints
+        """
+        self._breakpoints = {}
+        
+    #
+    #
+    def getBreakpoints(self):
+        """
+        Returns the list of (kind, value) breakpoints
+        """
+        return [(kind, v) for kind, values in self._breakpoints.iteritems()
+                for v in values]
+                
+    #
+    #
+    def getLastBreakpoint(self):
+        """
+        Returns the (kind, value) breakpoint of the last run ended by
+        END_BREAKPOINT. For BREAK_CELL and BREAK_HEAD the value is the
+        position
+        """
+        return self._last_breakpoint
+        
+    #
+    #
+    def setResultCache(self, cache):
+        """
+        setResultCache(cache)
+        Set the cache (tmcache.TuringMachineResultCache) of isWordAccepted
+        results, or None to disable it
+        
+        Observers are not notified of the steps of cached results
+        """
+        self._result_cache = cache
+        
+    #
+    #
+    def setMetrics(self, metrics):
+        """
+        setMetrics(metrics)
+        Set the runtime metrics (tmmetrics.TuringMachineMetrics) sampled by
+        run, or None to disable them
+        """
+        self._metrics = metrics
+        
+    #
+    #
+    def setAutomaton(self, automaton):
+        """
+        setAutomaton(automaton)
+        Set the finite automaton (tmdfa.FiniteAutomaton) equivalent to this
+        machine used by isWordAccepted, or None to disable it
+        """
+        if automaton is not None and \
+           automaton.fingerprint != self.getFingerprint():
+            raise Exception('Automaton belongs to another machine')
+        self._automaton = automaton
+        
+    #
+    #
+    def setTapeBound(self, ncells):
+        """
+        setTapeBound(ncells)
+        Enables the bounded tape mode (linear bounded automaton) for the
+        tapes set after this call, or disables it if ncells is None
+        
+        A bounded tape is preallocated to ncells cells from the first input
+        symbol and never grows. The step that would move the head out of it
+        is not executed: step raises an OutOfBoundsException and run returns
+        END_OUT_OF_BOUNDS. The compiled engine is not used and the results
+        cache is ignored on bounded tapes
+        """
+        if ncells is not None:
+            if ncells <= 0:
+                raise Exception('Tape bound must be greater than 0')
+            if self._bounded_trans is None:
+                self._initBoundedTrans()
+        self._bound = ncells
+        
+    #
+    #
+    def getTapeBound(self):
+        """
+        Returns the cells of the bounded tape mode, None if it's disabled
+        """
+        return self._bound
+        
     #
     #
     def setAtInitialState(self):
@@ -409,15 +1315,209 @@ class TuringMachine:
     #
     def resetExecutedStepsCounter(self):
         """
-        Set the executed steps counter to 0
+        Set the executed steps and state changes counters to 0
         """
         self._nexecuted_steps = 0
+        self._nstate_changes = 0
 
     #
     #
-    def _checkData(self):
+    def _initTapeCodes(self):
+        """
+        Selects the internal tape representation and the symbol codes:
+            _sym_codes: symbol -> code
+            _code_syms: code -> symbol
+            _blank_code: code of the blank symbol
+            _array_type: array typecode of the tape, None if it's compact
+        """
+        self._text_alphabet = None
+        self._array_type = None
+        self._split_words = any(isinstance(s, basestring) and len(s) > 1
+                                for s in self._tape_alphabet)
+        
+        nsymbols = len(self._tape_alphabet)
+        if nsymbols > TuringMachine.MAX_COMPACT_SYMBOLS:
+            if nsymbols > TuringMachine.MAX_SHORT_SYMBOLS:
+                self._array_type = 'I'
+            else:
+                self._array_type = 'H'
+            
+        if self._array_type is None and \
+           all(isinstance(s, str) and len(s) == 1 
+               for s in self._tape_alphabet):
+            codes = dict((s, ord(s)) for s in self._tape_alphabet)
+            self._text_alphabet = ''.join(sorted(self._tape_alphabet))
+        else:
+            codes = dict((s, i) 
+                         for i, s in enumerate(sorted(self._tape_alphabet)))
+                         
+        self._sym_codes = codes
+        self._code_syms = [None] * max(nsymbols,
+                                       TuringMachine.MAX_COMPACT_SYMBOLS)
+        for s, c in codes.iteritems():
+            self._code_syms[c] = s
+        self._blank_code = codes[self._blank]
+        
+    #
+    #
+    def _initCodeTrans(self):
+        """
+        Translates the transition function to symbol codes:
+            _code_trans: (state, code) : (state, code, movement)
+        """
+        codes = self._sym_codes
+        self._code_trans = dict(((k[0], codes[k[1]]), (v[0], codes[v[1]], v[2]))
+                                for k, v in self._trans_function.iteritems())
+        
+    #
+    #
+    def _initBoundedTrans(self):
+        """
+        Selects the code of the end marker of the bounded tapes, the first
+        one not used by a symbol, and translates the movements of the
+        transition function to head deltas:
+            _bounded_trans: (state, code) : (state, code, delta)
+        The transitions from the halt state are removed
+        """
+        if self._array_type is None:
+            ncodes = TuringMachine.MAX_COMPACT_SYMBOLS
+        else:
+            ncodes = 1 << (8 * self._blankCells(0).itemsize)
+        used = set(self._sym_codes.itervalues())
+        for code in xrange(ncodes):
+            if code not in used:
+                break
+        else:
+            raise Exception('There is no free code for the tape end marker')
+        self._marker_code = code
+        
+        deltas = {TuringMachine.MOVE_LEFT: -1, TuringMachine.MOVE_RIGHT: 1,
+                  TuringMachine.NON_MOVEMENT: 0}
+        self._bounded_trans = dict((k, (v[0], v[1], deltas[v[2]]))
+                                   for k, v in self._code_trans.iteritems()
+                                   if k[0] != self._hstate)
+        
+    #
+    #
+    def _outOfBounds(self, cur):
+        """
+        Undoes the write and state change of the step from cur (state, code)
+        and raises an OutOfBoundsException
+        """
+        self._tape[self._head] = cur[1]
+        self._cur_state = cur[0]
+        raise tmexceptions.OutOfBoundsException(
+            'Head out of the bounded tape of %d cells' % len(self._tape))
+        
+    #
+    #
+    def _decodeSymbol(self, code):
+        """
+        Returns the symbol represented by code in the internal tape
+        """
+        return self._code_syms[code]
+        
+    #
+    #
+    def _blankCells(self, n):
+        """
+        Returns n blank cells of the internal tape type
+        """
+        if self._array_type is not None:
+            return array.array(self._array_type, (self._blank_code,)) * n
+        return bytearray((self._blank_code,)) * n
+        
+    #
+    #
+    def _encodeTape(self, tape):
+        """
+        Returns a new internal tape with the given symbols
+        
+        If tape contains an invalid symbol raises an InvalidSymbolException
+        """
+        if self._split_words and isinstance(tape, basestring):
+            tape = tape.split()
+            
+        # One char symbols, the text is the tape
+        if self._text_alphabet is not None and isinstance(tape, basestring):
+            if isinstance(tape, unicode):
+                try:
+                    tape = tape.encode('ascii')
+                except UnicodeEncodeError as e:
+                    raise tmexceptions.InvalidSymbolException(
+                        'Invalid tape symbol %s' %
+                        tape[e.start].encode('utf-8'))
+            invalid = tape.translate(None, self._text_alphabet)
+            if invalid:
+                raise tmexceptions.InvalidSymbolException(
+                    'Invalid tape symbol %s' % invalid[0])
+            return bytearray(tape)
+            
+        try:
+            codes = self._sym_codes
+            if self._array_type is not None:
+                return array.array(self._array_type, [codes[s] for s in tape])
+            return bytearray([codes[s] for s in tape])
+        except KeyError as e:
+            symbol = e.args[0]
+            if isinstance(symbol, unicode):
+                symbol = symbol.encode('utf-8')
+            raise tmexceptions.InvalidSymbolException(
+                'Invalid tape symbol %s' % str(symbol))
+        
+    #
+    #
+    def _checkTextTape(self):
+        """
+        Raises an Exception if the tape symbols are not one char strings
+        """
+        if self._text_alphabet is None:
+            raise Exception('Tape alphabet symbols must be one char strings')
+            
+    #
+    #
+    def _checkTextCells(self, cells):
         """
-        Checks if the given information is correct
+        Raises an InvalidSymbolException if the bytearray cells contains a
+        char out of the tape alphabet
+        """
+        invalid = cells.translate(None, self._text_alphabet)
+        if invalid:
+            raise tmexceptions.InvalidSymbolException(
+                'Invalid tape symbol %s' % chr(invalid[0]))
+                
+    #
+    #
+    def _nonBlankBounds(self):
+        """
+        Returns (lo, hi), the internal tape slice from the first to the last
+        non blank symbol
+        """
+        tape = self._tape
+        blank = self._blank_code
+        lo, hi = 0, len(tape)
+        
+        # Skip blocks of blanks at C speed
+        n = TuringMachine.BLANK_BLOCK_SIZE
+        if hi - lo >= n:
+            block = self._blankCells(n)
+            while hi - lo >= n and tape[lo:lo + n] == block:
+                lo += n
+            while hi - lo >= n and tape[hi - n:hi] == block:
+                hi -= n
+                
+        while lo < hi and tape[lo] == blank:
+            lo += 1
+        while hi > lo and tape[hi - 1] == blank:
+            hi -= 1
+        return lo, hi
+        
+    #
+    #
+    def _checkData(self, check_transitions=True):
+        """
+        Checks if the given information is correct, 5 to 7 only if
+        check_transitions is True
             1- Input alphabet is subset of tape alphabet
             2- Blank symbol is into the tape alphabet
             3- Initial state is in states
@@ -446,6 +1546,9 @@ class TuringMachine:
         if not self._fstates.issubset(self._states):
             raise Exception('Final states are not a subset of states')
 
+        if not check_transitions:
+            return
+
         for k, v in self._trans_function.iteritems():
             if len(k) != 2 or len(v) != 3: 
                 raise Exception('Invalid format in transition %s -> %s' %
@@ -575,3 +1678,102 @@ if __name__ == '__main__':
     for i in tm.getTapeIterator():
         print i,
     print
+
+    print '\nBulk tape loading and saving'
+    import tempfile
+    flip = TuringMachine(set(['q', hstate]), set('ab'), set('ab_'),
+                         {('q', 'a'): ('q', 'b', TuringMachine.MOVE_RIGHT),
+                          ('q', 'b'): ('q', 'a', TuringMachine.MOVE_RIGHT),
+                          ('q', '_'): (hstate, '_', TuringMachine.NON_MOVEMENT)},
+                         'q', set([hstate]), hstate, '_')
+    fd, fname = tempfile.mkstemp()
+    os.write(fd, 'ab' * 500000 + '\n')
+    os.close(fd)
+    try:
+        flip.loadTape(fname)
+        print 'Loaded cells:', flip.getInternalTapeSize(), \
+            'Compact:', flip.isTapeCompact()
+        flip.run()
+        print 'Saved symbols:', flip.saveTape(fname)
+        print 'Saved tape starts with:', open(fname).read(6)
+        os.remove(fname)
+        fd, fname = tempfile.mkstemp()
+        os.write(fd, 'abxa')
+        os.close(fd)
+        flip.loadTape(fname)
+    except tmexceptions.InvalidSymbolException as e:
+        print 'Error', e
+    finally:
+        os.remove(fname)
+
+    print '\nUnicode words'
+    flip.setTape(u'abba')
+    flip.setAtInitialState()
+    flip.run()
+    print u'abba ->', ''.join(flip.getTapeIterator())
+    words = TuringMachine(set(['q', hstate]), set(['zero', 'one']),
+                          set(['zero', 'one', '_']),
+                          {('q', 'zero'): ('q', 'one', TuringMachine.MOVE_RIGHT),
+                           ('q', 'one'): ('q', 'zero', TuringMachine.MOVE_RIGHT),
+                           ('q', '_'): (hstate, '_', TuringMachine.NON_MOVEMENT)},
+                          'q', set([hstate]), hstate, '_')
+    print u'zero one one accepted?', words.isWordAccepted(u'zero one one')
+    for word in (u'ab\xe9', u'zero \xe9'):
+        try:
+            (flip if word.startswith('a') else words).setTape(word)
+        except tmexceptions.InvalidSymbolException as e:
+            print 'Error', e
+
+    print '\nBreakpoints'
+    inc = TuringMachine(set(['a', 'c', hstate]), set('01'), set('01#'),
+                        {('a', '0'): ('a', '0', TuringMachine.MOVE_RIGHT),
+                         ('a', '1'): ('a', '1', TuringMachine.MOVE_RIGHT),
+                         ('a', '#'): ('c', '#', TuringMachine.MOVE_LEFT),
+                         ('c', '1'): ('c', '0', TuringMachine.MOVE_LEFT),
+                         ('c', '0'): (hstate, '1', TuringMachine.NON_MOVEMENT),
+                         ('c', '#'): (hstate, '1', TuringMachine.NON_MOVEMENT)},
+                        'a', set([hstate]), hstate, '#')
+    inc.setTape('1011')
+    inc.addBreakpoint(TuringMachine.BREAK_STATE, 'c')
+    inc.addBreakpoint(TuringMachine.BREAK_TRANSITION, ('c', '1'))
+    inc.addBreakpoint(TuringMachine.BREAK_CELL, 1)
+    inc.addBreakpoint(TuringMachine.BREAK_HEAD, 4)
+    inc.addBreakpoint(TuringMachine.BREAK_STEP, 2)
+    while True:
+        end_cond = inc.run()
+        if end_cond != TuringMachine.END_BREAKPOINT:
+            break
+        print 'Breakpoint %s at step %d, tape %s' % \
+            (inc.getLastBreakpoint(), inc.getExecutedStepsCounter(),
+             ''.join(inc.getTapeIterator()))
+    print 'Run status code:', end_cond, 'Tape:', ''.join(inc.getTapeIterator())
+    print 'Is word 1011 accepted with breakpoints?', inc.isWordAccepted('1011')
+
+    print '\nBounded tape'
+    inc.clearBreakpoints()
+    inc.setTapeBound(5)
+    for word in ('1011', '1111', '11111'):
+        inc.setAtInitialState()
+        try:
+            inc.setTape(word)
+        except Exception as e:
+            print 'Error', e
+            continue
+        print word, 'Run status code:', inc.run(), \
+            'Tape:', ''.join(inc.getTapeIterator())
+            
+    # Moves between the ends of the word until it rewrites a '1'
+    bounce = TuringMachine(set(['r', 'l', hstate]), set('01'), set('01#'),
+                           {('r', '0'): ('r', '0', TuringMachine.MOVE_RIGHT),
+                            ('r', '#'): ('l', '#', TuringMachine.MOVE_LEFT),
+                            ('l', '0'): ('l', '0', TuringMachine.MOVE_LEFT),
+                            ('l', '#'): ('r', '#', TuringMachine.MOVE_RIGHT),
+                            ('r', '1'): (hstate, '1', TuringMachine.NON_MOVEMENT)},
+                           'r', set([hstate]), hstate, '#')
+    bounce.setTapeBound(1002)
+    for word in ('#' + '0' * 1000 + '#', '#' + '0' * 999 + '1#'):
+        bounce.setTape(word, 1)
+        bounce.setAtInitialState()
+        print 'Decided:', bounce.decideHalting(), \
+            'after', bounce.getExecutedStepsCounter(), 'steps'
+        bounce.resetExecutedStepsCounter()
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import time
+import collections
+
+from tm import TuringMachine
+from tmgovernor import TuringMachineGovernor
+
+#
+# Cooperative execution of Turing machines
+#
+# runAsync and isWordAcceptedAsync are generator based coroutines: every
+# resume executes one slice of steps and yields a Progress. The slice size is
+# adapted so every slice takes about target_latency seconds, letting any event
+# loop (the Scheduler below, a Qt timer, ...) interleave many machines fairly.
+#
+# Closing the generator (gen.close()) cancels the execution, the machine is
+# left in a consistent state at the end of the last executed slice.
+#
+
+DEF_TARGET_LATENCY = 0.005
+MIN_SLICE = 16
+MAX_SLICE = 1 << 20
+
+#
+#
+class Progress:
+    """
+    Yielded by the coroutines after every slice
+        - steps: steps executed since the coroutine started
+        - slice_steps: size of the next slice
+        - elapsed: wall time since the coroutine started
+        - done: True on the last yielded Progress
+        - end_cond: run() return value, only if done
+        - result: isWordAccepted return value, only if done and the
+                  coroutine is isWordAcceptedAsync
+    """
+
+    #
+    #
+    def __init__(self, steps, slice_steps, elapsed, end_cond=None,
+                 result=None):
+        self.steps = steps
+        self.slice_steps = slice_steps
+        self.elapsed = elapsed
+        self.done = end_cond is not None
+        self.end_cond = end_cond
+        self.result = result
+
+    #
+    #
+    def __str__(self):
+        return 'steps=%d slice=%d elapsed=%.4f done=%s end_cond=%s' % \
+                (self.steps, self.slice_steps, self.elapsed, self.done,
+                 self.end_cond)
+
+#
+#
+def runAsync(tm, max_steps=None, governor=None,
+             target_latency=DEF_TARGET_LATENCY):
+    """
+    runAsync(tm, max_steps=None, governor=None,
+             target_latency=DEF_TARGET_LATENCY): generator
+
+    Cooperative version of tm.run(max_steps, None, governor). The governor
+    timeout and deadline apply to the whole execution, not to every slice
+    """
+    # The deadline is computed once so it does not restart on every slice
+    if governor is not None:
+        slice_governor = TuringMachineGovernor(
+                            deadline=governor.getDeadline(),
+                            max_tape_cells=governor.max_tape_cells,
+                            max_tape_bytes=governor.max_tape_bytes,
+                            check_interval=governor.check_interval)
+        if governor.max_steps:
+            max_steps = min(max_steps or governor.max_steps,
+                            governor.max_steps)
+    else:
+        slice_governor = None
+
+    start = time.time()
+    nsteps = 0
+    nslice = MIN_SLICE
+
+    while True:
+        if max_steps:
+            if nsteps >= max_steps:
+                end_cond = TuringMachine.END_MAX_STEPS
+                break
+            cur_slice = min(nslice, max_steps - nsteps)
+        else:
+            cur_slice = nslice
+
+        prev_steps = tm.getExecutedStepsCounter()
+        slice_start = time.time()
+        end_cond = tm.run(cur_slice, None, slice_governor)
+        slice_time = time.time() - slice_start
+        nsteps += tm.getExecutedStepsCounter() - prev_steps
+
+        if end_cond != TuringMachine.END_MAX_STEPS:
+            break
+
+        nslice = _adaptSlice(nslice, slice_time, target_latency)
+        yield Progress(nsteps, nslice, time.time() - start)
+
+    yield Progress(nsteps, nslice, time.time() - start, end_cond)
+
+#
+#
+def isWordAcceptedAsync(tm, word, max_steps=None, governor=None,
+                        target_latency=DEF_TARGET_LATENCY):
+    """
+    isWordAcceptedAsync(tm, word, max_steps=None, governor=None,
+                        target_latency=DEF_TARGET_LATENCY): generator
+
+    Cooperative version of tm.isWordAccepted, running the word from the
+    current state with the breakpoints disabled. The result is on the last
+    yielded Progress. The previous tape, state and head position are restored
+    when the coroutine ends, even if it's cancelled
+
+    The machine must not be used by others while the coroutine is alive
+    """
+    saved = tm._enterWord(word)
+    try:
+        for progress in runAsync(tm, max_steps, governor, target_latency):
+            if progress.done:
+                break
+            yield progress
+
+        progress.result = tm._wordResult(progress.end_cond)
+    finally:
+        tm._leaveWord(saved)
+
+    yield progress
+
+#
+#
+def _adaptSlice(nslice, slice_time, target_latency):
+    """
+    Returns the size of the next slice so it takes about target_latency.
+    The size changes at most by a factor of 2 on each call
+    """
+    if slice_time <= 0:
+        new_slice = nslice * 2
+    else:
+        new_slice = int(nslice * target_latency / slice_time)
+        new_slice = max(nslice // 2, min(nslice * 2, new_slice))
+    return max(MIN_SLICE, min(MAX_SLICE, new_slice))
+
+
+#
+#
+class Scheduler:
+    """
+    Round robin driver for many coroutines. Every coroutine executes one
+    slice per round, so all of them progress at the same pace
+    """
+
+    #
+    #
+    def __init__(self):
+        self._tasks = collections.deque()
+
+    #
+    #
+    def spawn(self, coroutine, on_progress=None, on_done=None):
+        """
+        Adds a coroutine. on_progress(progress) is called after every slice
+        and on_done(progress) with the last Progress
+        """
+        self._tasks.append((coroutine, on_progress, on_done))
+
+    #
+    #
+    def cancel(self, coroutine):
+        """
+        Cancels the given coroutine. Returns True if it was found
+        """
+        for task in self._tasks:
+            if task[0] is coroutine:
+                self._tasks.remove(task)
+                coroutine.close()
+                return True
+        return False
+
+    #
+    #
+    def getPendingCount(self):
+        """
+        Returns the amount of coroutines not finished yet
+        """
+        return len(self._tasks)
+
+    #
+    #
+    def runOnce(self):
+        """
+        Executes one slice of every pending coroutine. Returns the amount of
+        pending coroutines
+        """
+        for i in xrange(len(self._tasks)):
+            coroutine, on_progress, on_done = self._tasks.popleft()
+            try:
+                progress = next(coroutine)
+            except StopIteration:
+                continue
+
+            if progress.done:
+                coroutine.close()
+                if on_done:
+                    on_done(progress)
+            else:
+                if on_progress:
+                    on_progress(progress)
+                self._tasks.append((coroutine, on_progress, on_done))
+
+        return len(self._tasks)
+
+    #
+    #
+    def run(self):
+        """
+        Executes all the coroutines until they end
+        """
+        while self.runOnce():
+            pass
+
+
+#
+# Test
+if __name__ == '__main__':
+    import tmcorpus
+
+    scheduler = Scheduler()
+    results = []
+
+    def done(name):
+        return lambda p: results.append((name, p))
+
+    for name in sorted(tmcorpus.CORPUS):
+        src, word, max_steps = tmcorpus.CORPUS[name]
+        tm = tmcorpus.createMachine(name)
+        tm.setTape(word)
+        scheduler.spawn(runAsync(tm, max_steps), None, done(name))
+
+    tm = tmcorpus.createMachine('palindrome')
+    scheduler.spawn(isWordAcceptedAsync(tm, 'ab' * 100 + 'ba' * 100),
+                    None, done('palindrome word'))
+
+    # Never ends by itself, it's cancelled
+    tm = tmcorpus.createMachine('left_expander')
+    tm.setTape('')
+    forever = runAsync(tm, None, TuringMachineGovernor(timeout=60))
+    scheduler.spawn(forever)
+
+    rounds = 0
+    while scheduler.getPendingCount() > 1:
+        scheduler.runOnce()
+        rounds += 1
+    print 'Cancelled:', scheduler.cancel(forever)
+    print 'Rounds:', rounds, 'Left expander steps:', \
+        tm.getExecutedStepsCounter()
+
+    for name, p in results:
+        print '%-20s' % name, p, 'result=%s' % p.result
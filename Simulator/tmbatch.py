@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import collections
+import multiprocessing
+
+import tmparser
+import tmshared
+import tmprofile
+import tmmetrics
+import tmgovernor
+import tmexceptions
+from tm import TuringMachine
+
+__prog__ = 'tmbatch'
+
+# Exit codes, the most severe one found during the batch is returned
+EXIT_ALL_ACCEPTED = 0
+EXIT_SOME_REJECTED = 1
+EXIT_USAGE_ERROR = 2
+EXIT_SOME_UNDECIDED = 3
+EXIT_SOME_INVALID = 4
+EXIT_MACHINE_ERROR = 5
+
+# Word outcomes
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+MAX_STEPS = 'max_steps'
+TIMEOUT = 'timeout'
+MAX_TAPE = 'max_tape'
+OUT_OF_BOUNDS = 'out_of_bounds'
+INVALID = 'invalid'
+
+_OUTCOME_EXIT_CODES = {
+    ACCEPTED: EXIT_ALL_ACCEPTED,
+    REJECTED: EXIT_SOME_REJECTED,
+    MAX_STEPS: EXIT_SOME_UNDECIDED,
+    TIMEOUT: EXIT_SOME_UNDECIDED,
+    MAX_TAPE: EXIT_SOME_UNDECIDED,
+    OUT_OF_BOUNDS: EXIT_SOME_UNDECIDED,
+    INVALID: EXIT_SOME_INVALID,
+}
+
+_END_COND_OUTCOMES = {
+    TuringMachine.END_MAX_STEPS: MAX_STEPS,
+    TuringMachine.END_DEADLINE: TIMEOUT,
+    TuringMachine.END_MAX_TAPE_CELLS: MAX_TAPE,
+    TuringMachine.END_MAX_TAPE_MEMORY: MAX_TAPE,
+    TuringMachine.END_OUT_OF_BOUNDS: OUT_OF_BOUNDS,
+}
+
+# Words of every shared corpus published to the worker processes, and words
+# of every task sent to them
+CORPUS_WORDS = 4096
+CHUNK_WORDS = 16
+
+# Amount of pending tasks per worker process. Keeps memory bounded when the
+# input is larger than what the workers can process
+PENDING_CHUNKS_PER_WORKER = 4
+
+
+#
+#
+def loadMachine(fname):
+    """
+    Parses the machine source stored at fname and returns the created
+    TuringMachine
+
+    Can raise any of the TuringMachineParser exceptions
+    """
+    f = open(fname, 'r')
+    try:
+        src = f.read()
+    finally:
+        f.close()
+
+    return parseMachine(src, os.path.dirname(os.path.abspath(fname)))
+
+#
+#
+def parseMachine(src, base_dir=None):
+    """
+    Parses the given machine source and returns the created TuringMachine.
+    Imported files are relative to base_dir, by default the current directory
+
+    Can raise any of the TuringMachineParser exceptions
+    """
+    parser = tmparser.TuringMachineParser()
+    parser.parseString(src, base_dir)
+    return parser.create()
+
+#
+#
+def runWord(tm, word, governor=None, tape_limit=None, profiler=None):
+    """
+    runWord(tm, word, governor=None, tape_limit=None, profiler=None): dict
+
+    Runs the machine tm from its initial state with word on the tape, under
+    the limits of governor (tmgovernor.TuringMachineGovernor), and returns a
+    result record with the following keys:
+        - word: the given word
+        - outcome: ACCEPTED, REJECTED, MAX_STEPS, TIMEOUT, MAX_TAPE, OUT_OF_BOUNDS or INVALID
+        - steps: amount of executed steps
+        - time: wall time in seconds
+        - tape: only if tape_limit is not None. The final tape without the
+                surrounding blanks, cut to tape_limit symbols (0 = no limit)
+
+    A word is accepted following the isWordAccepted rules: the machine ends by
+    halt state or undefined transition at a final state
+
+    If profiler is not None the executed steps are counted on it
+    """
+    record = {'word': word}
+    start = time.time()
+
+    try:
+        tm.setTape(word)
+    except tmexceptions.InvalidSymbolException as e:
+        record['outcome'] = INVALID
+        record['steps'] = 0
+        record['time'] = time.time() - start
+        record['error'] = str(e)
+        return record
+
+    tm.setAtInitialState()
+    tm.resetExecutedStepsCounter()
+
+    end_cond = tm.run(None, profiler, governor)
+
+    record['outcome'] = getOutcome(tm, end_cond)
+    record['steps'] = tm.getExecutedStepsCounter()
+    record['time'] = time.time() - start
+
+    if tape_limit is not None:
+        record['tape'] = trimmedTape(tm, tape_limit)
+
+    return record
+
+#
+#
+def getExitCode(outcome):
+    """
+    Returns the exit code of a batch with a word of the given outcome
+    """
+    return _OUTCOME_EXIT_CODES[outcome]
+
+#
+#
+def getOutcome(tm, end_cond):
+    """
+    Returns the outcome of a word after tm.run returned end_cond
+    """
+    if end_cond in _END_COND_OUTCOMES and not tm.isAtHaltState():
+        return _END_COND_OUTCOMES[end_cond]
+    elif tm.isAtFinalState():
+        return ACCEPTED
+    return REJECTED
+
+#
+#
+def trimmedTape(tm, limit):
+    """
+    Returns the machine tape as an string without the blanks at both ends
+    and cut to limit symbols (0 = no limit). Multiple char symbols are
+    separated by spaces
+    """
+    blank = tm.getBlankSymbol()
+    tape = list(tm.getTapeIterator())
+
+    first = 0
+    last = len(tape)
+    while first < last and tape[first] == blank:
+        first += 1
+    while last > first and tape[last - 1] == blank:
+        last -= 1
+
+    if limit and last - first > limit:
+        last = first + limit
+
+    sep = ' ' if tm.hasMultiCharSymbols() else ''
+    return sep.join(str(s) for s in tape[first:last])
+
+#
+#
+def readWords(stream):
+    """
+    Generator that yields one word per line of the given stream without the
+    line terminator. An empty line is the empty word
+    """
+    for line in stream:
+        yield line.rstrip('\r\n')
+
+
+#
+# Worker process state. The machine is attached from the shared segment
+# published by the parent, and so is the corpus of the current task
+#
+_worker_tm = None
+_worker_args = None
+_worker_corpus = None
+
+#
+#
+def _initWorker(machine_name, governor, tape_limit):
+    global _worker_tm, _worker_args
+    _worker_tm = tmshared.attachMachine(machine_name)
+    _worker_args = (governor, tape_limit)
+
+#
+#
+def _runWorkerChunk(chunk):
+    global _worker_corpus
+    corpus_name, start, stop = chunk
+    if _worker_corpus is None or \
+       _worker_corpus.getSegmentName() != corpus_name:
+        if _worker_corpus is not None:
+            _worker_corpus.close()
+        _worker_corpus = tmshared.attachCorpus(corpus_name)
+
+    governor, tape_limit = _worker_args
+    return [runWord(_worker_tm, _worker_corpus[i], governor, tape_limit)
+            for i in xrange(start, stop)]
+
+#
+#
+def runBatch(fname, words, governor=None, tape_limit=None, workers=1,
+             profiler_factory=None, metrics=None):
+    """
+    Generator that yields the result record (see runWord) of every word of
+    the iterable words, in the same order
+
+    If workers > 1 the words are distributed across that amount of
+    processes. The machine is loaded once and published to them as a
+    shared segment (see tmshared), and the words are read in blocks of
+    CORPUS_WORDS published as shared corpora, so the tasks only send the
+    position of their CHUNK_WORDS words. The words must be strings
+
+    profiler_factory is only allowed with one worker, it's called with the
+    loaded machine and must return the profiler used for all the words
+
+    If metrics (tmmetrics.TuringMachineMetrics) is given, every word is added
+    to it. The engine metrics are only sampled with one worker, with more
+    workers only the steps of every word are added
+    """
+    if workers <= 1:
+        tm = loadMachine(fname)
+        tm.setMetrics(metrics)
+        profiler = profiler_factory(tm) if profiler_factory else None
+        for word in words:
+            record = runWord(tm, word, governor, tape_limit, profiler)
+            if metrics is not None:
+                metrics.addWord(record['outcome'], record['time'])
+            yield record
+        return
+
+    if profiler_factory:
+        raise Exception('Profiling is only allowed with one worker')
+
+    segment = tmshared.publishMachine(loadMachine(fname))
+    # Published corpora with chunks not finished yet
+    corpora = set()
+    try:
+        pool = multiprocessing.Pool(workers, _initWorker,
+                                    (segment.name, governor, tape_limit))
+        try:
+            # (corpus segment, chunk words, result) of the submitted tasks
+            pending = collections.deque()
+            max_pending = workers * PENDING_CHUNKS_PER_WORKER
+            chunks = _submitChunks(pool, words, corpora)
+            pending.extend(itertools.islice(chunks, max_pending))
+            
+            while pending:
+                corpus, nwords, result = pending.popleft()
+                records = result.get()
+                pending.extend(itertools.islice(chunks, 1))
+                # The results are read in order, so the last chunk of the
+                # corpus is done
+                if not pending or pending[0][0] is not corpus:
+                    corpora.discard(corpus)
+                    corpus.unlink()
+                    corpus.close()
+                if metrics is not None:
+                    metrics.setQueueDepth(sum(c[1] for c in pending))
+                for record in records:
+                    if metrics is not None:
+                        metrics.addSteps(record['steps'])
+                        metrics.addWord(record['outcome'], record['time'])
+                    yield record
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    finally:
+        segment.unlink()
+        segment.close()
+        for corpus in corpora:
+            corpus.unlink()
+            corpus.close()
+
+#
+#
+def _submitChunks(pool, words, corpora):
+    """
+    Generator that publishes the words in shared corpora of CORPUS_WORDS
+    words, added to the set corpora, and submits them to the pool in
+    tasks of CHUNK_WORDS words, yielding the (corpus segment, chunk words,
+    result) of every task
+    """
+    words = iter(words)
+    while True:
+        block = list(itertools.islice(words, CORPUS_WORDS))
+        if not block:
+            return
+        corpus = tmshared.publishCorpus(block)
+        corpora.add(corpus)
+        for start in xrange(0, len(block), CHUNK_WORDS):
+            stop = min(len(block), start + CHUNK_WORDS)
+            yield (corpus, stop - start,
+                   pool.apply_async(_runWorkerChunk,
+                                    ((corpus.name, start, stop),)))
+
+#
+#
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog=__prog__,
+        description='Runs a Turing machine over a list of words without GUI '
+                    'and writes one JSON result per word')
+    argparser.add_argument('machine', help='Turing machine source file')
+    argparser.add_argument('words', nargs='?', default='-',
+                           help='File with one input word per line '
+                                '(default: stdin)')
+    argparser.add_argument('-o', '--output', default='-',
+                           help='JSONL output file (default: stdout)')
+    argparser.add_argument('--max-steps', type=int, default=None,
+                           help='Maximum steps per word')
+    argparser.add_argument('--timeout', type=float, default=None,
+                           help='Maximum wall time per word in seconds')
+    argparser.add_argument('--max-tape-cells', type=int, default=None,
+                           help='Maximum tape size per word')
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='Amount of worker processes (default: 1)')
+    argparser.add_argument('--tape', type=int, default=None, metavar='LIMIT',
+                           help='Include the trimmed output tape cut to LIMIT '
+                                'symbols (0 = whole tape)')
+    argparser.add_argument('--profile', default=None, metavar='FILE',
+                           help='Write a profiling report of all the words to '
+                                'FILE (- for stderr), requires one worker')
+    argparser.add_argument('--metrics', default=None, metavar='FILE',
+                           help='Write runtime metrics to FILE in the '
+                                'Prometheus text format')
+    argparser.add_argument('--metrics-interval', type=float,
+                           default=tmmetrics.DEF_WRITE_INTERVAL,
+                           metavar='SECONDS',
+                           help='Seconds between metrics writes '
+                                '(default: %g)' % tmmetrics.DEF_WRITE_INTERVAL)
+
+    args = argparser.parse_args(argv)
+    if args.max_steps is not None and args.max_steps <= 0:
+        argparser.error('--max-steps must be greater than 0')
+    if args.timeout is not None and args.timeout <= 0:
+        argparser.error('--timeout must be greater than 0')
+    if args.max_tape_cells is not None and args.max_tape_cells <= 0:
+        argparser.error('--max-tape-cells must be greater than 0')
+    if args.workers <= 0:
+        argparser.error('--workers must be greater than 0')
+    if args.profile and args.workers > 1:
+        argparser.error('--profile requires one worker')
+    if args.metrics_interval < 0:
+        argparser.error('--metrics-interval must be greater or equal than 0')
+
+    # Fail early with a clear exit code if the machine is invalid
+    try:
+        loadMachine(args.machine)
+    except Exception as e:
+        sys.stderr.write('%s: error loading %s: %s\n' %
+                         (__prog__, args.machine, e))
+        return EXIT_MACHINE_ERROR
+
+    fin = sys.stdin if args.words == '-' else open(args.words, 'r')
+    fout = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    profilers = []
+    profiler_factory = None
+    if args.profile:
+        def profiler_factory(tm):
+            profilers.append(tmprofile.TuringMachineProfiler(tm))
+            return profilers[0]
+
+    governor = tmgovernor.TuringMachineGovernor(args.max_steps, args.timeout,
+                                                max_tape_cells=args.max_tape_cells)
+
+    metrics = None
+    if args.metrics:
+        metrics = tmmetrics.TuringMachineMetrics(args.metrics,
+                                                 args.metrics_interval)
+
+    exit_code = EXIT_ALL_ACCEPTED
+    try:
+        for record in runBatch(args.machine, readWords(fin), governor,
+                               args.tape, args.workers, profiler_factory,
+                               metrics):
+            fout.write(json.dumps(record, sort_keys=True))
+            fout.write('\n')
+            exit_code = max(exit_code, getExitCode(record['outcome']))
+    finally:
+        if metrics is not None:
+            metrics.flush()
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+
+    if profilers:
+        fprof = sys.stderr if args.profile == '-' else open(args.profile, 'w')
+        fprof.write(profilers[0].report() + '\n')
+        if fprof is not sys.stderr:
+            fprof.close()
+
+    return exit_code
+
+#
+#
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import platform
+import argparse
+
+import tmcorpus
+import tmexceptions
+from tm import TuringMachine
+from tmparser import TuringMachineParser
+from tmbuilder import TuringMachineBuilder
+
+__prog__ = 'tmbench'
+
+# Default relative change considered a regression on compare
+DEF_THRESHOLD = 0.10
+
+# Minimum wall time of every timed repetition
+MIN_TIME = 0.2
+
+
+#
+#
+class Benchmark:
+    """
+    A named measure. func() must perform the work and return the amount of
+    processed units (steps, words, lines, ...)
+    """
+
+    #
+    #
+    def __init__(self, name, unit, func, repeat=3):
+        self.name = name
+        self.unit = unit
+        self.func = func
+        self.repeat = repeat
+
+    #
+    #
+    def measure(self, min_time=MIN_TIME):
+        """
+        Returns the best units per second of self.repeat repetitions. Every
+        repetition calls func until min_time is elapsed
+        """
+        best = 0.0
+        for i in xrange(self.repeat):
+            units = 0
+            start = time.time()
+            elapsed = 0.0
+            while elapsed < min_time:
+                units += self.func()
+                elapsed = time.time() - start
+            best = max(best, units / elapsed)
+        return best
+
+
+#
+# Benchmark bodies
+#
+
+#
+#
+def _runMachine(tm, word, max_steps):
+    tm.setTape(word)
+    tm.setAtInitialState()
+    tm.resetExecutedStepsCounter()
+    tm.run(max_steps)
+    return tm.getExecutedStepsCounter()
+
+#
+#
+def _stepMachine(tm, word, max_steps):
+    tm.setTape(word)
+    tm.setAtInitialState()
+    tm.resetExecutedStepsCounter()
+    try:
+        if max_steps:
+            for i in xrange(max_steps):
+                tm.step()
+        else:
+            while not tm.isAtHaltState():
+                tm.step()
+    except tmexceptions.UnknownTransitionException:
+        pass
+    return tm.getExecutedStepsCounter()
+
+#
+#
+def _acceptWords(tm, words):
+    for w in words:
+        tm.setAtInitialState()
+        tm.isWordAccepted(w)
+    return len(words)
+
+#
+#
+def _setTape(tm, tape):
+    tm.setTape(tape)
+    return len(tape)
+
+#
+#
+def _redrawTape(tm, width):
+    # Same reads performed by the GUI on every head movement
+    head = tm.getHeadPosition()
+    for pos in xrange(head - width / 2, head + width / 2 + 1):
+        tm.getSymbolAt(pos)
+    return 1
+
+#
+#
+def generateSource(nstates, symbols='01'):
+    """
+    Returns a valid machine source with nstates * len(symbols) transitions
+    """
+    lines = ['% Generated machine', 'HALT HALT', 'BLANK #', 'INITIAL 0',
+             'FINAL q%d' % (nstates - 1)]
+    lines.append('0, # -> q0, #, >')
+    for i in xrange(nstates):
+        nxt = 'q%d' % (i + 1) if i + 1 < nstates else 'HALT'
+        for s in symbols:
+            lines.append('q%d, %s -> %s, %s, >' % (i, s, nxt, s))
+    return '\n'.join(lines) + '\n'
+
+#
+#
+def _parseSource(src, nlines):
+    parser = TuringMachineParser()
+    parser.parseString(src)
+    return nlines
+
+#
+#
+def _createFromBuilder(builder):
+    builder.create()
+    return 1
+
+#
+#
+def generateTable(nstates, symbols='01'):
+    """
+    Returns the lines of the same machine as generateSource in the table
+    format of TuringMachineBuilder.addTable
+    """
+    lines = ['% Generated machine', 'HALT HALT', 'BLANK #', 'INITIAL 0',
+             'FINAL q%d' % (nstates - 1), 'SYMBOLS # ' + ' '.join(symbols)]
+    lines.append('0 q0,#,> ' + ' '.join('-' for s in symbols))
+    for i in xrange(nstates):
+        nxt = 'q%d' % (i + 1) if i + 1 < nstates else 'HALT'
+        lines.append('q%d - %s' % (i, ' '.join('%s,%s,>' % (nxt, s)
+                                                for s in symbols)))
+    return lines
+
+#
+#
+def _addTransitions(transitions):
+    builder = TuringMachineBuilder()
+    builder.addTransitions(transitions)
+    return len(transitions)
+
+#
+#
+def _addTable(lines):
+    builder = TuringMachineBuilder()
+    builder.addTable(lines)
+    return len(lines)
+
+#
+#
+def _loadedBuilder(nstates, symbols='01'):
+    builder = TuringMachineBuilder()
+    builder.setBlankSymbol('#')
+    builder.setHaltState('HALT')
+    builder.setInitialState('q0')
+    for i in xrange(nstates):
+        nxt = 'q%d' % (i + 1) if i + 1 < nstates else 'HALT'
+        for s in symbols:
+            builder.addTransition('q%d' % i, s, nxt, s,
+                                  TuringMachine.MOVE_RIGHT)
+    return builder
+
+#
+#
+def createBenchmarks(quick=False):
+    """
+    Returns the list of benchmarks. If quick is True smaller inputs are used
+    """
+    scale = 10 if quick else 1
+    benchs = []
+
+    for name in sorted(tmcorpus.CORPUS):
+        src, word, max_steps = tmcorpus.CORPUS[name]
+        tm = tmcorpus.createMachine(name)
+        benchs.append(Benchmark('run.%s' % name, 'steps/s',
+            lambda tm=tm, w=word, m=max_steps: _runMachine(tm, w, m)))
+        benchs.append(Benchmark('step.%s' % name, 'steps/s',
+            lambda tm=tm, w=word, m=max_steps: _stepMachine(tm, w, m)))
+
+    tm = tmcorpus.createMachine('palindrome')
+    words = ['ab' * i + 'ba' * i for i in xrange(8)] + \
+            ['ab' * i + 'a' for i in xrange(8)]
+    benchs.append(Benchmark('isWordAccepted.palindrome', 'words/s',
+                            lambda tm=tm: _acceptWords(tm, words)))
+
+    tape = '01' * (500000 / scale)
+    tm = tmcorpus.createMachine('binary_increment')
+    benchs.append(Benchmark('setTape.%d' % len(tape), 'symbols/s',
+                            lambda tm=tm: _setTape(tm, tape)))
+    benchs.append(Benchmark('getSymbolAt.redraw', 'redraws/s',
+                            lambda tm=tm: _redrawTape(tm, 31)))
+
+    nstates = 10000 / scale
+    src = generateSource(nstates)
+    nlines = len(src.splitlines())
+    benchs.append(Benchmark('parseString.%d' % nlines, 'lines/s',
+                            lambda src=src: _parseSource(src, nlines)))
+
+    builder = _loadedBuilder(nstates)
+    benchs.append(Benchmark('builder.create.%d' % (nstates * 2), 'creates/s',
+                            lambda: _createFromBuilder(builder)))
+
+    transitions = [(k[0], k[1]) + v for k, v in
+                   builder.getTransitionFunction().iteritems()]
+    benchs.append(Benchmark('builder.addTransitions.%d' % len(transitions),
+                            'transitions/s',
+                            lambda: _addTransitions(transitions)))
+
+    lines = generateTable(nstates)
+    benchs.append(Benchmark('builder.addTable.%d' % len(lines), 'lines/s',
+                            lambda: _addTable(lines)))
+
+    return benchs
+
+#
+#
+def runBenchmarks(benchs, min_time=MIN_TIME, out=None):
+    """
+    Measures every benchmark and returns the results dictionary:
+        { 'meta': {...}, 'results': { name: {'value': v, 'unit': u} } }
+    Every value is a throughput, greater is better
+    """
+    results = {}
+    for b in benchs:
+        value = b.measure(min_time)
+        results[b.name] = {'value': value, 'unit': b.unit}
+        if out:
+            out.write('%-40s %14.1f %s\n' % (b.name, value, b.unit))
+
+    meta = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    return {'meta': meta, 'results': results}
+
+#
+#
+def compareResults(base, new, threshold=DEF_THRESHOLD):
+    """
+    Compares two results dictionaries, as returned by runBenchmarks, and
+    returns a list of (name, base_value, new_value, relative_change,
+    is_regression) for every benchmark present in both
+    """
+    rows = []
+    bres = base['results']
+    nres = new['results']
+    for name in sorted(set(bres) & set(nres)):
+        bval = bres[name]['value']
+        nval = nres[name]['value']
+        change = (nval - bval) / bval if bval else 0.0
+        rows.append((name, bval, nval, change, change < -threshold))
+    return rows
+
+#
+#
+def _load(fname):
+    f = open(fname, 'r')
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+#
+#
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog=__prog__,
+        description='Turing machine simulator benchmarks')
+    subparsers = argparser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('-o', '--output', default=None,
+                            help='JSON results file')
+    run_parser.add_argument('--quick', action='store_true',
+                            help='Use smaller inputs')
+    run_parser.add_argument('--filter', default=None,
+                            help='Only run benchmarks containing this text')
+    run_parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                            help='Minimum seconds per repetition')
+
+    cmp_parser = subparsers.add_parser('compare',
+                            help='Compare two results files')
+    cmp_parser.add_argument('base', help='Baseline results file')
+    cmp_parser.add_argument('new', help='New results file')
+    cmp_parser.add_argument('--threshold', type=float, default=DEF_THRESHOLD,
+                            help='Relative slowdown reported as regression '
+                                 '(default: %.2f)' % DEF_THRESHOLD)
+
+    args = argparser.parse_args(argv)
+
+    if args.command == 'run':
+        benchs = createBenchmarks(args.quick)
+        if args.filter:
+            benchs = [b for b in benchs if args.filter in b.name]
+        results = runBenchmarks(benchs, args.min_time, sys.stdout)
+        if args.output:
+            f = open(args.output, 'w')
+            try:
+                json.dump(results, f, indent=2, sort_keys=True)
+            finally:
+                f.close()
+        return 0
+
+    rows = compareResults(_load(args.base), _load(args.new), args.threshold)
+    nregressions = 0
+    for name, bval, nval, change, regression in rows:
+        if regression:
+            nregressions += 1
+        sys.stdout.write('%-40s %14.1f %14.1f %+7.1f%%%s\n' %
+                         (name, bval, nval, change * 100,
+                          '  REGRESSION' if regression else ''))
+
+    return 1 if nregressions else 0
+
+#
+#
+if __name__ == '__main__':
+    sys.exit(main())
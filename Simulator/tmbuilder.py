@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import gc
+import itertools
+import contextlib
+
 from tm import TuringMachine
 
 class TuringMachineBuilder:
@@ -9,8 +13,17 @@ class TuringMachineBuilder:
     
     By default (can be specified) sets the halt state to 'HALT and the
     blank symbol to '#'
+    
+    Whole transition tables can be added at once with addTransitions, or
+    from the state x symbol table format with addTable and loadTable
     """
     
+    # Movements and empty cell of the table format, see addTable
+    TABLE_MOVEMENTS = {'<': TuringMachine.MOVE_LEFT,
+                       '>': TuringMachine.MOVE_RIGHT,
+                       '_': TuringMachine.NON_MOVEMENT}
+    TABLE_NO_TRANSITION = '-'
+    
     def __init__(self):
         """
         Initialize a new TuringMachineBuilder with the specified haltstate and
@@ -84,6 +97,190 @@ class TuringMachineBuilder:
             
         self._trans_function[(state,symbol)] = (new_state, new_symbol,
                                                  movement)
+                                                 
+    #
+    #
+    def addTransitions(self, transitions):
+        """
+        addTransitions(transitions)
+        
+        Adds every (state, symbol, new_state, new_symbol, movement) tuple of
+        the iterable transitions, as addTransition does, validating and
+        storing the whole table at once. The table is split in columns, so
+        the states, symbols and movements are checked with one set
+        operation per column instead of one check per transition
+        
+        Raise Exception if a transition has not 5 elements or has an invalid
+        movement. Nothing is added in that case
+        """
+        with _pausedCollector():
+            rows = list(transitions)
+            if not rows:
+                return
+            if set(itertools.imap(len, rows)) != _TRANSITION_LENGTH:
+                raise Exception('Invalid transition format, expected (state, '
+                                'symbol, new_state, new_symbol, movement)')
+                                
+            states, symbols, new_states, new_symbols, movements = zip(*rows)
+            if not set(movements).issubset(TuringMachine.HEAD_MOVEMENTS):
+                raise Exception('Invalid movement')
+                
+            table = dict(itertools.izip(
+                itertools.izip(states, symbols),
+                itertools.izip(new_states, new_symbols, movements)))
+            used_states = set(states)
+            used_states.update(new_states)
+            used_symbols = set(symbols)
+            used_symbols.update(new_symbols)
+            self._addTable(table, used_states, used_symbols)
+        
+    #
+    #
+    def addTable(self, lines):
+        """
+        addTable(lines)
+        
+        Adds the machine defined by the given lines (any iterable, like a
+        file) in the state x symbol table format:
+        
+            % Comment line
+            BLANK #
+            HALT H
+            INITIAL q0
+            FINAL H
+            SYMBOLS  0       1       #
+            q0       q0,0,>  q0,1,>  q1,#,<
+            q1       H,1,_   q1,0,<  -
+            
+        The SYMBOLS line gives the symbol of every column. Every line after
+        it is a row: a state followed by its transition reading the symbol
+        of each column, as new_state,new_symbol,movement or - if there is
+        none. Movements are < > _ as in the simulator language
+        
+        States and symbols can not contain whitespace nor commas, they are
+        interned. Repeated cells are parsed once
+        
+        Raise Exception with the number of the first invalid line
+        """
+        with _pausedCollector():
+            self._addTableLines(lines)
+        
+    #
+    #
+    def _addTableLines(self, lines):
+        columns = None
+        table = {}
+        states = set()
+        # Cell text -> (new_state, new_symbol, movement)
+        cells = {}
+        
+        for nline, line in enumerate(lines):
+            fields = line.split()
+            if not fields or fields[0][0] == '%':
+                continue
+                
+            try:
+                if columns is None:
+                    columns = self._tableDirective(fields)
+                    continue
+                    
+                if len(fields) != len(columns) + 1:
+                    raise Exception('Expected %d transitions, found %d' %
+                                    (len(columns), len(fields) - 1))
+                state = intern(fields[0])
+                states.add(state)
+                for symbol, cell in itertools.izip(columns,
+                                                   itertools.islice(fields,
+                                                                    1, None)):
+                    if cell == TuringMachineBuilder.TABLE_NO_TRANSITION:
+                        continue
+                    value = cells.get(cell)
+                    if value is None:
+                        value = cells[cell] = self._tableCell(cell)
+                    table[(state, symbol)] = value
+            except Exception as e:
+                raise Exception('Line %d, %s' % (nline + 1, e))
+                
+        if columns is None:
+            raise Exception('Missing SYMBOLS line')
+            
+        states.update(v[0] for v in cells.itervalues())
+        symbols = set(columns)
+        symbols.update(v[1] for v in cells.itervalues())
+        self._addTable(table, states, symbols)
+        
+    #
+    #
+    def loadTable(self, fname):
+        """
+        Adds the machine stored at fname in the table format, see addTable
+        """
+        f = open(fname, 'r')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        self.addTable(data.splitlines())
+        
+    #
+    #
+    def _addTable(self, table, states, symbols):
+        """
+        Adds the already validated transitions of table, being states and
+        symbols all the states and symbols they use
+        """
+        self._states.update(states)
+        symbols.discard(self._blank)
+        self._in_alphabet.update(symbols)
+        if self._trans_function:
+            self._trans_function.update(table)
+        else:
+            self._trans_function = table
+        
+    #
+    #
+    def _tableDirective(self, fields):
+        """
+        Applies a directive line of the table format. Returns the list of
+        column symbols if it's the SYMBOLS line, otherwise None
+        """
+        name = fields[0]
+        if name == 'SYMBOLS':
+            columns = [intern(s) for s in fields[1:]]
+            if not columns:
+                raise Exception('There are no symbols')
+            if len(set(columns)) != len(columns):
+                raise Exception('Repeated symbol')
+            return columns
+            
+        if len(fields) != 2:
+            raise Exception('Unrecognized pattern: %s' % ' '.join(fields))
+        value = intern(fields[1])
+        if name == 'BLANK':
+            self.setBlankSymbol(value)
+        elif name == 'HALT':
+            self.setHaltState(value)
+        elif name == 'INITIAL':
+            self.setInitialState(value)
+        elif name == 'FINAL':
+            self.addFinalState(value)
+        else:
+            raise Exception('Unrecognized pattern: %s' % ' '.join(fields))
+        return None
+        
+    #
+    #
+    def _tableCell(self, cell):
+        """
+        Returns the (new_state, new_symbol, movement) of a table cell
+        """
+        parts = cell.split(',')
+        if len(parts) != 3 or not parts[0] or not parts[1] or \
+           parts[2] not in TuringMachineBuilder.TABLE_MOVEMENTS:
+            raise Exception('Invalid transition %s' % cell)
+        return (intern(parts[0]), intern(parts[1]),
+                TuringMachineBuilder.TABLE_MOVEMENTS[parts[2]])
+        
     #
     #                                             
     def addFinalState(self, state):
@@ -139,12 +336,20 @@ class TuringMachineBuilder:
     def setBlankSymbol(self, blank_sym):
         """
         Specifies a new blank symbol
-            - The blank symbol must be one char length
             
-        Raise Exception if blank_sym has more than one char length
+        Raise Exception if blank_sym is empty
         """
-        if not blank_sym or len(blank_sym) > 1:
-            raise Exception('Symbol must be one char length')
+        if not blank_sym:
+            raise Exception('Blank symbol can not be empty')
+            
+        # The previous blank symbol was not added to the input alphabet,
+        # add it if some transition uses it
+        old = self._blank
+        if old is not None and old != blank_sym:
+            for k, v in self._trans_function.iteritems():
+                if k[1] == old or v[1] == old:
+                    self._in_alphabet.add(old)
+                    break
             
         self._blank = blank_sym
         
@@ -182,6 +387,9 @@ class TuringMachineBuilder:
             The blank symbol remains unset
         
         At this point the tape_alphabet is set to be: in_alphabet U {blank}
+        
+        The transitions were validated when they were added, so the machine
+        does not validate them again
         """
         if not self.hasInitialState():
             raise Exception('It is necessary to specify an initial state')
@@ -196,9 +404,11 @@ class TuringMachineBuilder:
         tape_alphabet = set(self._in_alphabet)
         tape_alphabet.add(self._blank)
         
-        return TuringMachine(self._states, self._in_alphabet, tape_alphabet,
-                             self._trans_function, self._istate, 
-                             self._fstates, self._haltstate, self._blank)
+        with _pausedCollector():
+            return TuringMachine(self._states, self._in_alphabet,
+                                 tape_alphabet, self._trans_function,
+                                 self._istate, self._fstates, self._haltstate,
+                                 self._blank, checked=True)
                              
     #
     #
@@ -208,6 +418,67 @@ class TuringMachineBuilder:
         initialization of this Builder
         """
         return self._haltstate
+        
+    #
+    #
+    def getInitialState(self):
+        """
+        Returns the initial state or None if it remains unset
+        """
+        return self._istate
+        
+    #
+    #
+    def getBlankSymbol(self):
+        """
+        Returns the blank symbol or None if it remains unset
+        """
+        return self._blank
+        
+    #
+    #
+    def getFinalStates(self):
+        """
+        Returns a copy of the set of final states
+        """
+        return set(self._fstates)
+        
+    #
+    #
+    def getTransitionFunction(self):
+        """
+        Returns a copy of the transition function collected until now as a
+        dict (state, symbol) : (new_state, new_symbol, movement)
+        """
+        return dict(self._trans_function)
+        
+    #
+    #
+    def hasTransition(self, state, symbol):
+        """
+        Returns True if there is a transition from state reading symbol
+        """
+        return (state, symbol) in self._trans_function
+            
+
+_TRANSITION_LENGTH = set([5])
+
+#
+#
+@contextlib.contextmanager
+def _pausedCollector():
+    """
+    Disables the cyclic garbage collector while building the tables. They
+    allocate millions of tuples that can not form cycles, and every
+    allocation burst would trigger full collections
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
             
 
 if __name__ == '__main__':
@@ -228,3 +499,38 @@ if __name__ == '__main__':
     tmb.addFinalState(2)
     
     print tmb.create()
+    
+    # Same machine added at once
+    bulk = TuringMachineBuilder()
+    bulk.setBlankSymbol('#')
+    bulk.setHaltState('HALT')
+    bulk.setInitialState(1)
+    bulk.addFinalState(2)
+    bulk.addTransitions((k[0], k[1]) + v for k, v in
+                        tmb.getTransitionFunction().iteritems())
+    print 'Bulk same machine:', \
+        bulk.create().getFingerprint() == tmb.create().getFingerprint()
+    
+    for invalid in ([(1, 0, 2, 1)], [(1, 0, 2, 1, 'R')]):
+        try:
+            bulk.addTransitions(invalid)
+        except Exception as e:
+            print 'Error:', e
+    
+    # Binary increment as a state x symbol table
+    table = TuringMachineBuilder()
+    table.addTable(['% Binary increment',
+                    'BLANK #', 'HALT H', 'INITIAL r', 'FINAL H',
+                    'SYMBOLS  0       1       #',
+                    'r        r,0,>   r,1,>   c,#,<',
+                    'c        H,1,_   c,0,<   H,1,_'])
+    tm = table.create()
+    tm.setTape('1011')
+    tm.setAtInitialState()
+    tm.run()
+    print 'Table machine, 1011 + 1 =', ''.join(tm.getTapeIterator()).strip('#')
+    
+    try:
+        table.addTable(['SYMBOLS 0 1', 'r r,0,> r,1'])
+    except Exception as e:
+        print 'Error:', e
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import cPickle
+import collections
+
+#
+# Memoization of TuringMachine.isWordAccepted results
+#
+# Entries are keyed by the machine fingerprint (TuringMachine.getFingerprint,
+# a hash of the validated definition) and the word, so a changed machine never
+# gets the results of the previous one. Every entry keeps the result and the
+# steps the run took:
+#   - An accepted or rejected word is decided for any step limit greater than
+#     its steps, and undecided for the smaller or equal ones
+#   - An undecided word is undecided for any step limit smaller or equal than
+#     the one it was run with, greater limits run the machine again
+#
+# Undecided results caused by the governor time and tape limits are not
+# cached, they depend on the load of the host.
+#
+
+DEF_MAX_ENTRIES = 65536
+DEF_MAX_BYTES = 64 << 20
+
+# Estimated bytes of an entry without its word
+ENTRY_OVERHEAD = 200
+
+PICKLE_VERSION = 1
+
+#
+#
+class TuringMachineResultCache:
+    """
+    LRU cache of isWordAccepted results, bounded by entries and by bytes.
+    Attach it to the machines with TuringMachine.setResultCache, the same
+    cache can be shared by many machines
+    """
+
+    #
+    #
+    def __init__(self, max_entries=DEF_MAX_ENTRIES, max_bytes=DEF_MAX_BYTES,
+                 fname=None):
+        """
+        TuringMachineResultCache(max_entries=DEF_MAX_ENTRIES,
+                                 max_bytes=DEF_MAX_BYTES, fname=None)
+            - fname: file to persist the cache. It's loaded now if it exists
+              and written by save()
+        """
+        if max_entries <= 0 or max_bytes <= 0:
+            raise Exception('Cache limits must be greater than 0')
+
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._fname = fname
+
+        # (fingerprint, word) -> (result, steps, bytes)
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if fname is not None and os.path.exists(fname):
+            self.load(fname)
+
+    #
+    #
+    def lookup(self, tm, word, max_steps=None):
+        """
+        lookup(tm, word, max_steps=None): (bool, result)
+
+        Returns (True, result) if the isWordAccepted result of word with the
+        given step limit (None or 0 = no limit) is known, otherwise
+        (False, None)
+        """
+        key = (tm.getFingerprint(), _wordKey(word))
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self._entries[key] = entry
+
+        result, steps = entry[0], entry[1]
+        if result is not None:
+            self.hits += 1
+            if max_steps and steps >= max_steps:
+                return True, None
+            return True, result
+
+        if max_steps and max_steps <= steps:
+            self.hits += 1
+            return True, None
+
+        self.misses += 1
+        return False, None
+
+    #
+    #
+    def store(self, tm, word, result, steps):
+        """
+        Adds the isWordAccepted result of word, reached after steps steps
+        (the step limit if it's undecided)
+        """
+        self._store((tm.getFingerprint(), _wordKey(word)), result, steps)
+
+    #
+    #
+    def invalidate(self, fingerprint=None):
+        """
+        Removes the entries of the machine with the given fingerprint, or all
+        of them if it's None
+        """
+        if fingerprint is None:
+            self._entries.clear()
+            self._nbytes = 0
+            return
+
+        for key in [k for k in self._entries if k[0] == fingerprint]:
+            self._nbytes -= self._entries.pop(key)[2]
+
+    #
+    #
+    def getStats(self):
+        """
+        Returns a dict with the entries, bytes, hits, misses and evictions
+        """
+        return {'entries': len(self._entries), 'bytes': self._nbytes,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+    #
+    #
+    def load(self, fname):
+        """
+        Adds the entries saved at fname, as least recently used
+        """
+        f = open(fname, 'rb')
+        try:
+            version, entries = cPickle.load(f)
+        finally:
+            f.close()
+        if version != PICKLE_VERSION:
+            raise Exception('Invalid cache file %s' % fname)
+
+        current = self._entries
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+        for key, (result, steps) in entries:
+            self._store(key, result, steps)
+        for key, entry in current.iteritems():
+            self._store(key, entry[0], entry[1])
+
+    #
+    #
+    def save(self, fname=None):
+        """
+        Writes the entries to fname, by default the file given on creation.
+        The file is replaced atomically
+        """
+        fname = fname or self._fname
+        if fname is None:
+            raise Exception('There is no cache file')
+
+        entries = [(key, entry[:2]) for key, entry in self._entries.iteritems()]
+        tmp = fname + '.tmp'
+        f = open(tmp, 'wb')
+        try:
+            cPickle.dump((PICKLE_VERSION, entries), f,
+                         cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmp, fname)
+
+    #
+    #
+    def _store(self, key, result, steps):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._nbytes -= old[2]
+
+        nbytes = sys.getsizeof(key[1]) + ENTRY_OVERHEAD
+        self._entries[key] = (result, steps, nbytes)
+        self._nbytes += nbytes
+        while len(self._entries) > self._max_entries or \
+              self._nbytes > self._max_bytes:
+            self._nbytes -= self._entries.popitem(last=False)[1][2]
+            self.evictions += 1
+
+    #
+    #
+    def __len__(self):
+        return len(self._entries)
+
+#
+#
+def _wordKey(word):
+    """
+    Returns a hashable version of word
+    """
+    if isinstance(word, (str, unicode, tuple)):
+        return word
+    return tuple(word)
+
+
+#
+# Test
+if __name__ == '__main__':
+    import time
+    import tempfile
+    import tmcorpus
+
+    tm = tmcorpus.createMachine('palindrome')
+    cache = TuringMachineResultCache(max_entries=100)
+    tm.setResultCache(cache)
+
+    words = ['ab' * i + 'ba' * i for i in xrange(40)] + ['abb' * 10]
+    for attempt in ('Cold', 'Warm'):
+        start = time.time()
+        results = [tm.isWordAccepted(w) for w in words]
+        print attempt, time.time() - start, results[-3:]
+
+    print 'Step limit below the steps of a cached result:', \
+        tm.isWordAccepted(words[-2], 10)
+    print 'Undecided with 10 steps, then 20 steps:', \
+        tm.isWordAccepted('abab' * 10, 10), tm.isWordAccepted('abab' * 10, 20)
+    print cache.getStats()
+
+    fd, fname = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        cache.save(fname)
+        loaded = TuringMachineResultCache(fname=fname)
+        other = tmcorpus.createMachine('binary_increment')
+        print 'Loaded entries:', len(loaded), \
+            'Hit:', loaded.lookup(tm, words[5]), \
+            'Other machine:', loaded.lookup(other, words[5])
+    finally:
+        os.remove(fname)
+
+    small = TuringMachineResultCache(max_bytes=ENTRY_OVERHEAD * 20)
+    tm.setResultCache(small)
+    for w in words:
+        tm.isWordAccepted(w)
+    print 'Bytes bounded cache:', small.getStats()
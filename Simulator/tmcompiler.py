@@ -0,0 +1,525 @@
+# -*- coding: utf-8 -*-
+
+import array
+import functools
+import collections
+
+import tmexceptions
+from tm import TuringMachine
+
+#
+# Turing machine compiler
+#
+# Translates the transition function of a TuringMachine into the source of a
+# specialized Python function with one branch per state and the symbol
+# dispatch inlined. States are numbered and dispatched by a balanced tree of
+# comparisons, transitions to the halt state end the execution directly.
+#
+# The compiled function is an engine for TuringMachine.setEngine:
+#
+#   tm.setEngine(tmcompiler.compileMachine(tm))
+#
+# Code objects are cached by machine fingerprint.
+#
+# Sweeps: a transition that stays in the same state and moves the head, like
+# 'q, 1 -> q, 1, >', is executed over the whole run of symbols the state
+# scans without changes (or over the run of the same symbol if the transition
+# rewrites it) in one operation. The end of the run is searched with
+# list.index (at C speed) over windows of growing size and the step counter
+# is increased by its length. Runs of one cell are detected inline.
+#
+
+# Maximum amount of cached code objects
+CACHE_SIZE = 128
+
+# Cells searched by the first window of a sweep
+SWEEP_WINDOW = 64
+
+_cache = collections.OrderedDict()
+
+#
+#
+class CompiledMachine:
+    """
+    Callable engine created by compileMachine. The generated Python source is
+    available on the source attribute
+    """
+
+    #
+    #
+    def __init__(self, fingerprint, source, function):
+        self.fingerprint = fingerprint
+        self.source = source
+        self._function = function
+
+    #
+    #
+    def __call__(self, tm, max_steps=None):
+        """
+        Same as tm.run(max_steps) for the machine this engine was compiled
+        from
+        """
+        if tm._tape is None:
+            raise tmexceptions.UnsetTapeException(
+                'Tape must be set before perform an step')
+        return self._function(tm, max_steps)
+
+#
+#
+def compileMachine(tm, sweeps=True):
+    """
+    Returns a CompiledMachine equivalent to tm. If sweeps is True the self
+    loop transitions that move the head are executed as sweeps
+    """
+    fingerprint = tm.getFingerprint()
+    states, symbols = _numberMachine(tm)
+
+    key = (fingerprint, sweeps)
+    if key in _cache:
+        source, code = _cache.pop(key)
+    else:
+        source = generateSource(tm, states, symbols, sweeps)
+        code = compile(source, '<tm %s>' % fingerprint[:12], 'exec')
+        if len(_cache) >= CACHE_SIZE:
+            _cache.popitem(last=False)
+    _cache[key] = (source, code)
+
+    # The generated code works on the internal tape codes. On compact tapes
+    # the sweeps search chars of the bytearray
+    codes = [tm.getSymbolCode(s) for s in symbols]
+    if tm.isTapeCompact():
+        stops = [chr(c) for c in codes]
+        sweep_right, sweep_left = sweepRightBytes, sweepLeftBytes
+        cells = bytearray
+    else:
+        stops = codes
+        sweep_right, sweep_left = sweepRight, sweepLeft
+        cells = functools.partial(array.array, tm._blankCells(0).typecode)
+
+    namespace = {
+        'STATES': states,
+        'STATE_IDS': dict((s, i) for i, s in enumerate(states)),
+        'SYMBOLS': codes,
+        'STOPS': stops,
+        'BLANK': tm.getSymbolCode(tm.getBlankSymbol()),
+        'sweepRight': sweep_right,
+        'sweepLeft': sweep_left,
+        'CELLS': cells,
+    }
+    exec code in namespace
+    return CompiledMachine(fingerprint, source, namespace['run'])
+
+#
+#
+def _numberMachine(tm):
+    """
+    Returns the sorted lists of states and symbols of tm, their positions are
+    the ids used in the generated source
+    """
+    states = set([tm.getInitialState(), tm.getHaltState()])
+    symbols = set(tm.getTapeAlphabet())
+    for k, v in tm.getTransitionFunction().iteritems():
+        states.add(k[0])
+        states.add(v[0])
+        symbols.add(k[1])
+        symbols.add(v[1])
+    return sorted(states), sorted(symbols)
+
+#
+#
+def generateSource(tm, states, symbols, sweeps=True):
+    """
+    Returns the Python source of the run function of tm. states and symbols
+    are the lists returned by _numberMachine
+    """
+    state_ids = dict((s, i) for i, s in enumerate(states))
+    sym_ids = dict((s, i) for i, s in enumerate(symbols))
+    halt = state_ids[tm.getHaltState()]
+
+    # Transitions grouped by state id: [(symbol id, nstate id, nsymbol id,
+    # movement)]
+    table = [[] for s in states]
+    for k, v in tm.getTransitionFunction().iteritems():
+        table[state_ids[k[0]]].append((sym_ids[k[1]], state_ids[v[0]],
+                                       sym_ids[v[1]], v[2]))
+    for trans in table:
+        trans.sort()
+
+    if sweeps:
+        groups, sweep_of = _sweepGroups(table, symbols)
+    else:
+        groups, sweep_of = [], {}
+
+    lines = ['# Generated by tmcompiler, do not edit', '']
+
+    # Symbols scanned (P) and symbols that stop (O) every sweep
+    for i, kept in enumerate(groups):
+        others = [s for s in xrange(len(symbols)) if s not in kept]
+        lines.append('_P%d = frozenset((%s))' %
+                     (i, ''.join('SYMBOLS[%d], ' % s for s in kept)))
+        lines.append('_O%d = (%s)' %
+                     (i, ''.join('STOPS[%d], ' % s for s in others)))
+
+    lines.extend([
+        '',
+        'def run(tm, max_steps):',
+        '    tape = tm._tape',
+        '    head = tm._head',
+        '    origin = tm._origin',
+        '    size = len(tape)',
+        '    st = STATE_IDS[tm._cur_state]',
+        '    limit = max_steps or -1',
+        '    n = 0',
+        '    c = 0',
+        '    end = 0',
+    ])
+    lines.extend('    S%d = SYMBOLS[%d]' % (i, i) for i in xrange(len(symbols)))
+    for i in xrange(len(groups)):
+        lines.append('    P%d = _P%d' % (i, i))
+        lines.append('    O%d = _O%d' % (i, i))
+    lines.extend([
+        '    if st != %d:' % halt,
+        '        while True:',
+        '            if n == limit:',
+        '                end = 1',
+        '                break',
+        '            sym = tape[head]',
+    ])
+
+    active = [i for i in xrange(len(states)) if i != halt]
+    _genStateTree(lines, active, table, halt, sweep_of, 12)
+
+    lines.extend([
+        '    tm._head = head',
+        '    tm._origin = origin',
+        '    tm._cur_state = STATES[st]',
+        '    tm._nexecuted_steps += n',
+        '    tm._nstate_changes += c',
+        '    return end',
+        '',
+    ])
+    return '\n'.join(lines)
+
+#
+#
+def _sweepGroups(table, symbols):
+    """
+    Returns (groups, sweep_of):
+        - groups: list of tuples with the symbol ids scanned by a sweep
+        - sweep_of: dictionary (state id, symbol id) : group index for every
+                    transition executed as a sweep
+    """
+    groups = []
+    group_ids = {}
+    sweep_of = {}
+
+    for state, trans in enumerate(table):
+        loops = [t for t in trans
+                 if t[1] == state and t[3] != TuringMachine.NON_MOVEMENT]
+
+        for movement in (TuringMachine.MOVE_RIGHT, TuringMachine.MOVE_LEFT):
+            kept = tuple(t[0] for t in loops
+                         if t[3] == movement and t[2] == t[0])
+            runs = [kept] + [(t[0],) for t in loops
+                             if t[3] == movement and t[2] != t[0]]
+            for run in runs:
+                if not run:
+                    continue
+                if run not in group_ids:
+                    group_ids[run] = len(groups)
+                    groups.append(run)
+                for sym in run:
+                    sweep_of[(state, sym)] = group_ids[run]
+
+    return groups, sweep_of
+
+#
+#
+def _genStateTree(lines, ids, table, halt, sweep_of, indent):
+    """
+    Generates a balanced tree of comparisons over the state ids
+    """
+    pad = ' ' * indent
+    if len(ids) == 1:
+        _genState(lines, ids[0], table[ids[0]], halt, sweep_of, indent)
+        return
+
+    mid = len(ids) // 2
+    lines.append('%sif st < %d:' % (pad, ids[mid]))
+    _genStateTree(lines, ids[:mid], table, halt, sweep_of, indent + 4)
+    lines.append('%selse:' % pad)
+    _genStateTree(lines, ids[mid:], table, halt, sweep_of, indent + 4)
+
+#
+#
+def _genState(lines, state, trans, halt, sweep_of, indent):
+    """
+    Generates the symbol dispatch of one state
+    """
+    pad = ' ' * indent
+    lines.append('%s# State %d' % (pad, state))
+
+    first = True
+    for sym, nstate, nsym, movement in trans:
+        lines.append('%s%s sym == S%d:' % (pad, 'if' if first else 'elif',
+                                            sym))
+        first = False
+        if (state, sym) in sweep_of:
+            _genSweep(lines, sweep_of[(state, sym)], state, sym, nsym,
+                      movement, halt, indent + 4)
+        else:
+            _genTransition(lines, state, sym, nstate, nsym, movement, halt,
+                           indent + 4)
+
+    if trans:
+        lines.append('%selse:' % pad)
+        pad += '    '
+    lines.append('%send = 2' % pad)
+    lines.append('%sbreak' % pad)
+
+#
+#
+def _genTransition(lines, state, sym, nstate, nsym, movement, halt, indent):
+    pad = ' ' * indent
+    if nsym != sym:
+        lines.append('%stape[head] = S%d' % (pad, nsym))
+
+    if movement == TuringMachine.MOVE_LEFT:
+        lines.extend([
+            '%sif head == 0:' % pad,
+            '%s    tape.insert(0, BLANK)' % pad,
+            '%s    size += 1' % pad,
+            '%s    origin += 1' % pad,
+            '%selse:' % pad,
+            '%s    head -= 1' % pad,
+        ])
+    elif movement == TuringMachine.MOVE_RIGHT:
+        lines.extend([
+            '%shead += 1' % pad,
+            '%sif head == size:' % pad,
+            '%s    tape.append(BLANK)' % pad,
+            '%s    size += 1' % pad,
+        ])
+
+    if nstate != state:
+        lines.append('%sst = %d' % (pad, nstate))
+        lines.append('%sc += 1' % pad)
+    lines.append('%sn += 1' % pad)
+
+    # run() ends by max steps even if the last step reaches the halt state
+    if nstate == halt:
+        lines.append('%send = 1 if n == limit else 0' % pad)
+        lines.append('%sbreak' % pad)
+
+#
+#
+def _genSweep(lines, group, state, sym, nsym, movement, halt, indent):
+    """
+    Generates the sweep of a self loop transition over the run of symbols of
+    the given group. If the next cell stops the run or it's out of the tape,
+    a plain step is done
+    """
+    pad = ' ' * indent
+    if movement == TuringMachine.MOVE_RIGHT:
+        lines.append('%sif head + 1 == size or tape[head + 1] not in P%d:' %
+                     (pad, group))
+        _genTransition(lines, state, sym, state, nsym, movement, halt,
+                       indent + 4)
+        lines.append('%selse:' % pad)
+        pad += '    '
+        lines.append('%sstop = sweepRight(tape, head, O%d, '
+                     'limit - n if limit > 0 else -1)' % (pad, group))
+        lines.append('%sk = stop - head' % pad)
+        if nsym != sym:
+            lines.append('%stape[head:stop] = CELLS([S%d]) * k' % (pad, nsym))
+        lines.extend([
+            '%shead = stop' % pad,
+            '%sn += k' % pad,
+            '%sif head == size:' % pad,
+            '%s    tape.append(BLANK)' % pad,
+            '%s    size += 1' % pad,
+        ])
+    else:
+        lines.append('%sif head == 0 or tape[head - 1] not in P%d:' %
+                     (pad, group))
+        _genTransition(lines, state, sym, state, nsym, movement, halt,
+                       indent + 4)
+        lines.append('%selse:' % pad)
+        pad += '    '
+        lines.append('%sstop = sweepLeft(tape, head, O%d, '
+                     'limit - n if limit > 0 else -1)' % (pad, group))
+        lines.append('%sk = head - stop' % pad)
+        if nsym != sym:
+            lines.append('%stape[stop + 1:head + 1] = CELLS([S%d]) * k' %
+                         (pad, nsym))
+        lines.extend([
+            '%sn += k' % pad,
+            '%sif stop < 0:' % pad,
+            '%s    tape.insert(0, BLANK)' % pad,
+            '%s    size += 1' % pad,
+            '%s    origin += 1' % pad,
+            '%s    head = 0' % pad,
+            '%selse:' % pad,
+            '%s    head = stop' % pad,
+        ])
+
+#
+#
+def sweepRight(tape, head, others, max_cells):
+    """
+    Returns the position of the first cell from head holding one of the
+    others symbols, or len(tape) if there are none.
+    If max_cells >= 0, head + max_cells is returned if it's smaller
+
+    Used on the array tapes of the large alphabets
+    """
+    end = len(tape)
+    if max_cells >= 0 and head + max_cells < end:
+        end = head + max_cells
+
+    lo = head
+    window = SWEEP_WINDOW
+    while lo < end:
+        hi = min(end, lo + window)
+        cells = tape[lo:hi]
+        stop = hi
+        for s in others:
+            try:
+                stop = min(stop, lo + cells.index(s))
+            except ValueError:
+                pass
+        if stop < hi:
+            return stop
+        lo = hi
+        window *= 2
+    return end
+
+#
+#
+def sweepLeft(tape, head, others, max_cells):
+    """
+    Returns the position of the last cell until head holding one of the
+    others symbols, or -1 if there are none.
+    If max_cells >= 0, head - max_cells is returned if it's greater
+
+    Used on the array tapes of the large alphabets
+    """
+    end = -1
+    if max_cells >= 0 and head - max_cells > end:
+        end = head - max_cells
+
+    hi = head + 1
+    window = SWEEP_WINDOW
+    while hi - 1 > end:
+        lo = max(end + 1, hi - window)
+        cells = tape[lo:hi]
+        cells.reverse()
+        stop = len(cells)
+        for s in others:
+            try:
+                stop = min(stop, cells.index(s))
+            except ValueError:
+                pass
+        if stop < len(cells):
+            return hi - 1 - stop
+        hi = lo
+        window *= 2
+    return end
+
+#
+#
+def sweepRightBytes(tape, head, others, max_cells):
+    """
+    sweepRight for compact tapes, others are the chars of the codes
+    """
+    end = len(tape)
+    if max_cells >= 0 and head + max_cells < end:
+        end = head + max_cells
+
+    lo = head
+    window = SWEEP_WINDOW
+    while lo < end:
+        hi = min(end, lo + window)
+        stop = hi
+        for s in others:
+            pos = tape.find(s, lo, stop)
+            if pos >= 0:
+                stop = pos
+        if stop < hi:
+            return stop
+        lo = hi
+        window *= 2
+    return end
+
+#
+#
+def sweepLeftBytes(tape, head, others, max_cells):
+    """
+    sweepLeft for compact tapes, others are the chars of the codes
+    """
+    end = -1
+    if max_cells >= 0 and head - max_cells > end:
+        end = head - max_cells
+
+    hi = head + 1
+    window = SWEEP_WINDOW
+    while hi - 1 > end:
+        lo = max(end + 1, hi - window)
+        stop = -1
+        for s in others:
+            stop = max(stop, tape.rfind(s, lo, hi))
+        if stop >= 0:
+            return stop
+        hi = lo
+        window *= 2
+    return end
+
+
+#
+# Test
+if __name__ == '__main__':
+    import time
+    import tmcorpus
+    from tmparser import TuringMachineParser
+
+    def tmparser_create(src):
+        parser = TuringMachineParser()
+        parser.parseString(src)
+        return parser.create()
+
+    corpus = dict(tmcorpus.CORPUS)
+    corpus['unary_addition_big'] = (tmcorpus.UNARY_ADDITION,
+                                    '1' * 50000 + '+' + '1' * 50000, None)
+    corpus['left_expander_limit'] = (tmcorpus.LEFT_EXPANDER, '', 777)
+
+    for name in sorted(corpus):
+        src, word, max_steps = corpus[name]
+        results = []
+        times = []
+        for compiled in (None, False, True):
+            tm = tmcorpus.createMachine(name) if name in tmcorpus.CORPUS \
+                    else tmparser_create(src)
+            if compiled is not None:
+                tm.setEngine(compileMachine(tm, compiled))
+            elapsed = 0.0
+            for i in xrange(20):
+                tm.setTape(word)
+                tm.setAtInitialState()
+                tm.resetExecutedStepsCounter()
+                start = time.time()
+                end_cond = tm.run(max_steps)
+                elapsed += time.time() - start
+            times.append(elapsed)
+            results.append((end_cond, tm.getCurrentState(),
+                            tm.getHeadPosition(), tm.getExecutedStepsCounter(),
+                            list(tm.getTapeIterator())))
+        print '%-20s same result: %-5s speedup: %.1fx, with sweeps %.1fx' % \
+            (name, results[0] == results[1] == results[2],
+             times[0] / times[1], times[0] / times[2])
+
+    tm = tmcorpus.createMachine('palindrome')
+    tm.setEngine(compileMachine(tm))
+    print 'abba accepted?', tm.isWordAccepted('abba')
+    print 'abab accepted?', tm.isWordAccepted('abab')
+    print
+    print compileMachine(tmcorpus.createMachine('unary_addition')).source
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from tmparser import TuringMachineParser
+
+#
+# Standard machine corpus used by the benchmarks and the analysis tools
+#
+# Every entry is: name : (source, sample input word, max steps)
+# A max steps value of None means the machine always halts on its sample
+#
+
+BINARY_INCREMENT = """\
+% Binary increment, the head starts at the leftmost digit
+HALT HALT
+BLANK #
+INITIAL a
+FINAL HALT
+a, 0 -> a, 0, >
+a, 1 -> a, 1, >
+a, # -> c, #, <
+c, 1 -> c, 0, <
+c, 0 -> HALT, 1, _
+c, # -> HALT, 1, _
+"""
+
+UNARY_ADDITION = """\
+% Unary addition: 111+11 -> 11111
+HALT HALT
+BLANK #
+INITIAL s
+FINAL HALT
+s, 1 -> s, 1, >
+s, + -> t, 1, >
+t, 1 -> t, 1, >
+t, # -> u, #, <
+u, 1 -> HALT, #, _
+"""
+
+PALINDROME = """\
+% Accepts the palindromes over {a, b}
+% y is the accepting state, n the rejecting one, both without transitions
+HALT HALT
+BLANK #
+INITIAL s
+FINAL y
+s, a -> ra, #, >
+s, b -> rb, #, >
+s, # -> y, #, _
+ra, a -> ra, a, >
+ra, b -> ra, b, >
+ra, # -> ca, #, <
+rb, a -> rb, a, >
+rb, b -> rb, b, >
+rb, # -> cb, #, <
+ca, a -> l, #, <
+ca, b -> n, b, _
+ca, # -> y, #, _
+cb, b -> l, #, <
+cb, a -> n, a, _
+cb, # -> y, #, _
+l, a -> l, a, <
+l, b -> l, b, <
+l, # -> s, #, >
+"""
+
+BUSY_BEAVER_3 = """\
+% 3-state 2-symbol busy beaver: 14 steps, 6 ones
+HALT H
+BLANK 0
+INITIAL A
+FINAL H
+A, 0 -> B, 1, >
+A, 1 -> H, 1, >
+B, 0 -> C, 0, >
+B, 1 -> B, 1, >
+C, 0 -> C, 1, <
+C, 1 -> A, 1, <
+"""
+
+BUSY_BEAVER_4 = """\
+% 4-state 2-symbol busy beaver: 107 steps, 13 ones
+HALT H
+BLANK 0
+INITIAL A
+FINAL H
+A, 0 -> B, 1, >
+A, 1 -> B, 1, <
+B, 0 -> A, 1, <
+B, 1 -> C, 0, <
+C, 0 -> H, 1, >
+C, 1 -> D, 1, <
+D, 0 -> D, 1, >
+D, 1 -> A, 0, >
+"""
+
+LEFT_EXPANDER = """\
+% Never halts, writes 1 and moves to the left forever making the tape grow
+% through its left end
+HALT HALT
+BLANK #
+INITIAL s
+s, # -> s, 1, <
+s, 1 -> s, 1, <
+"""
+
+CORPUS = {
+    'binary_increment': (BINARY_INCREMENT, '1011' * 64 + '1' * 64, None),
+    'unary_addition': (UNARY_ADDITION, '1' * 200 + '+' + '1' * 200, None),
+    'palindrome': (PALINDROME, 'ab' * 32 + 'ba' * 32, None),
+    'busy_beaver_3': (BUSY_BEAVER_3, '', None),
+    'busy_beaver_4': (BUSY_BEAVER_4, '', None),
+    'left_expander': (LEFT_EXPANDER, '', 20000),
+}
+
+#
+#
+def createMachine(name):
+    """
+    Parses and returns the corpus machine with the given name
+    """
+    parser = TuringMachineParser()
+    parser.parseString(CORPUS[name][0])
+    return parser.create()
@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import errno
+import shutil
+import signal
+import socket
+import hashlib
+import argparse
+import tempfile
+import collections
+
+import tmlink
+import tmbatch
+import tmparser
+import tmgovernor
+
+__prog__ = 'tmdaemon'
+
+#
+# Local simulation daemon
+#
+# The daemon listens on a Unix socket and keeps a pool of pre-forked worker
+# processes. Every worker accepts connections on the shared socket and keeps
+# its own LRU cache of parsed and validated machines, keyed by the SHA-1 of
+# their source and parsed again when a file they import changes. Machines
+# given with --preload are parsed before forking, so all the workers start
+# with them already cached.
+#
+# Every source received is also saved in a directory shared by the workers,
+# so a machine_hash request served by a worker that never parsed that
+# machine parses it from there. The directory is removed when the daemon
+# stops.
+#
+# The protocol is one JSON object per line. A request is:
+#   {"machine": "<source>" | "machine_hash": "<sha1>",
+#    "words": [...], "max_steps": n, "timeout": s, "max_tape_cells": n,
+#    "tape": limit}
+# Only machine (or machine_hash) and words are mandatory. The response is one
+# tmbatch.runWord record per word, in order, followed by
+#   {"done": true, "count": n, "machine_hash": "<sha1>"}
+# If the request fails, the last line is {"done": false, "error": "<message>"}
+# instead. Records of invalid words have an error too, but never a done key.
+# A connection can send any amount of requests.
+#
+
+DEF_CACHE_SIZE = 64
+DEF_WORKERS = 4
+
+# Records written to the socket before flushing it
+FLUSH_RECORDS = 64
+
+
+#
+#
+class MachineCache:
+    """
+    LRU cache of TuringMachine instances keyed by the SHA-1 of their source
+
+    The cached machines remember the stamps of the files they import (see
+    tmlink.fileStamp), and are parsed again when any of them changes
+    """
+
+    #
+    #
+    def __init__(self, max_size=DEF_CACHE_SIZE, store_dir=None):
+        """
+        MachineCache(max_size=DEF_CACHE_SIZE, store_dir=None)
+        If store_dir is given, the sources are saved there and the machines
+        not in the cache are parsed from it, so caches of several processes
+        sharing store_dir know the same machines
+        """
+        self._machines = collections.OrderedDict()
+        self._max_size = max_size
+        self._store_dir = store_dir
+
+    #
+    #
+    def add(self, src):
+        """
+        Parses src if it's not cached yet. Returns (hash, machine)
+        """
+        key = hashlib.sha1(src).hexdigest()
+        entry = self._machines.pop(key, None)
+        if entry is None:
+            entry = _parseEntry(src)
+            self._store(key, src)
+        return key, self._insert(key, entry)
+
+    #
+    #
+    def get(self, key):
+        """
+        Returns the machine with the given hash, or None if it is neither
+        cached nor saved in the store directory
+        """
+        entry = self._machines.pop(key, None)
+        if entry is None:
+            src = self._load(key)
+            if src is None:
+                return None
+            entry = _parseEntry(src)
+        return self._insert(key, entry)
+
+    #
+    #
+    def _insert(self, key, entry):
+        """
+        Adds the (machine, source, import stamps) entry as the most recent
+        one, parsing it again if some import changed. Returns the machine
+        """
+        tm, src, stamps = entry
+        for fname, stamp in stamps.iteritems():
+            if tmlink.fileStamp(fname) != stamp:
+                entry = _parseEntry(src)
+                break
+        self._machines[key] = entry
+        if len(self._machines) > self._max_size:
+            self._machines.popitem(last=False)
+        return entry[0]
+
+    #
+    #
+    def _store(self, key, src):
+        """
+        Saves src in the store directory, if any. The file is renamed into
+        place so other processes never read it half written
+        """
+        if self._store_dir is None:
+            return
+        path = os.path.join(self._store_dir, key)
+        if os.path.exists(path):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self._store_dir)
+        try:
+            os.write(fd, src)
+        finally:
+            os.close(fd)
+        os.rename(tmp_path, path)
+
+    #
+    #
+    def _load(self, key):
+        """
+        Returns the source saved with the given hash or None
+        """
+        if self._store_dir is None or \
+           not isinstance(key, basestring) or \
+           len(key) != 40 or key.strip('0123456789abcdef'):
+            return None
+        try:
+            f = open(os.path.join(self._store_dir, key), 'r')
+        except IOError:
+            return None
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    #
+    #
+    def __len__(self):
+        return len(self._machines)
+
+
+#
+#
+class SimulationDaemon:
+    """
+    Pre-forking server, see the module comments
+    """
+
+    #
+    #
+    def __init__(self, path, workers=DEF_WORKERS, cache_size=DEF_CACHE_SIZE):
+        self._path = path
+        self._nworkers = workers
+        self._store_dir = tempfile.mkdtemp(prefix='tmdaemon-')
+        self._cache = MachineCache(cache_size, self._store_dir)
+        self._socket = None
+        self._children = set()
+        self._running = False
+
+    #
+    #
+    def preload(self, src):
+        """
+        Parses and caches src before the workers are forked. Returns its hash
+        """
+        return self._cache.add(src)[0]
+
+    #
+    #
+    def serveForever(self):
+        """
+        Binds the socket, forks the workers and keeps the pool full until a
+        SIGTERM or SIGINT is received
+        """
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self._path)
+        self._socket.listen(128)
+
+        self._running = True
+        signal.signal(signal.SIGTERM, self._onStop)
+        signal.signal(signal.SIGINT, self._onStop)
+
+        try:
+            while self._running:
+                while len(self._children) < self._nworkers:
+                    self._fork()
+                try:
+                    pid, status = os.wait()
+                    self._children.discard(pid)
+                except OSError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+        finally:
+            for pid in self._children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+            for pid in self._children:
+                try:
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+            self._socket.close()
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+            shutil.rmtree(self._store_dir, True)
+
+    #
+    #
+    def _onStop(self, signum, frame):
+        self._running = False
+
+    #
+    #
+    def _fork(self):
+        pid = os.fork()
+        if pid:
+            self._children.add(pid)
+            return
+
+        # Worker process
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            while True:
+                conn, addr = self._socket.accept()
+                try:
+                    self._serveConnection(conn)
+                except socket.error:
+                    pass
+                finally:
+                    conn.close()
+        finally:
+            os._exit(0)
+
+    #
+    #
+    def _serveConnection(self, conn):
+        fin = conn.makefile('r')
+        fout = conn.makefile('w')
+        try:
+            for line in fin:
+                if not line.strip():
+                    continue
+                try:
+                    self._serveRequest(json.loads(line), fout)
+                except Exception as e:
+                    _writeRecord(fout, {'done': False, 'error': str(e)})
+                fout.flush()
+        finally:
+            fin.close()
+            fout.close()
+
+    #
+    #
+    def _serveRequest(self, request, fout):
+        if 'machine' in request:
+            key, tm = self._cache.add(str(request['machine']))
+        else:
+            key = request.get('machine_hash')
+            tm = self._cache.get(key)
+            if tm is None:
+                raise Exception('Unknown machine %s' % key)
+
+        governor = tmgovernor.TuringMachineGovernor(
+                        request.get('max_steps'), request.get('timeout'),
+                        max_tape_cells=request.get('max_tape_cells'))
+        tape_limit = request.get('tape')
+
+        count = 0
+        for word in request.get('words', []):
+            _writeRecord(fout, tmbatch.runWord(tm, word, governor,
+                                               tape_limit))
+            count += 1
+            if count % FLUSH_RECORDS == 0:
+                fout.flush()
+
+        _writeRecord(fout, {'done': True, 'count': count,
+                            'machine_hash': key})
+
+
+#
+#
+def _parseEntry(src):
+    """
+    Returns the (machine, source, import stamps) cache entry of src
+    """
+    parser = tmparser.TuringMachineParser()
+    parser.parseString(src)
+    return (parser.create(), src, parser.getImportStamps())
+
+#
+#
+def _writeRecord(fout, record):
+    fout.write(json.dumps(record, sort_keys=True))
+    fout.write('\n')
+
+
+#
+#
+class SimulationClient:
+    """
+    Client of a SimulationDaemon. Keeps one connection open for all the
+    submitted requests
+    """
+
+    #
+    #
+    def __init__(self, path):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._fin = self._socket.makefile('r')
+        self._fout = self._socket.makefile('w')
+
+    #
+    #
+    def submit(self, words, machine=None, machine_hash=None, max_steps=None,
+               timeout=None, max_tape_cells=None, tape_limit=None):
+        """
+        Generator that yields the result record of every word as soon as it
+        is received, invalid words included. Raises an Exception if the
+        daemon reports that the request failed
+
+        One of machine (the source) or machine_hash must be given. The hash
+        is returned by the daemon on the last record of previous requests
+        """
+        request = {'words': list(words)}
+        if machine is not None:
+            request['machine'] = machine
+        else:
+            request['machine_hash'] = machine_hash
+        for k, v in (('max_steps', max_steps), ('timeout', timeout),
+                     ('max_tape_cells', max_tape_cells), ('tape', tape_limit)):
+            if v is not None:
+                request[k] = v
+
+        _writeRecord(self._fout, request)
+        self._fout.flush()
+
+        for line in self._fin:
+            record = json.loads(line)
+            if 'done' in record:
+                if not record['done']:
+                    raise Exception(record['error'])
+                self.last_machine_hash = record['machine_hash']
+                return
+            yield record
+
+        raise Exception('Connection closed by the daemon')
+
+    #
+    #
+    def close(self):
+        self._fin.close()
+        self._fout.close()
+        self._socket.close()
+
+
+#
+#
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog=__prog__,
+        description='Local Turing machine simulation daemon')
+    subparsers = argparser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser('serve', help='Start the daemon')
+    serve_parser.add_argument('socket', help='Unix socket path')
+    serve_parser.add_argument('--workers', type=int, default=DEF_WORKERS,
+                              help='Worker processes (default: %d)' %
+                                   DEF_WORKERS)
+    serve_parser.add_argument('--cache-size', type=int,
+                              default=DEF_CACHE_SIZE,
+                              help='Cached machines per worker (default: %d)'
+                                   % DEF_CACHE_SIZE)
+    serve_parser.add_argument('--preload', action='append', default=[],
+                              metavar='FILE',
+                              help='Machine source to parse before forking')
+
+    submit_parser = subparsers.add_parser('submit',
+                                          help='Submit words to a daemon')
+    submit_parser.add_argument('socket', help='Unix socket path')
+    submit_parser.add_argument('machine', help='Turing machine source file')
+    submit_parser.add_argument('words', nargs='?', default='-',
+                               help='File with one input word per line '
+                                    '(default: stdin)')
+    submit_parser.add_argument('--max-steps', type=int, default=None)
+    submit_parser.add_argument('--timeout', type=float, default=None)
+    submit_parser.add_argument('--max-tape-cells', type=int, default=None)
+    submit_parser.add_argument('--tape', type=int, default=None,
+                               metavar='LIMIT')
+
+    args = argparser.parse_args(argv)
+
+    if args.command == 'serve':
+        daemon = SimulationDaemon(args.socket, args.workers, args.cache_size)
+        for fname in args.preload:
+            f = open(fname, 'r')
+            try:
+                sys.stderr.write('%s: preloaded %s %s\n' %
+                                 (__prog__, fname, daemon.preload(f.read())))
+            finally:
+                f.close()
+        daemon.serveForever()
+        return 0
+
+    f = open(args.machine, 'r')
+    try:
+        src = f.read()
+    finally:
+        f.close()
+
+    fin = sys.stdin if args.words == '-' else open(args.words, 'r')
+    try:
+        words = list(tmbatch.readWords(fin))
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+
+    client = SimulationClient(args.socket)
+    try:
+        for record in client.submit(words, src, None, args.max_steps,
+                                    args.timeout, args.max_tape_cells,
+                                    args.tape):
+            _writeRecord(sys.stdout, record)
+    except Exception as e:
+        sys.stderr.write('%s: %s\n' % (__prog__, e))
+        return 1
+    finally:
+        client.close()
+    return 0
+
+#
+#
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+from tm import TuringMachine
+
+#
+# Finite automaton engine for machines that never move left
+#
+# If no transition moves the head to the left, the machine never reads a
+# cell it wrote after leaving it: on every cell it reads the input symbol,
+# does some stationary steps, and moves right or stops. So its language is
+# decided by a DFA over the tape symbols, whose transitions are the chains
+# of steps on one cell:
+#   - (state, symbol) -> next state after moving right, with the amount of
+#     steps of the chain as weight
+#   - (state, symbol) -> ACCEPT or REJECT if the chain ends at the halt
+#     state or at an undefined transition (following the isWordAccepted
+#     rules), or LOOP if it never leaves the cell
+# After the word the head only reads blanks, the result of every state on
+# the infinite blank tail is computed once as well.
+#
+# The weights keep the count of the steps of the original machine, so the
+# step limits give the same undecided results.
+#
+
+# Terminal results of the automaton transitions
+ACCEPT = -1
+REJECT = -2
+LOOP = -3
+
+_RESULTS = {ACCEPT: True, REJECT: False, LOOP: None}
+
+#
+#
+def isRightMoving(tm):
+    """
+    Returns True if no transition of tm moves the head to the left
+    """
+    return all(v[2] != TuringMachine.MOVE_LEFT
+               for v in tm.getTransitionFunction().itervalues())
+
+#
+#
+class FiniteAutomaton:
+    """
+    DFA equivalent to a machine that never moves left, see compileAutomaton
+    """
+
+    #
+    #
+    def __init__(self, tm):
+        """
+        Raises an Exception if tm moves left
+        """
+        if not isRightMoving(tm):
+            raise Exception('Machine moves the head to the left')
+
+        self.fingerprint = tm.getFingerprint()
+        self._encode = tm._encodeTape
+
+        trans_function = tm.getTransitionFunction()
+        hstate = tm.getHaltState()
+        accepting = tm._fstates
+        states = sorted(set([tm.getInitialState(), hstate]) |
+                        set(k[0] for k in trans_function) |
+                        set(v[0] for v in trans_function.itervalues()))
+        self._state_ids = dict((s, i) for i, s in enumerate(states))
+        self._start = self._state_ids[tm.getInitialState()]
+
+        symbols = tm.getTapeAlphabet()
+        codes = dict((s, tm.getSymbolCode(s)) for s in symbols)
+        ncodes = max(codes.itervalues()) + 1
+
+        # Rows of (next state id or terminal result, weight) by symbol code
+        self._table = []
+        for state in states:
+            row = [None] * ncodes
+            for sym, code in codes.iteritems():
+                row[code] = self._chain(trans_function, hstate, accepting,
+                                        state, sym)
+            self._table.append(row)
+
+        self._tails = self._blankTails(codes[tm.getBlankSymbol()])
+
+    #
+    #
+    def getStateCount(self):
+        """
+        Returns the amount of states of the automaton
+        """
+        return len(self._table)
+
+    #
+    #
+    def run(self, word, max_steps=None, state=None):
+        """
+        run(word, max_steps=None, state=None): (result, steps)
+
+        Returns the isWordAccepted result of word from state (by default the
+        initial state) with the given step limit, and the steps the machine
+        executes. Without limit a word that never stops is None with 0 steps
+
+        Raises an InvalidSymbolException if word has an invalid symbol
+        """
+        s = self._startId(state)
+        table = self._table
+        steps = 0
+        for c in self._encode(word):
+            s, w = table[s][c]
+            steps += w
+            if s < 0:
+                break
+        else:
+            s, w = self._tails[s]
+            steps += w
+
+        if s == LOOP:
+            if max_steps:
+                return None, max_steps
+            return None, 0
+        if max_steps and steps >= max_steps:
+            return None, max_steps
+        return _RESULTS[s], steps
+
+    #
+    #
+    def accepts(self, word, state=None):
+        """
+        Same as run(word, None, state)[0]
+        """
+        s = self._startId(state)
+        table = self._table
+        for c in self._encode(word):
+            s = table[s][c][0]
+            if s < 0:
+                return _RESULTS[s]
+        return _RESULTS[self._tails[s][0]]
+
+    #
+    #
+    def acceptsBatch(self, words, max_steps=None, state=None):
+        """
+        Returns the list of run(word, max_steps, state) results of words,
+        scanning all of them in one loop
+        """
+        start = self._startId(state)
+        table = self._table
+        tails = self._tails
+        encode = self._encode
+        results = []
+        for word in words:
+            s = start
+            steps = 0
+            for c in encode(word):
+                s, w = table[s][c]
+                steps += w
+                if s < 0:
+                    break
+            else:
+                s, w = tails[s]
+                steps += w
+            if s == LOOP or (max_steps and steps >= max_steps):
+                results.append(None)
+            else:
+                results.append(_RESULTS[s])
+        return results
+
+    #
+    #
+    def _startId(self, state):
+        if state is None:
+            return self._start
+        return self._state_ids[state]
+
+    #
+    #
+    def _chain(self, trans_function, hstate, accepting, state, sym):
+        """
+        Returns the (next state id or terminal result, weight) of the steps
+        from state reading sym until the head moves right
+        """
+        steps = 0
+        seen = set()
+        while True:
+            if state == hstate:
+                return (ACCEPT if state in accepting else REJECT, steps)
+            key = (state, sym)
+            if key not in trans_function:
+                return (ACCEPT if state in accepting else REJECT, steps)
+            if key in seen:
+                return (LOOP, steps)
+            seen.add(key)
+
+            state, sym, movement = trans_function[key]
+            steps += 1
+            if movement == TuringMachine.MOVE_RIGHT and state != hstate:
+                return (self._state_ids[state], steps)
+
+    #
+    #
+    def _blankTails(self, blank):
+        """
+        Returns the (terminal result, weight) of every state on the blank
+        tail after the word
+        """
+        tails = [None] * len(self._table)
+        for start in xrange(len(self._table)):
+            path = []
+            s = start
+            steps = 0
+            while s >= 0 and tails[s] is None and s not in path:
+                path.append(s)
+                s, w = self._table[s][blank]
+                steps += w
+            if s >= 0 and tails[s] is None:
+                s, steps = LOOP, 0
+            elif s >= 0:
+                s, steps = tails[s][0], steps + tails[s][1]
+
+            # Every state of the path has the same end, with less steps
+            for p in path:
+                tails[p] = (s, steps)
+                steps -= self._table[p][blank][1]
+        return tails
+
+#
+#
+def compileAutomaton(tm):
+    """
+    Returns the FiniteAutomaton of tm, or None if tm moves left
+    """
+    if not isRightMoving(tm):
+        return None
+    return FiniteAutomaton(tm)
+
+
+#
+# Test
+if __name__ == '__main__':
+    import time
+    import random
+    from tmparser import TuringMachineParser
+
+    # Binary words with an even amount of 1s, ending after a stationary
+    # check on the first blank
+    src = ('BLANK #\nHALT H\nINITIAL e\nFINAL H\n'
+           'e, 0 -> e, 0, >\n'
+           'e, 1 -> o, 1, >\n'
+           'o, 0 -> o, 0, >\n'
+           'o, 1 -> e, 1, >\n'
+           'e, # -> c, #, _\n'
+           'c, # -> H, #, _\n'
+           'o, # -> o, x, _\n')
+    parser = TuringMachineParser()
+    parser.parseString(src)
+    tm = parser.create()
+    automaton = compileAutomaton(tm)
+    print 'Automaton states:', automaton.getStateCount()
+
+    import tmenum
+    words = [tmenum.wordAt(['0', '1'], n, i)
+             for n in xrange(13) for i in xrange(2 ** n)]
+    random.seed(1)
+    random.shuffle(words)
+    for max_steps in (None, 20):
+        start = time.time()
+        expected = [tm.isWordAccepted(w, max_steps) for w in words]
+        machine_time = time.time() - start
+
+        start = time.time()
+        results = [automaton.run(w, max_steps)[0] for w in words]
+        dfa_time = time.time() - start
+
+        start = time.time()
+        batch = automaton.acceptsBatch(words, max_steps)
+        batch_time = time.time() - start
+
+        print 'Max steps %-4s same results: %s %s, speedup: %.1fx, ' \
+              'batch %.1fx' % (max_steps, results == expected,
+                               batch == expected, machine_time / dfa_time,
+                               machine_time / batch_time)
+
+    tm.setAutomaton(automaton)
+    print '0110 accepted?', tm.isWordAccepted('0110'), \
+        '010 accepted?', tm.isWordAccepted('010')
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import argparse
+import itertools
+import collections
+import multiprocessing
+
+import tmbatch
+import tmgovernor
+
+__prog__ = 'tmenum'
+
+#
+# Enumeration of the language of a machine
+#
+# All the words over the input alphabet are run in order of length, and
+# words of the same length in lexicographic order of the sorted alphabet.
+# The position of a word is (length, index), being index the number the word
+# represents in base len(alphabet). The space is split in chunks of
+# consecutive indexes, which are classified by the worker processes.
+#
+# The cursor is a JSON serializable dict with the position of the next word
+# and the counts of the current length, so an interrupted enumeration is
+# resumed from it without repeating or losing words.
+#
+
+DEF_MAX_STEPS = 10000
+CHUNK_WORDS = 1024
+
+# Amount of pending chunks per worker process
+PENDING_CHUNKS_PER_WORKER = 4
+
+# Word outcomes, undecided words are the ones stopped by the step limit
+ACCEPTED = tmbatch.ACCEPTED
+REJECTED = tmbatch.REJECTED
+UNDECIDED = 'undecided'
+
+_OUTCOME_CODES = {
+    tmbatch.ACCEPTED: 'a',
+    tmbatch.REJECTED: 'r',
+}
+_CODE_OUTCOMES = {
+    'a': ACCEPTED,
+    'r': REJECTED,
+    'u': UNDECIDED,
+}
+
+#
+#
+def wordAt(alphabet, length, index):
+    """
+    Returns the word at the given index among the words of that length over
+    the sorted list alphabet. Words are strings if all the symbols are
+    strings (separated by spaces if some has more than one char), tuples
+    otherwise
+    """
+    k = len(alphabet)
+    word = [None] * length
+    for i in xrange(length - 1, -1, -1):
+        index, d = divmod(index, k)
+        word[i] = alphabet[d]
+
+    if all(isinstance(s, str) for s in alphabet):
+        if any(len(s) > 1 for s in alphabet):
+            return ' '.join(word)
+        return ''.join(word)
+    return tuple(word)
+
+#
+#
+def _classifyChunk(tm, alphabet, governor, length, start, stop):
+    """
+    Returns a string with the outcome code of every word of the chunk
+    """
+    codes = []
+    for index in xrange(start, stop):
+        record = tmbatch.runWord(tm, wordAt(alphabet, length, index),
+                                 governor)
+        codes.append(_OUTCOME_CODES.get(record['outcome'], 'u'))
+    return ''.join(codes)
+
+
+#
+# Worker process state, inherited from the parent when it forks
+#
+_worker_args = None
+
+#
+#
+def _initWorker(tm, alphabet, governor):
+    global _worker_args
+    _worker_args = (tm, alphabet, governor)
+
+#
+#
+def _runWorkerChunk(chunk):
+    tm, alphabet, governor = _worker_args
+    return _classifyChunk(tm, alphabet, governor, *chunk)
+
+#
+#
+def _newCounts():
+    return {ACCEPTED: 0, REJECTED: 0, UNDECIDED: 0}
+
+
+#
+#
+class WordEnumerator:
+    """
+    Enumerates the words up to max_length symbols accepted, rejected and
+    undecided by a machine
+    """
+
+    #
+    #
+    def __init__(self, tm, max_length, max_steps=DEF_MAX_STEPS, workers=1,
+                 cursor=None, chunk_words=CHUNK_WORDS):
+        """
+        WordEnumerator(tm, max_length, max_steps=DEF_MAX_STEPS, workers=1,
+                       cursor=None, chunk_words=CHUNK_WORDS)
+            - max_steps: step limit of every word
+            - workers: amount of worker processes, they fork from the current
+              one so tm is not pickled (it can have an engine)
+            - cursor: value of getCursor() of a previous enumeration of the
+              same machine to resume it
+        """
+        if max_steps <= 0:
+            raise Exception('Max steps must be greater than 0')
+        if chunk_words <= 0:
+            raise Exception('Chunk words must be greater than 0')
+
+        self._tm = tm
+        self._alphabet = sorted(tm.getInputAlphabet())
+        self._max_length = max_length
+        self._max_steps = max_steps
+        self._workers = workers
+        self._chunk_words = chunk_words
+
+        if cursor is None:
+            self._cursor = {'fingerprint': tm.getFingerprint(),
+                            'max_steps': max_steps,
+                            'length': 0, 'index': 0,
+                            'counts': _newCounts()}
+        else:
+            if cursor['fingerprint'] != tm.getFingerprint():
+                raise Exception('Cursor belongs to another machine')
+            if cursor['max_steps'] != max_steps:
+                raise Exception('Cursor was created with max steps %d' %
+                                cursor['max_steps'])
+            self._cursor = {'fingerprint': cursor['fingerprint'],
+                            'max_steps': max_steps,
+                            'length': cursor['length'],
+                            'index': cursor['index'],
+                            'counts': dict(cursor['counts'])}
+
+    #
+    #
+    def getCursor(self):
+        """
+        Returns the position of the next word to enumerate, it can be saved
+        as JSON. The cursor is updated before yielding every record
+        """
+        cursor = dict(self._cursor)
+        cursor['counts'] = dict(cursor['counts'])
+        return cursor
+
+    #
+    #
+    def isFinished(self):
+        """
+        Returns True if all the words up to max_length were enumerated
+        """
+        return self._cursor['length'] > self._max_length
+
+    #
+    #
+    def getWordCount(self, length):
+        """
+        Returns the amount of words of the given length
+        """
+        return len(self._alphabet) ** length
+
+    #
+    #
+    def run(self):
+        """
+        Generator that yields a record for every word, in order:
+            {'word': word, 'length': n, 'outcome': ACCEPTED, REJECTED or
+             UNDECIDED}
+        and after the last word of every length the language counts:
+            {'length': n, 'accepted': a, 'rejected': r, 'undecided': u}
+        """
+        # Interrupted after the last word of a length
+        cursor = self._cursor
+        if cursor['index'] and \
+           cursor['index'] >= self.getWordCount(cursor['length']):
+            yield self._endLength(cursor['length'])
+
+        chunks = self._chunks()
+        if self._workers <= 1:
+            governor = tmgovernor.TuringMachineGovernor(self._max_steps)
+            results = ((chunk, _classifyChunk(self._tm, self._alphabet,
+                                              governor, *chunk))
+                       for chunk in chunks)
+            for record in self._records(results):
+                yield record
+            for record in self._emptyLengths():
+                yield record
+            return
+
+        governor = tmgovernor.TuringMachineGovernor(self._max_steps)
+        pool = multiprocessing.Pool(self._workers, _initWorker,
+                                    (self._tm, self._alphabet, governor))
+        try:
+            for record in self._records(self._poolResults(pool, chunks)):
+                yield record
+            for record in self._emptyLengths():
+                yield record
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    #
+    #
+    def _chunks(self):
+        """
+        Generator of the (length, start, stop) chunks from the cursor
+        """
+        length = self._cursor['length']
+        index = self._cursor['index']
+        while length <= self._max_length:
+            total = self.getWordCount(length)
+            for start in xrange(index, total, self._chunk_words):
+                yield (length, start, min(total, start + self._chunk_words))
+            length += 1
+            index = 0
+
+    #
+    #
+    def _poolResults(self, pool, chunks):
+        """
+        Generator of the (chunk, outcome codes) of the chunks, in order,
+        keeping a bounded amount of chunks in the pool
+        """
+        pending = collections.deque()
+        max_pending = self._workers * PENDING_CHUNKS_PER_WORKER
+
+        for chunk in itertools.islice(chunks, max_pending):
+            pending.append((chunk, pool.apply_async(_runWorkerChunk,
+                                                    (chunk,))))
+
+        while pending:
+            chunk, result = pending.popleft()
+            codes = result.get()
+            for next_chunk in itertools.islice(chunks, 1):
+                pending.append((next_chunk, pool.apply_async(_runWorkerChunk,
+                                                             (next_chunk,))))
+            yield chunk, codes
+
+    #
+    #
+    def _records(self, results):
+        """
+        Generator of the records of the (chunk, outcome codes) results
+        """
+        cursor = self._cursor
+
+        for chunk, codes in results:
+            length, start, stop = chunk
+            for index, code in itertools.izip(xrange(start, stop), codes):
+                outcome = _CODE_OUTCOMES[code]
+                cursor['counts'][outcome] += 1
+                cursor['index'] = index + 1
+                yield {'word': wordAt(self._alphabet, length, index),
+                       'length': length, 'outcome': outcome}
+
+            if stop == self.getWordCount(length):
+                yield self._endLength(length)
+
+    #
+    #
+    def _endLength(self, length):
+        """
+        Moves the cursor to the next length and returns the counts record
+        """
+        cursor = self._cursor
+        record = dict(cursor['counts'])
+        record['length'] = length
+        cursor['length'] = length + 1
+        cursor['index'] = 0
+        cursor['counts'] = _newCounts()
+        return record
+
+    #
+    #
+    def _emptyLengths(self):
+        """
+        Generator of the counts records of the lengths without words, only
+        possible with an empty input alphabet
+        """
+        while self._cursor['length'] <= self._max_length:
+            yield self._endLength(self._cursor['length'])
+
+
+#
+#
+def loadCursor(fname):
+    """
+    Returns the cursor saved at fname
+    """
+    f = open(fname, 'r')
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+#
+#
+def saveCursor(cursor, fname):
+    """
+    Saves cursor to fname
+    """
+    f = open(fname, 'w')
+    try:
+        json.dump(cursor, f, sort_keys=True)
+    finally:
+        f.close()
+
+#
+#
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog=__prog__,
+        description='Enumerates the words accepted by a Turing machine up to '
+                    'a given length and writes one JSON record per word')
+    argparser.add_argument('machine', help='Turing machine source file')
+    argparser.add_argument('max_length', type=int,
+                           help='Maximum word length')
+    argparser.add_argument('-o', '--output', default='-',
+                           help='JSONL output file (default: stdout)')
+    argparser.add_argument('--max-steps', type=int, default=DEF_MAX_STEPS,
+                           help='Maximum steps per word (default: %d)' %
+                                DEF_MAX_STEPS)
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='Amount of worker processes (default: 1)')
+    argparser.add_argument('--cursor', default=None, metavar='FILE',
+                           help='Resume from the cursor saved at FILE, if '
+                                'it exists, and save the cursor there when '
+                                'the enumeration stops')
+    argparser.add_argument('--counts-only', action='store_true',
+                           help='Only write the counts of every length')
+    argparser.add_argument('--accepted-only', action='store_true',
+                           help='Only write the accepted words and the '
+                                'counts of every length')
+
+    args = argparser.parse_args(argv)
+    if args.max_length < 0:
+        argparser.error('max_length must be greater or equal than 0')
+    if args.max_steps <= 0:
+        argparser.error('--max-steps must be greater than 0')
+    if args.workers <= 0:
+        argparser.error('--workers must be greater than 0')
+
+    try:
+        tm = tmbatch.loadMachine(args.machine)
+    except Exception as e:
+        sys.stderr.write('%s: error loading %s: %s\n' %
+                         (__prog__, args.machine, e))
+        return tmbatch.EXIT_MACHINE_ERROR
+
+    cursor = None
+    if args.cursor:
+        try:
+            cursor = loadCursor(args.cursor)
+        except IOError:
+            pass
+
+    try:
+        enumerator = WordEnumerator(tm, args.max_length, args.max_steps,
+                                    args.workers, cursor)
+    except Exception as e:
+        sys.stderr.write('%s: %s\n' % (__prog__, e))
+        return tmbatch.EXIT_USAGE_ERROR
+
+    fout = sys.stdout if args.output == '-' else open(args.output, 'a')
+    try:
+        for record in enumerator.run():
+            if 'word' in record:
+                if args.counts_only:
+                    continue
+                if args.accepted_only and record['outcome'] != ACCEPTED:
+                    continue
+            fout.write(json.dumps(record, sort_keys=True))
+            fout.write('\n')
+    except KeyboardInterrupt:
+        sys.stderr.write('%s: interrupted\n' % __prog__)
+    finally:
+        if fout is not sys.stdout:
+            fout.close()
+        if args.cursor:
+            saveCursor(enumerator.getCursor(), args.cursor)
+
+    return 0 if enumerator.isFinished() else 1
+
+#
+#
+if __name__ == '__main__':
+    sys.exit(main())
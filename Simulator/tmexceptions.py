@@ -32,3 +32,11 @@ class UnknownTransitionException(Exception):
     (state, symbol) tuple
     """
     pass
+
+#
+#
+class OutOfBoundsException(Exception):
+    """
+    Exception thrown when a step would move the head out of a bounded tape
+    """
+    pass
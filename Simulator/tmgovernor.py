@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+#
+#
+class TuringMachineGovernor:
+    """
+    Resource limits for TuringMachine.run and TuringMachine.isWordAccepted.
+    Every limit is optional:
+        - max_steps: maximum steps per run call
+        - timeout: maximum wall time in seconds per run call
+        - deadline: absolute wall time (as time.time()) to stop at
+        - max_tape_cells: maximum size of the internal tape
+        - max_tape_bytes: maximum memory used by the internal tape, as
+                          returned by TuringMachine.getTapeMemorySize
+
+    The limits are checked every check_interval steps, so the tape can exceed
+    its limits by at most check_interval cells before the run stops
+    """
+
+    DEF_CHECK_INTERVAL = 1024
+
+    #
+    #
+    def __init__(self, max_steps=None, timeout=None, deadline=None,
+                 max_tape_cells=None, max_tape_bytes=None,
+                 check_interval=DEF_CHECK_INTERVAL):
+        if check_interval <= 0:
+            raise Exception('Check interval must be greater than 0')
+
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_tape_cells = max_tape_cells
+        self.max_tape_bytes = max_tape_bytes
+        self.check_interval = check_interval
+
+    #
+    #
+    def getDeadline(self):
+        """
+        Returns the absolute wall time limit of a run starting now or None if
+        there are no time limits
+        """
+        deadline = self.deadline
+        if self.timeout:
+            run_deadline = time.time() + self.timeout
+            if deadline is None or run_deadline < deadline:
+                deadline = run_deadline
+        return deadline
+
+
+#
+# Test
+if __name__ == '__main__':
+    import tmcorpus
+    from tm import TuringMachine
+
+    tm = tmcorpus.createMachine('left_expander')
+
+    print 'Tape cells limit'
+    tm.setTape('')
+    governor = TuringMachineGovernor(max_tape_cells=5000, check_interval=100)
+    print 'Run status code:', tm.run(None, None, governor), \
+        '(expected %d)' % TuringMachine.END_MAX_TAPE_CELLS
+    print 'Tape size:', tm.getInternalTapeSize()
+
+    print 'Resume with a bigger tape memory limit'
+    governor = TuringMachineGovernor(max_tape_bytes=100000)
+    print 'Run status code:', tm.run(None, None, governor), \
+        '(expected %d)' % TuringMachine.END_MAX_TAPE_MEMORY
+    print 'Tape size:', tm.getInternalTapeSize(), \
+        'Tape bytes:', tm.getTapeMemorySize()
+
+    print 'Timeout'
+    governor = TuringMachineGovernor(timeout=0.1)
+    start = time.time()
+    print 'Run status code:', tm.run(None, None, governor), \
+        '(expected %d)' % TuringMachine.END_DEADLINE
+    print 'Elapsed:', time.time() - start
+
+    print 'Max steps'
+    tm.setTape('')
+    tm.resetExecutedStepsCounter()
+    governor = TuringMachineGovernor(max_steps=2500)
+    print 'Run status code:', tm.run(None, None, governor), \
+        '(expected %d)' % TuringMachine.END_MAX_STEPS
+    print 'Steps:', tm.getExecutedStepsCounter()
+    print 'Is word accepted?', tm.isWordAccepted('', None, governor)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import tmparser
+
+#
+# Linking of machine files called as subroutines
+#
+# A machine source can import other machine files and call them from any of
+# its states:
+#   IMPORT copy copy.tm
+#   CALL copy q3 -> q4
+# Entering q3 runs copy from its initial state, and when copy reaches its
+# halt state the caller continues at q4. Every call is linked by copying the
+# transitions of the called machine into the caller table:
+#   - The initial state of the called machine is renamed to the call state
+#   - The halt state of the called machine is renamed to the return state
+#   - Any other state s is renamed to '<call state>.<name>.<s>'
+# so the linked machine is a single flat transition table and a call costs
+# nothing at run time. The transitions of the call state all come from the
+# called machine (the parser rejects other ones), and the ones from its halt
+# state are dropped, since they never run, so the transitions of the return
+# state all come from the caller.
+#
+# Imported files are parsed and linked once, TuringMachineLibrary keeps them
+# with the modification time and size of every file they were built from.
+# Relinking a machine only parses again the files that changed and the ones
+# importing them.
+#
+
+#
+#
+class LinkedMachine:
+    """
+    Flat definition of a machine file with all its calls linked
+    """
+
+    #
+    #
+    def __init__(self, fname, transitions, istate, haltstate, blank, stamps):
+        """
+        LinkedMachine(fname, transitions, istate, haltstate, blank, stamps)
+            - transitions: dict (state, symbol) : (new_state, new_symbol,
+              movement)
+            - stamps: dict file name : fileStamp of all the files the
+              definition was built from
+        """
+        self.fname = fname
+        self.transitions = transitions
+        self.istate = istate
+        self.haltstate = haltstate
+        self.blank = blank
+        self.stamps = stamps
+
+    #
+    #
+    def isFresh(self):
+        """
+        Returns True if none of the files it was built from changed
+        """
+        for fname, stamp in self.stamps.iteritems():
+            if fileStamp(fname) != stamp:
+                return False
+        return True
+
+    #
+    #
+    def instantiate(self, name, call_state, return_state):
+        """
+        Returns the list of (state, symbol, new_state, new_symbol, movement)
+        transitions of a call to this machine, imported as name, from
+        call_state returning to return_state. The transitions from the halt
+        state are left out
+        """
+        prefix = '%s.%s.' % (call_state, name)
+        rename = {self.istate: call_state, self.haltstate: return_state}
+
+        def state(s):
+            r = rename.get(s)
+            if r is None:
+                r = rename[s] = prefix + str(s)
+            return r
+
+        return [(state(k[0]), k[1], state(v[0]), v[1], v[2])
+                for k, v in self.transitions.iteritems()
+                if k[0] != self.haltstate]
+
+
+#
+#
+class TuringMachineLibrary:
+    """
+    Cache of the linked machine files imported by the parsed sources. The
+    same library can be shared by many parsers
+    """
+
+    #
+    #
+    def __init__(self):
+        # Absolute file name -> LinkedMachine
+        self._machines = {}
+        # Files being loaded, to detect circular imports
+        self._loading = []
+
+        self.hits = 0
+        self.parses = 0
+
+    #
+    #
+    def load(self, fname):
+        """
+        Returns the LinkedMachine of the given file, parsing it and its
+        imports only if they changed since the last load
+
+        Can raise any of the TuringMachineParser exceptions
+        """
+        fname = os.path.abspath(fname)
+        machine = self._machines.get(fname)
+        if machine is not None and machine.isFresh():
+            self.hits += 1
+            return machine
+
+        if fname in self._loading:
+            raise Exception('Circular import of %s' % fname)
+
+        self._loading.append(fname)
+        try:
+            f = open(fname, 'r')
+            try:
+                src = f.read()
+            finally:
+                f.close()
+
+            parser = tmparser.TuringMachineParser(self)
+            try:
+                parser.parseString(src, os.path.dirname(fname))
+                machine = parser.link(fname)
+            except Exception as e:
+                raise Exception('%s: %s' % (fname, e))
+        finally:
+            self._loading.pop()
+
+        self.parses += 1
+        self._machines[fname] = machine
+        return machine
+
+    #
+    #
+    def clear(self):
+        """
+        Drops all the cached machines
+        """
+        self._machines.clear()
+
+    #
+    #
+    def __len__(self):
+        return len(self._machines)
+
+#
+#
+def fileStamp(fname):
+    """
+    Returns the (modification time, size) of fname, None if it does not
+    exist
+    """
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+_default_library = None
+
+#
+#
+def getDefaultLibrary():
+    """
+    Returns the library shared by the parsers created without one
+    """
+    global _default_library
+    if _default_library is None:
+        _default_library = TuringMachineLibrary()
+    return _default_library
+
+
+#
+# Test
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # Moves the head to the first blank at the right
+        f = open(os.path.join(tmpdir, 'right.tm'), 'w')
+        f.write('BLANK #\nHALT H\nINITIAL a\n'
+                'a, 1 -> a, 1, >\n'
+                'a, # -> H, #, _\n')
+        f.close()
+
+        # Appends a 1 to a unary number
+        f = open(os.path.join(tmpdir, 'inc.tm'), 'w')
+        f.write('BLANK #\nHALT H\nINITIAL s\n'
+                'IMPORT right right.tm\n'
+                'CALL right s -> w\n'
+                'w, # -> H, 1, _\n')
+        f.close()
+
+        # Adds 2 calling inc twice
+        src = ('BLANK #\nHALT HALT\nINITIAL 0\nFINAL HALT\n'
+               'IMPORT inc inc.tm\n'
+               'CALL inc 0 -> 1\n'
+               'CALL inc 1 -> HALT\n')
+
+        library = TuringMachineLibrary()
+        parser = tmparser.TuringMachineParser(library)
+        parser.parseString(src, tmpdir)
+        tm = parser.create()
+        for k, v in sorted(tm.getTransitionFunction().iteritems()):
+            print k, v
+        tm.setTape('111')
+        tm.setAtInitialState()
+        tm.run()
+        print 'Output:', ''.join(tm.getTapeIterator()).strip('#'), \
+            'Parses:', library.parses
+
+        parser.clean()
+        parser.parseString(src, tmpdir)
+        parser.create()
+        print 'Relinked, parses:', library.parses, 'hits:', library.hits
+
+        f = open(os.path.join(tmpdir, 'inc.tm'), 'a')
+        f.write('% touched\n')
+        f.close()
+        parser.clean()
+        parser.parseString(src, tmpdir)
+        parser.create()
+        print 'inc.tm changed, parses:', library.parses
+
+        # A call state can not have transitions of its own, before or after
+        # the call, even on symbols the called machine does not read
+        for extra in (src + '1, x -> HALT, x, _\n',
+                      src.replace('CALL inc 0', '0, x -> 0, x, >\nCALL inc 0')):
+            parser.clean()
+            try:
+                parser.parseString(extra, tmpdir)
+            except Exception as e:
+                print 'Error:', e
+
+        f = open(os.path.join(tmpdir, 'right.tm'), 'a')
+        f.write('IMPORT inc inc.tm\n')
+        f.close()
+        parser.clean()
+        try:
+            parser.parseString(src, tmpdir)
+        except Exception as e:
+            print 'Error:', e
+    finally:
+        shutil.rmtree(tmpdir)
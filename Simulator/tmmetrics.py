@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import collections
+
+#
+# Runtime metrics of long running simulations
+#
+# The engine metrics are sampled by TuringMachine.run between slices of
+# steps (see TuringMachine.setMetrics), so their cost does not depend on the
+# amount of steps. The batch metrics are added by tmbatch.runBatch for every
+# finished word. When the words run in worker processes only their steps
+# reach the metrics (addSteps), the tape gauges and the state changes are
+# not exported until a machine is sampled.
+#
+# The state changes are the exact amount of steps that entered a state
+# different from the one they left, counted by the machine and its engines
+# (see TuringMachine.getStateChangesCounter).
+#
+# getSnapshot() can be polled at any moment, and if a file name is given the
+# metrics are also written in the Prometheus text format every
+# write_interval seconds, for a local scraper (the node exporter textfile
+# collector for example).
+#
+
+DEF_SAMPLE_STEPS = 16384
+DEF_WRITE_INTERVAL = 10.0
+DEF_LATENCY_WINDOW = 1024
+
+# Minimum seconds between the updates of the rates
+RATE_WINDOW = 1.0
+
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+
+# (snapshot key, metric name, type, help) of the exported metrics
+_PROMETHEUS_METRICS = (
+    ('steps_total', 'tm_steps_total', 'counter',
+     'Steps executed'),
+    ('steps_per_second', 'tm_steps_per_second', 'gauge',
+     'Steps executed per second'),
+    ('tape_cells', 'tm_tape_cells', 'gauge',
+     'Cells of the internal tape'),
+    ('tape_bytes', 'tm_tape_bytes', 'gauge',
+     'Memory used by the internal tape'),
+    ('head_position', 'tm_head_position', 'gauge',
+     'Head position relative to the first input symbol'),
+    ('tape_first', 'tm_tape_first_cell', 'gauge',
+     'Leftmost cell of the internal tape'),
+    ('tape_last', 'tm_tape_last_cell', 'gauge',
+     'Rightmost cell of the internal tape'),
+    ('state_changes_total', 'tm_state_changes_total', 'counter',
+     'Steps that changed the state'),
+    ('state_changes_per_second', 'tm_state_changes_per_second', 'gauge',
+     'Steps that changed the state per second'),
+    ('queue_depth', 'tm_batch_queue_depth', 'gauge',
+     'Words waiting for a worker'),
+)
+
+#
+#
+class TuringMachineMetrics:
+    """
+    Engine and batch metrics. Attach it to the machines with
+    TuringMachine.setMetrics and/or pass it to tmbatch.runBatch
+    """
+
+    #
+    #
+    def __init__(self, fname=None, write_interval=DEF_WRITE_INTERVAL,
+                 sample_steps=DEF_SAMPLE_STEPS,
+                 latency_window=DEF_LATENCY_WINDOW):
+        """
+        TuringMachineMetrics(fname=None, write_interval=DEF_WRITE_INTERVAL,
+                             sample_steps=DEF_SAMPLE_STEPS,
+                             latency_window=DEF_LATENCY_WINDOW)
+            - fname: Prometheus text file, written every write_interval
+              seconds while sampling and by flush()
+            - sample_steps: steps between samples when the machine runs
+              without a governor, otherwise the governor check interval
+            - latency_window: amount of recent words used for the latency
+              quantiles
+        """
+        if sample_steps <= 0:
+            raise Exception('Sample steps must be greater than 0')
+        if latency_window <= 0:
+            raise Exception('Latency window must be greater than 0')
+
+        self.sample_steps = sample_steps
+        self._fname = fname
+        self._write_interval = write_interval
+
+        now = time.time()
+        self._start = now
+        self._last_write = now
+
+        self._steps = 0
+        self._state = None
+        # Not sampled yet
+        self._state_changes = None
+        self._tape = (None,) * 5
+        self._rate_mark = (now, 0, 0)
+        self._steps_rate = 0.0
+        self._changes_rate = 0.0
+
+        self._words = collections.Counter()
+        self._queue_depth = 0
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._latency_sum = 0.0
+
+    #
+    #
+    def sample(self, tm, nsteps, nchanges=0):
+        """
+        Adds a sample of tm after executing nsteps steps, nchanges of them
+        changing the state, since the previous one. Called by
+        TuringMachine.run
+        """
+        self._state = tm.getCurrentState()
+        self._state_changes = (self._state_changes or 0) + nchanges
+        first, last = tm.getTapeBounds()
+        self._tape = (tm.getInternalTapeSize(), tm.getTapeMemorySize(),
+                      tm.getHeadPosition() + first, first, last)
+        self.addSteps(nsteps)
+
+    #
+    #
+    def addSteps(self, nsteps):
+        """
+        Adds nsteps executed steps without sampling a machine, as the steps
+        of the words run by other processes
+        """
+        now = time.time()
+        self._steps += nsteps
+
+        changes = self._state_changes or 0
+        mark_time, mark_steps, mark_changes = self._rate_mark
+        elapsed = now - mark_time
+        if elapsed >= RATE_WINDOW:
+            self._steps_rate = (self._steps - mark_steps) / elapsed
+            self._changes_rate = (changes - mark_changes) / elapsed
+            self._rate_mark = (now, self._steps, changes)
+
+        self._checkWrite(now)
+
+    #
+    #
+    def addWord(self, outcome, latency):
+        """
+        Adds a finished batch word with its outcome and wall time in seconds
+        """
+        self._words[outcome] += 1
+        self._latencies.append(latency)
+        self._latency_sum += latency
+        self._checkWrite(time.time())
+
+    #
+    #
+    def setQueueDepth(self, depth):
+        """
+        Set the amount of batch words waiting for a worker
+        """
+        self._queue_depth = depth
+
+    #
+    #
+    def getSnapshot(self):
+        """
+        Returns a dict with the current value of all the metrics. The tape
+        metrics, the state and the state changes are None until a machine is
+        sampled
+        """
+        now = time.time()
+        tape_cells, tape_bytes, head, first, last = self._tape
+        steps_rate, changes_rate = self._steps_rate, self._changes_rate
+        # Averages until the first rate window ends
+        if self._rate_mark[0] == self._start and now > self._start:
+            steps_rate = self._steps / (now - self._start)
+            changes_rate = (self._state_changes or 0) / (now - self._start)
+        if self._state_changes is None:
+            changes_rate = None
+        snapshot = {
+            'timestamp': now,
+            'uptime': now - self._start,
+            'steps_total': self._steps,
+            'steps_per_second': steps_rate,
+            'tape_cells': tape_cells,
+            'tape_bytes': tape_bytes,
+            'head_position': head,
+            'tape_first': first,
+            'tape_last': last,
+            'state': self._state,
+            'state_changes_total': self._state_changes,
+            'state_changes_per_second': changes_rate,
+            'words_total': sum(self._words.itervalues()),
+            'words': dict(self._words),
+            'queue_depth': self._queue_depth,
+            'latency_count': sum(self._words.itervalues()),
+            'latency_sum': self._latency_sum,
+        }
+
+        latencies = sorted(self._latencies)
+        for q in LATENCY_QUANTILES:
+            key = 'latency_p%d' % round(q * 100)
+            if latencies:
+                snapshot[key] = latencies[min(len(latencies) - 1,
+                                              int(q * len(latencies)))]
+            else:
+                snapshot[key] = None
+        return snapshot
+
+    #
+    #
+    def formatPrometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+        """
+        snapshot = self.getSnapshot()
+        lines = []
+        for key, name, kind, text in _PROMETHEUS_METRICS:
+            if snapshot[key] is None:
+                continue
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            lines.append('%s %s' % (name, _formatValue(snapshot[key])))
+
+        lines.append('# HELP tm_batch_words_total Batch words by outcome')
+        lines.append('# TYPE tm_batch_words_total counter')
+        for outcome, n in sorted(snapshot['words'].iteritems()):
+            lines.append('tm_batch_words_total{outcome="%s"} %d' %
+                         (outcome, n))
+
+        lines.append('# HELP tm_batch_word_seconds Batch word wall time')
+        lines.append('# TYPE tm_batch_word_seconds summary')
+        for q in LATENCY_QUANTILES:
+            value = snapshot['latency_p%d' % round(q * 100)]
+            if value is not None:
+                lines.append('tm_batch_word_seconds{quantile="%s"} %s' %
+                             (q, _formatValue(value)))
+        lines.append('tm_batch_word_seconds_sum %s' %
+                     _formatValue(snapshot['latency_sum']))
+        lines.append('tm_batch_word_seconds_count %d' %
+                     snapshot['latency_count'])
+
+        return '\n'.join(lines) + '\n'
+
+    #
+    #
+    def writePrometheus(self, fname=None):
+        """
+        Writes the metrics to fname, by default the file given on creation.
+        The file is replaced atomically, so a scraper never reads it half
+        written
+        """
+        fname = fname or self._fname
+        if fname is None:
+            raise Exception('There is no metrics file')
+
+        tmp = fname + '.tmp'
+        f = open(tmp, 'w')
+        try:
+            f.write(self.formatPrometheus())
+        finally:
+            f.close()
+        os.rename(tmp, fname)
+
+    #
+    #
+    def flush(self):
+        """
+        Writes the metrics file now, if there is one
+        """
+        if self._fname is not None:
+            self._last_write = time.time()
+            self.writePrometheus()
+
+    #
+    #
+    def _checkWrite(self, now):
+        if self._fname is not None and \
+           now - self._last_write >= self._write_interval:
+            self._last_write = now
+            self.writePrometheus()
+
+#
+#
+def _formatValue(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+#
+# Test
+if __name__ == '__main__':
+    import tempfile
+    import tmcorpus
+
+    src, word, max_steps = tmcorpus.CORPUS['unary_addition']
+    tm = tmcorpus.createMachine('unary_addition')
+    for metrics in (None, TuringMachineMetrics(), None,
+                    TuringMachineMetrics()):
+        tm.setMetrics(metrics)
+        start = time.time()
+        for i in xrange(50):
+            tm.setTape(word)
+            tm.setAtInitialState()
+            tm.run(max_steps)
+        print 'Sampled' if metrics else 'Plain  ', time.time() - start
+
+    # Skips 0s without changing the state, alternates a and b on the 1s and
+    # stops at x through c: 1000 + 2 state changes
+    import tmcompiler
+    import tmoptimize
+    from tm import TuringMachine
+    R, N = TuringMachine.MOVE_RIGHT, TuringMachine.NON_MOVEMENT
+    alternate = {('a', '0'): ('a', '0', R), ('a', '1'): ('b', '1', R),
+                 ('b', '1'): ('a', '1', R), ('a', 'x'): ('c', 'x', N),
+                 ('b', 'x'): ('c', 'x', N), ('c', 'x'): ('H', 'x', N)}
+    word = '0' * 500 + '1' * 1000 + 'x'
+    for engine in ('plain', 'compiled', 'optimized', 'bounded'):
+        tm = TuringMachine('abcH', '01x', '01x#', alternate, 'a', 'H', 'H',
+                           '#')
+        if engine == 'compiled':
+            tm.setEngine(tmcompiler.compileMachine(tm))
+        elif engine == 'optimized':
+            tm.setEngine(tmoptimize.optimizeMachine(tm))
+        elif engine == 'bounded':
+            tm.setTapeBound(len(word))
+        metrics = TuringMachineMetrics(sample_steps=7)
+        tm.setMetrics(metrics)
+        tm.setTape(word)
+        tm.run()
+        snapshot = metrics.getSnapshot()
+        print '%-9s steps: %d state changes: %d' % \
+            (engine, snapshot['steps_total'], snapshot['state_changes_total'])
+
+    fd, fname = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        metrics = TuringMachineMetrics(fname, write_interval=0.0,
+                                       sample_steps=1000)
+        tm = tmcorpus.createMachine('palindrome')
+        tm.setMetrics(metrics)
+        for w in ['ab' * i + 'ba' * i for i in xrange(1, 60)]:
+            start = time.time()
+            accepted = tm.isWordAccepted(w)
+            metrics.addWord('accepted' if accepted else 'rejected',
+                            time.time() - start)
+
+        snapshot = metrics.getSnapshot()
+        for key in sorted(snapshot):
+            print '%-26s %s' % (key, snapshot[key])
+
+        f = open(fname, 'r')
+        print f.read()
+        f.close()
+    finally:
+        os.remove(fname)
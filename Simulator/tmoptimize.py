@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import tmexceptions
+from tm import TuringMachine
+
+#
+# Peephole optimization of stationary transitions
+#
+# A NON_MOVEMENT transition to (p, b) is always followed by the transition
+# of p reading b on the same cell, so both are fused into one transition
+# with the state, symbol and movement of the last one and a weight of 2
+# steps. Chains are followed until a transition that moves the head, the
+# halt state, an undefined transition or a stationary loop, so the states
+# that only forward the symbol they read are bypassed.
+#
+# The engine adds the weight of every fused transition to the executed steps
+# counter, and the state changes inside the chain to the state changes
+# counter, so the counters and the results are the same as without fusion.
+# When the step limit falls inside a fused chain, the engine executes the
+# remaining steps one by one.
+#
+
+#
+#
+def fuseTransitions(trans_function, hstate):
+    """
+    Returns the fused transition function of trans_function as a dict
+        (state, symbol) : (new_state, new_symbol, movement, weight, changes)
+    being weight the amount of original steps of every transition and
+    changes the amount of them that change the state
+    """
+    fused = {}
+    for key, value in trans_function.iteritems():
+        nstate, nsym, movement = value
+        weight = 1
+        changes = int(nstate != key[0])
+        chain = set([key])
+        while movement == TuringMachine.NON_MOVEMENT and nstate != hstate:
+            nkey = (nstate, nsym)
+            if nkey not in trans_function or nkey in chain:
+                break
+            chain.add(nkey)
+            nstate, nsym, movement = trans_function[nkey]
+            weight += 1
+            changes += int(nstate != nkey[0])
+        fused[key] = (nstate, nsym, movement, weight, changes)
+    return fused
+
+#
+#
+def getBypassedStates(trans_function, fused, istate):
+    """
+    Returns the set of states that are no longer entered with the fused
+    transitions
+    """
+    entered = set(v[0] for v in fused.itervalues())
+    entered.add(istate)
+    states = set(k[0] for k in trans_function)
+    states.update(v[0] for v in trans_function.itervalues())
+    return states - entered
+
+
+#
+#
+class OptimizedMachine:
+    """
+    Engine that runs the fused transitions of a machine, see
+    TuringMachine.setEngine
+    """
+
+    #
+    #
+    def __init__(self, tm):
+        self.fingerprint = tm.getFingerprint()
+
+        trans_function = tm.getTransitionFunction()
+        self.transitions = fuseTransitions(trans_function,
+                                           tm.getHaltState())
+        self.bypassed_states = getBypassedStates(trans_function,
+                                                 self.transitions,
+                                                 tm.getInitialState())
+
+        # Keyed as the machine reads its internal tape
+        code = tm.getSymbolCode
+        self._fused = dict(((k[0], code(k[1])),
+                            (v[0], code(v[1]), v[2], v[3], v[4]))
+                           for k, v in self.transitions.iteritems())
+        self._plain = dict(((k[0], code(k[1])),
+                            (v[0], code(v[1]), v[2], 1, int(v[0] != k[0])))
+                           for k, v in trans_function.iteritems())
+
+    #
+    #
+    def getFusedCount(self):
+        """
+        Returns the amount of transitions fused with the following ones
+        """
+        return sum(1 for v in self.transitions.itervalues() if v[3] > 1)
+
+    #
+    #
+    def __call__(self, tm, max_steps=None):
+        """
+        Same as tm.run(max_steps) for the machine this engine was created
+        from
+        """
+        if tm._tape is None:
+            raise tmexceptions.UnsetTapeException(
+                'Tape must be set before perform an step')
+
+        fused = self._fused
+        plain = self._plain
+        hstate = tm._hstate
+        blank = tm._blank_code
+        tape = tm._tape
+        head = tm._head
+        origin = tm._origin
+        state = tm._cur_state
+        limit = max_steps or sys.maxint
+        left = TuringMachine.MOVE_LEFT
+        right = TuringMachine.MOVE_RIGHT
+
+        n = 0
+        c = 0
+        end = TuringMachine.END_MAX_STEPS
+        try:
+            while n < limit:
+                if state == hstate:
+                    end = TuringMachine.END_HALT
+                    break
+                key = (state, tape[head])
+                state, sym, movement, weight, changes = fused[key]
+                if n + weight > limit:
+                    state, sym, movement, weight, changes = plain[key]
+                tape[head] = sym
+                if movement == left:
+                    if head == 0:
+                        tape.insert(0, blank)
+                        origin += 1
+                    else:
+                        head -= 1
+                elif movement == right:
+                    head += 1
+                    if head == len(tape):
+                        tape.append(blank)
+                n += weight
+                c += changes
+        except KeyError:
+            end = TuringMachine.END_UNKNOWN_TRANSITION
+        finally:
+            tm._head = head
+            tm._origin = origin
+            tm._cur_state = state
+            tm._nexecuted_steps += n
+            tm._nstate_changes += c
+        return end
+
+#
+#
+def optimizeMachine(tm):
+    """
+    Returns an OptimizedMachine engine for tm
+    """
+    return OptimizedMachine(tm)
+
+
+#
+# Test
+if __name__ == '__main__':
+    import time
+    import tmcorpus
+    from tmbuilder import TuringMachineBuilder
+
+    # Flips a binary word through chains of forwarding states, as generated
+    # by the tools that expand macros
+    CHAIN = 8
+    builder = TuringMachineBuilder()
+    builder.setBlankSymbol('#')
+    builder.setHaltState('H')
+    builder.setInitialState('s')
+    for sym, nsym in (('0', '1'), ('1', '0')):
+        builder.addTransition('s', sym, 'f%s0' % sym, nsym,
+                              TuringMachine.NON_MOVEMENT)
+        for i in xrange(CHAIN):
+            builder.addTransition('f%s%d' % (sym, i), nsym,
+                                  'f%s%d' % (sym, i + 1), nsym,
+                                  TuringMachine.NON_MOVEMENT)
+        builder.addTransition('f%s%d' % (sym, CHAIN), nsym, 's', nsym,
+                              TuringMachine.MOVE_RIGHT)
+    builder.addTransition('s', '#', 'H', '#', TuringMachine.NON_MOVEMENT)
+    chains = builder.create()
+    engine = optimizeMachine(chains)
+    print 'Fused transitions:', engine.getFusedCount(), \
+        'Bypassed states:', len(engine.bypassed_states)
+
+    word = '0110' * 2000
+    for max_steps in (None, 1, 7, 12345):
+        results = []
+        times = []
+        for e in (None, engine):
+            chains.setEngine(e)
+            chains.setTape(word)
+            chains.setAtInitialState()
+            chains.resetExecutedStepsCounter()
+            start = time.time()
+            end_cond = chains.run(max_steps)
+            times.append(time.time() - start)
+            results.append((end_cond, chains.getCurrentState(),
+                            chains.getHeadPosition(),
+                            chains.getExecutedStepsCounter(),
+                            ''.join(chains.getTapeIterator())))
+        print 'Max steps %-6s same result: %-5s steps: %-6d speedup: %.1fx' % \
+            (max_steps, results[0] == results[1], results[0][3],
+             times[0] / max(times[1], 1e-6))
+
+    for name in sorted(tmcorpus.CORPUS):
+        src, word, max_steps = tmcorpus.CORPUS[name]
+        results = []
+        for optimized in (False, True):
+            tm = tmcorpus.createMachine(name)
+            if optimized:
+                tm.setEngine(optimizeMachine(tm))
+            tm.setTape(word)
+            tm.setAtInitialState()
+            end_cond = tm.run(max_steps)
+            results.append((end_cond, tm.getCurrentState(),
+                            tm.getHeadPosition(),
+                            tm.getExecutedStepsCounter(),
+                            list(tm.getTapeIterator())))
+        print '%-20s same result: %s' % (name, results[0] == results[1])
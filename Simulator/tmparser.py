@@ -3,10 +3,13 @@
 from tm import TuringMachine
 from tmbuilder import TuringMachineBuilder
 
+import os
 import re
 import sys
 import logging
 
+import tmlink
+
 class TuringMachineParser:
     """
     Proportionate methods to parse a Turing Machine.
@@ -20,6 +23,18 @@ class TuringMachineParser:
         - final state: 'FINAL <state>'        
         - halt state: 'HALT <state>'
         - transition: '<state>, <symbol> -> <new_state>, <new_symbol>, <movement>
+        - import: 'IMPORT <name> <file>'
+        - call: 'CALL <name> <state> -> <return_state>'
+        
+    IMPORT makes the machine at file (relative to the directory of the
+    parsed source) callable as name. CALL links a call to it from state,
+    returning to return_state when the called machine halts (see tmlink).
+    The blank symbol must be defined before any call, and a state that
+    calls a machine can not have transitions of its own, before or after the
+    call
+        
+    Symbols are one char, or several chars without whitespace nor commas.
+    States and symbols are interned
         
     It is not possible to add comments at the end of any line, comments must
     be on a standalone line
@@ -29,27 +44,53 @@ class TuringMachineParser:
     MOVE_LEFT = '<'
     NON_MOVEMENT = '_'    
     
+    # Several chars without whitespace nor commas, or any single char
+    SYMBOL_RE = '[^\s,]{2,}|.'
+    
     #
     #
-    def __init__(self):
+    def __init__(self, library=None):
+        """
+        TuringMachineParser(library=None)
+            - library: tmlink.TuringMachineLibrary of the imported files, by
+              default the one shared by all the parsers
+        """
         self._builder = TuringMachineBuilder()        
+        if library is None:
+            library = tmlink.getDefaultLibrary()
+        self._library = library
+        self._base_dir = None
+        # name -> LinkedMachine
+        self._imports = {}
+        self._call_states = set()
+        # States with transitions defined by transition lines
+        self._transition_states = set()
                 
         # Regular expresions
         self._comment_line_re = re.compile('[ ]*%\s*') 
-        self._blank_symbol_re = re.compile('[\s]*BLANK[\s]+(?P<symbol>.)\s*$')
+        self._blank_symbol_re = re.compile('[\s]*BLANK[\s]+'
+                                           '(?P<symbol>%s)\s*$' %
+                                           TuringMachineParser.SYMBOL_RE)
         self._halt_state_re = re.compile('[ ]*HALT[ ]+(?P<state>\w+)\s*$')
         self._final_state_re = re.compile('[ ]*FINAL[ ]+(?P<state>\w+)\s*$')
         self._inital_state_re = re.compile('[ ]*INITIAL[ ]+(?P<state>\w)\s*$'
         )
         self._transition_re = re.compile('\s*(?P<state>\w+)\s*,\s*'
-                                         '(?P<symbol>.)\s*->\s*'
+                                         '(?P<symbol>%s)\s*->\s*'
                                          '(?P<nstate>\w+)\s*,\s*'
-                                         '(?P<nsymbol>.)\s*,\s*'
+                                         '(?P<nsymbol>%s)\s*,\s*'
                                          '(?P<movement>[%s%s%s])\s*$' %
-                                         (TuringMachineParser.MOVE_LEFT,
+                                         (TuringMachineParser.SYMBOL_RE,
+                                          TuringMachineParser.SYMBOL_RE,
+                                          TuringMachineParser.MOVE_LEFT,
                                           TuringMachineParser.MOVE_RIGHT,
                                           TuringMachineParser.NON_MOVEMENT)
                                         )
+        self._import_re = re.compile('[ ]*IMPORT[ ]+(?P<name>\w+)[ ]+'
+                                     '(?P<fname>\S+)\s*$')
+        self._call_re = re.compile('[ ]*CALL[ ]+(?P<name>\w+)[ ]+'
+                                   '(?P<state>\w+)\s*->\s*'
+                                   '(?P<rstate>\w+)\s*$')
                                         
                                          
     #
@@ -59,19 +100,24 @@ class TuringMachineParser:
         Cleans all the previos parsed data
         """
         self._builder.clean()
+        self._imports = {}
+        self._call_states = set()
+        self._transition_states = set()
          
     #
     #
-    def parseString(self, string_data):
+    def parseString(self, string_data, base_dir=None):
         """
         Parses the given string an add the information to the Turing Machine
-        builder
+        builder. Imported files are relative to base_dir, by default the
+        current directory
         
         Raise an exception if the given data is not an string
         """
         if type(string_data) != str:
             raise Exception('Expected an string')
         
+        self._base_dir = base_dir or os.getcwd()
         self._parse(string_data.splitlines())
         
         
@@ -93,9 +139,34 @@ class TuringMachineParser:
                     if not self._parseInitialState(data):
                         if not self._parseBlankSymbol(data):
                             if not self._parseHaltState(data):                                                
-                                raise Exception('Unrecognized pattern: %s' 
-                                                % data)
+                                if not self._parseCall(data):
+                                    if not self._parseImport(data):
+                                        raise Exception(
+                                            'Unrecognized pattern: %s' % data)
                                                 
+    #
+    #
+    def parseBreakpoint(self, data):
+        """
+        Returns the (kind, value) breakpoint (see TuringMachine.addBreakpoint)
+        of the given source line, or None if it does not define one:
+            - A transition line breaks before firing that transition
+            - An INITIAL, FINAL or HALT line breaks when entering that state
+        The parsed data is not modified
+        """
+        mt = self._transition_re.match(data)
+        if mt:
+            return (TuringMachine.BREAK_TRANSITION,
+                    (mt.group('state'), mt.group('symbol')))
+            
+        for state_re in (self._inital_state_re, self._final_state_re,
+                         self._halt_state_re):
+            ms = state_re.match(data)
+            if ms:
+                return (TuringMachine.BREAK_STATE, ms.group('state'))
+                
+        return None
+        
     #
     #
     def create(self):
@@ -106,6 +177,48 @@ class TuringMachineParser:
         Can raise any of the TuringMachineBuilder an TuringMachine exceptions
         """
         return self._builder.create()
+        
+    #
+    #
+    def getImportStamps(self):
+        """
+        Returns a dict file name : tmlink.fileStamp of all the files imported
+        by the parsed data, directly or not
+        """
+        stamps = {}
+        for machine in self._imports.itervalues():
+            stamps.update(machine.stamps)
+        return stamps
+        
+    #
+    #
+    def link(self, fname=None):
+        """
+        Returns the parsed data as a tmlink.LinkedMachine, to be called from
+        other machines. fname is the file it was read from, if any
+        
+        Raises an Exception if the initial state, the halt state or the
+        blank symbol remain unset
+        """
+        if not self._builder.hasInitialState():
+            raise Exception('It is necessary to specify an initial state')
+        if not self._builder.hasBlankSymbol():
+            raise Exception('It is necessary to specify the blank symbol')
+        if not self._builder.hasHaltState():
+            raise Exception('It is necessary to specify the halt state')
+        if self._builder.getInitialState() == self._builder.getHaltState():
+            raise Exception('The initial state can not be the halt state')
+        
+        stamps = self.getImportStamps()
+        if fname is not None:
+            stamps[fname] = tmlink.fileStamp(fname)
+            
+        return tmlink.LinkedMachine(fname,
+                                    self._builder.getTransitionFunction(),
+                                    self._builder.getInitialState(),
+                                    self._builder.getHaltState(),
+                                    self._builder.getBlankSymbol(),
+                                    stamps)
                                                 
     #
     #
@@ -131,7 +244,7 @@ class TuringMachineParser:
             if self._builder.hasBlankSymbol():
                 raise Exception('Blank symbol can only be defined once')                            
             
-            self._builder.setBlankSymbol( mbs.group('symbol') )
+            self._builder.setBlankSymbol( intern(mbs.group('symbol')) )
             return True
             
         return False
@@ -204,14 +317,77 @@ class TuringMachineParser:
             elif move_sym == TuringMachineParser.MOVE_RIGHT:
                 move = TuringMachine.MOVE_RIGHT
             
-            self._builder.addTransition(mt.group('state'),
-                                        mt.group('symbol'),
-                                        mt.group('nstate'),
-                                        mt.group('nsymbol'),
+            state = intern(mt.group('state'))
+            if state in self._call_states:
+                raise Exception('State %s calls a machine, it can not have '
+                                'other transitions' % state)
+            self._transition_states.add(state)
+            self._builder.addTransition(state,
+                                        intern(mt.group('symbol')),
+                                        intern(mt.group('nstate')),
+                                        intern(mt.group('nsymbol')),
                                         move)            
             return True
             
         return False
+        
+    #
+    #
+    def _parseImport(self, data):
+        """
+        Returns True if the given data is an import expresion, otherwise
+        returns False
+        """
+        mi = self._import_re.match(data)
+        if mi:
+            name = mi.group('name')
+            if name in self._imports:
+                raise Exception('Machine %s is already imported' % name)
+                
+            fname = os.path.join(self._base_dir, mi.group('fname'))
+            self._imports[name] = self._library.load(fname)
+            return True
+            
+        return False
+        
+    #
+    #
+    def _parseCall(self, data):
+        """
+        Returns True if the given data is a call expresion, otherwise
+        returns False
+        
+        The transitions of the called machine are added right now
+        """
+        mc = self._call_re.match(data)
+        if mc:
+            name = mc.group('name')
+            state = mc.group('state')
+            machine = self._imports.get(name)
+            if machine is None:
+                raise Exception('Unknown machine %s' % name)
+            if not self._builder.hasBlankSymbol():
+                raise Exception('Blank symbol must be defined before a call')
+            if machine.blank != self._builder.getBlankSymbol():
+                raise Exception('Machine %s has a different blank symbol' %
+                                name)
+            if state in self._call_states:
+                raise Exception('State %s already calls a machine' % state)
+            if state in self._transition_states:
+                raise Exception('State %s has transitions, it can not call a '
+                                'machine' % state)
+                
+            transitions = machine.instantiate(name, state, mc.group('rstate'))
+            for t in transitions:
+                if self._builder.hasTransition(t[0], t[1]):
+                    raise Exception('Call to %s redefines the transition '
+                                    '%s, %s' % (name, t[0], t[1]))
+            self._builder.addTransitions(transitions)
+                
+            self._call_states.add(state)
+            return True
+            
+        return False
                                 
     #
     #
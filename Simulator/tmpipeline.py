@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+
+import tmbatch
+import tmgovernor
+import tmexceptions
+
+__prog__ = 'tmpipeline'
+
+#
+# Chained machine pipelines
+#
+# Every word runs through the stages in order: the tape left by a stage,
+# without the blanks at both ends, is the input of the next one with the
+# head at its first symbol. A stage that stops by halt state or undefined
+# transition passes its tape on, whatever its final state; the word is
+# accepted or rejected by the last stage. A stage stopped by a limit or
+# an output tape with symbols unknown to the next stage ends the word.
+#
+# The tape is handed over as the internal cells of the machine
+# (TuringMachine.detachTape and setTapeCells). When both machines use the
+# same codes for the symbols the cells are moved as they are, without
+# copying nor validating them, otherwise they are translated once at C
+# speed, or decoded and encoded again as the last resort.
+#
+# With concurrent stages every stage runs in its own worker process and the
+# words flow through queues between them, so a stage works on a word while
+# the next one works on the previous word.
+#
+
+# Amount of words in the pipeline per stage when the stages are concurrent
+PENDING_WORDS_PER_STAGE = 16
+
+#
+#
+class TapeHandoff:
+    """
+    Converts the cells detached from a machine to the symbol codes of the
+    next one
+    """
+
+    # Handoff modes
+    DIRECT = 'direct'
+    TRANSLATE = 'translate'
+    DECODE = 'decode'
+
+    #
+    #
+    def __init__(self, src, dst):
+        self._dst = dst
+        # Code -> symbol of the source machine
+        self._symbols = dict((src.getSymbolCode(s), s)
+                             for s in src.getTapeAlphabet())
+        dst_alphabet = dst.getTapeAlphabet()
+        self._unknown = [c for c, s in self._symbols.iteritems()
+                         if s not in dst_alphabet]
+
+        same_codes = all(dst.getSymbolCode(s) == c
+                         for c, s in self._symbols.iteritems()
+                         if s in dst_alphabet)
+        if same_codes and src._array_type == dst._array_type:
+            self.mode = TapeHandoff.DIRECT
+        elif src.isTapeCompact() and dst.isTapeCompact():
+            self.mode = TapeHandoff.TRANSLATE
+            table = bytearray(xrange(256))
+            for c, s in self._symbols.iteritems():
+                if s in dst_alphabet:
+                    table[c] = dst.getSymbolCode(s)
+            self._table = str(table)
+        else:
+            self.mode = TapeHandoff.DECODE
+
+    #
+    #
+    def convert(self, cells):
+        """
+        Returns cells with the codes of the destination machine, the same
+        cells in the direct mode
+
+        Raises an InvalidSymbolException if cells has a symbol unknown to
+        the destination machine
+        """
+        if self.mode == TapeHandoff.DECODE:
+            return self._dst._encodeTape([self._symbols[c] for c in cells])
+
+        for c in self._unknown:
+            if c in cells:
+                raise tmexceptions.InvalidSymbolException(
+                    'Invalid tape symbol %s' % str(self._symbols[c]))
+        if self.mode == TapeHandoff.DIRECT:
+            return cells
+        return cells.translate(self._table)
+
+
+#
+#
+class TuringMachinePipeline:
+    """
+    Runs words through a chain of machines, see runWord and run
+    """
+
+    #
+    #
+    def __init__(self, machines, governor=None, tape_limit=None):
+        """
+        TuringMachinePipeline(machines, governor=None, tape_limit=None)
+            - machines: list of TuringMachine, the stages in order
+            - governor: tmgovernor.TuringMachineGovernor with the limits of
+              every stage
+            - tape_limit: if it's not None the records include the tape of
+              the last stage run, as in tmbatch.runWord
+        """
+        if not machines:
+            raise Exception('A pipeline needs at least one machine')
+
+        self._machines = list(machines)
+        self._governor = governor
+        self._tape_limit = tape_limit
+        self._handoffs = [TapeHandoff(a, b) for a, b in
+                          zip(self._machines, self._machines[1:])]
+
+    #
+    #
+    def getHandoffModes(self):
+        """
+        Returns the list of TapeHandoff modes between consecutive stages
+        """
+        return [h.mode for h in self._handoffs]
+
+    #
+    #
+    def runWord(self, word):
+        """
+        runWord(word): dict
+
+        Runs word through all the stages and returns a result record with
+        the keys of tmbatch.runWord and:
+            - stage: index of the stage that ended the word
+            - stage_steps: list of the steps executed by every stage run
+        The steps and time are the sum of all the stages
+        """
+        record = _newRecord(word)
+        payload = word
+        for index in xrange(len(self._machines)):
+            payload = self._runStage(index, record, payload)
+            if 'outcome' in record:
+                break
+        return record
+
+    #
+    #
+    def run(self, words, concurrent=False):
+        """
+        Generator that yields the runWord record of every word of the
+        iterable words, in the same order
+
+        If concurrent is True every stage runs in a worker process, forked
+        from the current one, with at most PENDING_WORDS_PER_STAGE words per
+        stage in the pipeline
+        """
+        if not concurrent or len(self._machines) == 1:
+            for word in words:
+                yield self.runWord(word)
+            return
+
+        nstages = len(self._machines)
+        queues = [multiprocessing.Queue() for i in xrange(nstages + 1)]
+        workers = [multiprocessing.Process(target=_runStageWorker,
+                                           args=(self, i, queues[i],
+                                                 queues[i + 1]))
+                   for i in xrange(nstages)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+
+        try:
+            words = iter(words)
+            pending = 0
+            for word in itertools.islice(words,
+                                         PENDING_WORDS_PER_STAGE * nstages):
+                queues[0].put((_newRecord(word), word))
+                pending += 1
+
+            while pending:
+                item = queues[-1].get()
+                pending -= 1
+                if isinstance(item, Exception):
+                    raise item
+                for word in itertools.islice(words, 1):
+                    queues[0].put((_newRecord(word), word))
+                    pending += 1
+                yield item[0]
+
+            queues[0].put(None)
+            queues[-1].get()
+            for w in workers:
+                w.join()
+        finally:
+            for w in workers:
+                if w.is_alive():
+                    w.terminate()
+                    w.join()
+
+    #
+    #
+    def _runStage(self, index, record, payload):
+        """
+        Runs the stage index with payload, the word for the first stage and
+        the cells of the previous one for the others, and updates record.
+        Returns the cells for the next stage, or None if the word ended
+        """
+        tm = self._machines[index]
+        start = time.time()
+        try:
+            if index == 0:
+                tm.setTape(payload)
+            else:
+                tm.setTapeCells(self._handoffs[index - 1].convert(payload))
+        except tmexceptions.InvalidSymbolException as e:
+            record['outcome'] = tmbatch.INVALID
+            record['stage'] = index
+            record['error'] = str(e)
+            record['time'] += time.time() - start
+            return None
+
+        tm.setAtInitialState()
+        tm.resetExecutedStepsCounter()
+        outcome = tmbatch.getOutcome(tm, tm.run(None, None, self._governor))
+        steps = tm.getExecutedStepsCounter()
+        record['steps'] += steps
+        record['stage_steps'].append(steps)
+
+        cells = None
+        if index == len(self._machines) - 1 or \
+           outcome not in (tmbatch.ACCEPTED, tmbatch.REJECTED):
+            record['outcome'] = outcome
+            record['stage'] = index
+            if self._tape_limit is not None:
+                record['tape'] = tmbatch.trimmedTape(tm, self._tape_limit)
+        else:
+            cells = tm.detachTape()
+        record['time'] += time.time() - start
+        return cells
+
+#
+#
+def _newRecord(word):
+    return {'word': word, 'steps': 0, 'stage_steps': [], 'time': 0.0}
+
+#
+#
+def _runStageWorker(pipeline, index, inq, outq):
+    """
+    Worker process of the stage index. Runs the (record, payload) items of
+    inq and puts the results on outq, until it gets None
+    """
+    while True:
+        item = inq.get()
+        if item is None:
+            outq.put(None)
+            return
+        if not isinstance(item, Exception):
+            record, payload = item
+            if 'outcome' not in record:
+                try:
+                    payload = pipeline._runStage(index, record, payload)
+                except Exception as e:
+                    item = Exception('Stage %d, %s' % (index, e))
+                else:
+                    item = (record, payload)
+        outq.put(item)
+
+#
+#
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog=__prog__,
+        description='Runs a list of words through a chain of Turing '
+                    'machines, the output tape of every machine is the '
+                    'input of the next one, and writes one JSON result per '
+                    'word')
+    argparser.add_argument('machines', nargs='+',
+                           help='Turing machine source files, in order')
+    argparser.add_argument('-w', '--words', default='-',
+                           help='File with one input word per line '
+                                '(default: stdin)')
+    argparser.add_argument('-o', '--output', default='-',
+                           help='JSONL output file (default: stdout)')
+    argparser.add_argument('--max-steps', type=int, default=None,
+                           help='Maximum steps per word and stage')
+    argparser.add_argument('--timeout', type=float, default=None,
+                           help='Maximum wall time per word and stage in '
+                                'seconds')
+    argparser.add_argument('--max-tape-cells', type=int, default=None,
+                           help='Maximum tape size per word and stage')
+    argparser.add_argument('--tape', type=int, default=None, metavar='LIMIT',
+                           help='Include the trimmed output tape cut to LIMIT '
+                                'symbols (0 = whole tape)')
+    argparser.add_argument('--concurrent', action='store_true',
+                           help='Run every stage in its own worker process')
+
+    args = argparser.parse_args(argv)
+    if args.max_steps is not None and args.max_steps <= 0:
+        argparser.error('--max-steps must be greater than 0')
+    if args.timeout is not None and args.timeout <= 0:
+        argparser.error('--timeout must be greater than 0')
+    if args.max_tape_cells is not None and args.max_tape_cells <= 0:
+        argparser.error('--max-tape-cells must be greater than 0')
+
+    machines = []
+    for fname in args.machines:
+        try:
+            machines.append(tmbatch.loadMachine(fname))
+        except Exception as e:
+            sys.stderr.write('%s: error loading %s: %s\n' %
+                             (__prog__, fname, e))
+            return tmbatch.EXIT_MACHINE_ERROR
+
+    governor = tmgovernor.TuringMachineGovernor(args.max_steps, args.timeout,
+                                                max_tape_cells=args.max_tape_cells)
+    pipeline = TuringMachinePipeline(machines, governor, args.tape)
+
+    fin = sys.stdin if args.words == '-' else open(args.words, 'r')
+    fout = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    exit_code = tmbatch.EXIT_ALL_ACCEPTED
+    try:
+        for record in pipeline.run(tmbatch.readWords(fin), args.concurrent):
+            fout.write(json.dumps(record, sort_keys=True))
+            fout.write('\n')
+            exit_code = max(exit_code,
+                            tmbatch.getExitCode(record['outcome']))
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+
+    return exit_code
+
+
+#
+# Test
+if __name__ == '__main__' and len(sys.argv) > 1:
+    sys.exit(main())
+
+if __name__ == '__main__':
+    import tmcorpus
+
+    # Adds 3 to binary numbers with three increment stages
+    stages = [tmcorpus.createMachine('binary_increment') for i in xrange(3)]
+    pipeline = TuringMachinePipeline(stages, tape_limit=0)
+    print 'Handoffs:', pipeline.getHandoffModes()
+    for word in ('0', '101', '111', '1x1'):
+        record = pipeline.runWord(word)
+        print '%-4s -> %-5s %-8s stage steps: %s' % \
+            (word, record.get('tape'), record['outcome'],
+             record['stage_steps'])
+
+    words = [bin(i)[2:] for i in xrange(2000)]
+    sequential = list(pipeline.run(words))
+    concurrent = list(pipeline.run(words, concurrent=True))
+    strip = lambda r: dict((k, v) for k, v in r.iteritems() if k != 'time')
+    print 'Concurrent same results:', \
+        [strip(r) for r in sequential] == [strip(r) for r in concurrent], \
+        'all +3:', all(int(r['tape'], 2) == int(r['word'], 2) + 3
+                       for r in sequential)
+
+    # Handoff of a long tape against copying it through setTape
+    word = '10' * 500000
+    first, second = stages[:2]
+    start = time.time()
+    for i in xrange(5):
+        first.setTape(word)
+        first.run()
+        second.setTape(list(first.getTapeIterator()))
+    copy_time = time.time() - start
+    start = time.time()
+    for i in xrange(5):
+        first.setTape(word)
+        first.run()
+        second.setTapeCells(pipeline._handoffs[0].convert(first.detachTape()))
+    handoff_time = time.time() - start
+    print 'Tape of %d cells, handoff speedup: %.1fx' % \
+        (len(word), copy_time / handoff_time)
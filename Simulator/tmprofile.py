@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+import array
+
+from tm import TuringMachine
+
+#
+#
+class TuringMachineProfiler:
+    """
+    Collects execution counters of a TuringMachine. Pass it to
+    TuringMachine.run(max_steps, profiler) to count:
+        - Firings of every (state, symbol) transition
+        - Steps executed from every state
+        - Head visits over tape regions of region_size cells
+
+    Counters are accumulated over all the profiled runs, so profiling a set of
+    words with the same profiler gives the transition coverage of that
+    corpus. Use reset() to start again
+    """
+
+    HEATMAP_CHARS = ' .:-=+*#%@'
+
+    #
+    #
+    def __init__(self, tm, region_size=16):
+        """
+        TuringMachineProfiler(tm, region_size=16)
+            - tm: TuringMachine to profile
+            - region_size: cells per heatmap region, must be a power of 2
+        """
+        if region_size <= 0 or region_size & (region_size - 1):
+            raise Exception('Region size must be a power of 2')
+
+        self.transitions = sorted(tm.getTransitionFunction().iteritems())
+        # Keyed as the machine reads its internal tape
+        self.trans_index = dict(((t[0][0], tm.getSymbolCode(t[0][1])), i)
+                                for i, t in enumerate(self.transitions))
+        self.region_size = region_size
+        self.region_shift = region_size.bit_length() - 1
+
+        self.reset()
+
+    #
+    #
+    def reset(self):
+        """
+        Set all the counters to 0
+        """
+        self.hits = array.array('L', [0] * len(self.transitions))
+        # Regions at the right (including 0) and at the left of the origin
+        self.right_regions = array.array('L')
+        self.left_regions = array.array('L')
+
+    #
+    #
+    def getTotalSteps(self):
+        """
+        Returns the amount of profiled steps
+        """
+        return sum(self.hits)
+
+    #
+    #
+    def getTransitionHits(self):
+        """
+        Returns a list of ((state, symbol), (nstate, nsymbol, movement), hits)
+        sorted by hits, the hottest first
+        """
+        rows = [(k, v, self.hits[i])
+                for i, (k, v) in enumerate(self.transitions)]
+        rows.sort(key=lambda r: -r[2])
+        return rows
+
+    #
+    #
+    def getStateSteps(self):
+        """
+        Returns a dictionary state : amount of steps executed from that state
+        """
+        steps = {}
+        for i, (k, v) in enumerate(self.transitions):
+            steps[k[0]] = steps.get(k[0], 0) + self.hits[i]
+        return steps
+
+    #
+    #
+    def getUnfiredTransitions(self):
+        """
+        Returns the list of (state, symbol) transitions that never fired
+        """
+        return [k for i, (k, v) in enumerate(self.transitions)
+                if not self.hits[i]]
+
+    #
+    #
+    def getHeadRegions(self):
+        """
+        Returns a list of (first_cell, visits) for every region from the
+        leftmost to the rightmost visited one
+        """
+        rows = []
+        size = self.region_size
+        for i in xrange(len(self.left_regions) - 1, -1, -1):
+            rows.append((-(i + 1) * size, self.left_regions[i]))
+        for i in xrange(len(self.right_regions)):
+            rows.append((i * size, self.right_regions[i]))
+        return rows
+
+    #
+    #
+    def getHeatmap(self, width=64):
+        """
+        Returns an string of at most width chars representing the head visits
+        from the leftmost to the rightmost visited region
+        """
+        visits = [v for c, v in self.getHeadRegions()]
+        if not visits:
+            return ''
+
+        # Merge regions until they fit into width
+        per_char = (len(visits) + width - 1) // width
+        merged = [sum(visits[i:i + per_char])
+                  for i in xrange(0, len(visits), per_char)]
+
+        top = max(merged)
+        nchars = len(TuringMachineProfiler.HEATMAP_CHARS) - 1
+        chars = []
+        for v in merged:
+            level = (v * nchars + top - 1) // top if top else 0
+            chars.append(TuringMachineProfiler.HEATMAP_CHARS[level])
+        return ''.join(chars)
+
+    #
+    #
+    def report(self, top=10, width=64):
+        """
+        Returns a human readable report with the top hottest transitions, the
+        steps per state, the transition coverage and the head heatmap
+        """
+        total = self.getTotalSteps()
+        lines = ['Profiled steps: %d' % total, '', 'Hot transitions:']
+
+        for k, v, hits in self.getTransitionHits()[:top]:
+            if not hits:
+                break
+            lines.append('  %10d %6.2f%%  %s, %s -> %s, %s, %s' %
+                         (hits, 100.0 * hits / total, k[0], k[1], v[0], v[1],
+                          _movementSymbol(v[2])))
+
+        lines.extend(['', 'Steps per state:'])
+        steps = sorted(self.getStateSteps().iteritems(), key=lambda s: -s[1])
+        for state, n in steps:
+            lines.append('  %10d %6.2f%%  %s' %
+                         (n, 100.0 * n / total if total else 0.0, state))
+
+        unfired = self.getUnfiredTransitions()
+        ntrans = len(self.transitions)
+        lines.extend(['', 'Transition coverage: %d/%d' %
+                      (ntrans - len(unfired), ntrans)])
+        for k in unfired:
+            lines.append('  never fired: %s, %s' % k)
+
+        regions = self.getHeadRegions()
+        if regions:
+            lines.extend(['', 'Head heatmap (cells %d to %d):' %
+                          (regions[0][0],
+                           regions[-1][0] + self.region_size - 1),
+                          '  |%s|' % self.getHeatmap(width)])
+
+        return '\n'.join(lines)
+
+#
+#
+def _movementSymbol(movement):
+    if movement == TuringMachine.MOVE_LEFT:
+        return '<'
+    if movement == TuringMachine.MOVE_RIGHT:
+        return '>'
+    return '_'
+
+
+#
+# Test
+if __name__ == '__main__':
+    import time
+    import tmcorpus
+
+    tm = tmcorpus.createMachine('palindrome')
+    profiler = TuringMachineProfiler(tm, 4)
+
+    for word in ['abba', 'abab', 'aa', 'a', 'aabbaa']:
+        tm.setTape(word)
+        tm.setAtInitialState()
+        tm.run(None, profiler)
+
+    print profiler.report()
+
+    print '\nOverhead on unary addition'
+    src, word, max_steps = tmcorpus.CORPUS['unary_addition']
+    tm = tmcorpus.createMachine('unary_addition')
+    profiler = TuringMachineProfiler(tm)
+    for prof in (None, profiler, None, profiler):
+        start = time.time()
+        for i in xrange(50):
+            tm.setTape(word)
+            tm.setAtInitialState()
+            tm.run(max_steps, prof)
+        print 'Profiled' if prof else 'Plain   ', time.time() - start
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+import array
+import binascii
+
+from tm import TuringMachine
+
+#
+# Registry of many machines with deduplicated storage
+#
+# A TuringMachine keeps its own sets, a copy of the transition function, the
+# tables of symbol codes and all the execution fields, a few KB even for a
+# machine of some transitions. Searches and graders that keep a large amount
+# of small machines store them as CompactMachine instead:
+#   - the sorted states and tape symbols are tuples, and the input alphabet
+#     and final states frozensets, interned by the registry so the machines
+#     with the same ones share a single instance (as well as every state and
+#     symbol value)
+#   - the transition function is a packed table of nstates x nsymbols
+#     entries, one unsigned integer of the smallest size that fits:
+#         ((next state index + 1) * nsymbols + symbol index) * 4 + movement
+#     or 0 for an undefined transition. Tables are interned by content, so
+#     equal tables are stored once
+#   - the fingerprint is kept as the binary SHA-1 digest
+# Machines are looked up by the fingerprint of TuringMachine.getFingerprint,
+# and turned back into TuringMachine when they have to run.
+#
+
+# Packed table typecodes by entry size
+_TYPECODES = {1: 'B', 2: 'H', 4: 'I'}
+
+#
+#
+class CompactMachine(object):
+    """
+    Immutable machine definition stored by TuringMachineRegistry
+    """
+
+    __slots__ = ('digest', 'states', 'symbols', 'in_alphabet', 'fstates',
+                 'istate', 'hstate', 'blank', 'table')
+
+    #
+    #
+    def getFingerprint(self):
+        """
+        Returns the fingerprint of the machine, as
+        TuringMachine.getFingerprint
+        """
+        return binascii.hexlify(self.digest)
+
+    #
+    #
+    def getTransitionFunction(self):
+        """
+        Returns the transition function decoded from the table, as a dict
+            (state, symbol) : (state, symbol, movement)
+        """
+        states = self.states
+        symbols = self.symbols
+        nsymbols = len(symbols)
+        entries = self._entries()
+        trans_function = {}
+        for i, e in enumerate(entries):
+            if e:
+                target, movement = divmod(e, 4)
+                target, sym = divmod(target, nsymbols)
+                trans_function[(states[i // nsymbols], symbols[i % nsymbols])] = \
+                    (states[target - 1], symbols[sym], movement)
+        return trans_function
+
+    #
+    #
+    def getTransitionCount(self):
+        """
+        Returns the amount of defined transitions
+        """
+        return sum(1 for e in self._entries() if e)
+
+    #
+    #
+    def toMachine(self):
+        """
+        Returns a new TuringMachine with this definition
+        """
+        return TuringMachine(self.states, self.in_alphabet, self.symbols,
+                             self.getTransitionFunction(), self.istate,
+                             self.fstates, self.hstate, self.blank,
+                             checked=True)
+
+    #
+    #
+    def _entries(self):
+        size = len(self.table) // (len(self.states) * len(self.symbols))
+        entries = array.array(_TYPECODES[size])
+        entries.fromstring(self.table)
+        return entries
+
+    #
+    #
+    def __repr__(self):
+        return '<CompactMachine %s>' % self.getFingerprint()
+
+#
+#
+class TuringMachineRegistry:
+    """
+    Set of machines keyed by fingerprint, see CompactMachine
+    """
+
+    #
+    #
+    def __init__(self):
+        self._machines = {}
+        # Interned values, tuples, frozensets and tables
+        self._pool = {}
+        self._tables = {}
+
+    #
+    #
+    def add(self, tm):
+        """
+        add(tm): str
+
+        Stores the definition of the TuringMachine tm, if it is not already
+        in the registry, and returns its fingerprint
+        """
+        fingerprint = tm.getFingerprint()
+        digest = binascii.unhexlify(fingerprint)
+        if digest in self._machines:
+            return fingerprint
+
+        intern = self._intern
+        states = intern(tuple(sorted(intern(s) for s in tm._states)))
+        symbols = intern(tuple(sorted(intern(s)
+                                      for s in tm.getTapeAlphabet())))
+        state_index = dict((s, i) for i, s in enumerate(states))
+        symbol_index = dict((s, i) for i, s in enumerate(symbols))
+        nsymbols = len(symbols)
+
+        entries = [0] * (len(states) * nsymbols)
+        for key, value in tm.getTransitionFunction().iteritems():
+            try:
+                cell = state_index[key[0]] * nsymbols + symbol_index[key[1]]
+                target = state_index[value[0]] + 1
+                entries[cell] = (target * nsymbols +
+                                 symbol_index[value[1]]) * 4 + value[2]
+            except KeyError:
+                raise Exception('Invalid transition %s -> %s' %
+                                (str(key), str(value)))
+
+        top = max(entries) if entries else 0
+        for size in sorted(_TYPECODES):
+            if top < 1 << (8 * size):
+                break
+        table = array.array(_TYPECODES[size], entries).tostring()
+
+        machine = CompactMachine()
+        machine.digest = digest
+        machine.states = states
+        machine.symbols = symbols
+        machine.in_alphabet = intern(frozenset(intern(s)
+                                               for s in tm.getInputAlphabet()))
+        machine.fstates = intern(frozenset(intern(s) for s in tm._fstates))
+        machine.istate = intern(tm.getInitialState())
+        machine.hstate = intern(tm.getHaltState())
+        machine.blank = intern(tm.getBlankSymbol())
+        machine.table = self._tables.setdefault(table, table)
+        self._machines[digest] = machine
+        return fingerprint
+
+    #
+    #
+    def get(self, fingerprint, default=None):
+        """
+        Returns the CompactMachine with the given fingerprint, or default if
+        it is not in the registry
+        """
+        try:
+            return self._machines.get(binascii.unhexlify(fingerprint),
+                                      default)
+        except TypeError:
+            return default
+
+    #
+    #
+    def createMachine(self, fingerprint):
+        """
+        Returns a new TuringMachine of the machine with the given
+        fingerprint
+
+        Raises a KeyError if it is not in the registry
+        """
+        machine = self.get(fingerprint)
+        if machine is None:
+            raise KeyError(fingerprint)
+        return machine.toMachine()
+
+    #
+    #
+    def getStats(self):
+        """
+        Returns a dict with the amount of machines, of distinct transition
+        tables and of interned values, tuples and frozensets
+        """
+        return {'machines': len(self._machines),
+                'tables': len(self._tables),
+                'interned': len(self._pool)}
+
+    #
+    #
+    def __contains__(self, fingerprint):
+        return self.get(fingerprint) is not None
+
+    #
+    #
+    def __getitem__(self, fingerprint):
+        machine = self.get(fingerprint)
+        if machine is None:
+            raise KeyError(fingerprint)
+        return machine
+
+    #
+    #
+    def __iter__(self):
+        return (binascii.hexlify(d) for d in self._machines)
+
+    #
+    #
+    def __len__(self):
+        return len(self._machines)
+
+    #
+    #
+    def _intern(self, value):
+        """
+        Returns the instance of the pool equal to value, adding it if it's
+        new
+        """
+        return self._pool.setdefault((type(value), value), value)
+
+
+#
+# Test
+if __name__ == '__main__':
+    import gc
+    import sys
+    import time
+    import random
+    import tmcorpus
+
+    registry = TuringMachineRegistry()
+    for name in sorted(tmcorpus.CORPUS):
+        tm = tmcorpus.createMachine(name)
+        fingerprint = registry.add(tm)
+        copy = registry.createMachine(fingerprint)
+        print '%-20s same fingerprint: %s same transitions: %s' % \
+            (name, copy.getFingerprint() == fingerprint,
+             copy.getTransitionFunction() == tm.getTransitionFunction())
+
+    #
+    # Approximate memory of obj, counting every object once
+    def deepSize(obj, seen):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            size += sum(deepSize(k, seen) + deepSize(v, seen)
+                        for k, v in obj.iteritems())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            size += sum(deepSize(v, seen) for v in obj)
+        elif hasattr(obj, '__dict__'):
+            size += deepSize(obj.__dict__, seen)
+        elif hasattr(obj, '__slots__'):
+            size += sum(deepSize(getattr(obj, s), seen)
+                        for s in obj.__slots__)
+        return size
+
+    # Random machines of 4 states and 2 symbols, as the busy beaver search
+    # generates them
+    NMACHINES = 100000
+    random.seed(1)
+    states = ['A', 'B', 'C', 'D', 'H']
+    movements = (TuringMachine.MOVE_LEFT, TuringMachine.MOVE_RIGHT)
+
+    def randomMachine():
+        trans_function = {}
+        for state in states[:-1]:
+            for sym in '01':
+                trans_function[(state, sym)] = (random.choice(states),
+                                                random.choice('01'),
+                                                random.choice(movements))
+        return TuringMachine(states, '1', '01', trans_function, 'A', 'H',
+                             'H', '0', checked=True)
+
+    machines = [randomMachine() for i in xrange(1000)]
+    plain_size = deepSize(machines, set()) / float(len(machines))
+
+    registry = TuringMachineRegistry()
+    start = time.time()
+    for i in xrange(NMACHINES):
+        registry.add(randomMachine())
+    add_time = time.time() - start
+    gc.collect()
+    compact_size = deepSize(registry._machines, set()) / float(NMACHINES)
+    compact_size += deepSize(registry._pool, set()) / float(NMACHINES)
+    print '%d machines in %.1fs, %s' % (NMACHINES, add_time,
+                                         registry.getStats())
+    print 'Bytes per machine: TuringMachine %d, CompactMachine %d (%.1fx)' % \
+        (plain_size, compact_size, plain_size / compact_size)
+
+    fingerprint = machines[0].getFingerprint()
+    registry.add(machines[0])
+    start = time.time()
+    for i in xrange(100000):
+        registry.get(fingerprint)
+    print 'Lookup: %.2fus' % ((time.time() - start) * 10)
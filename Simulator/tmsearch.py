@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+import tmgovernor
+from tm import TuringMachine
+from tmbuilder import TuringMachineBuilder
+from tmparser import TuringMachineParser
+
+__prog__ = 'tmsearch'
+
+#
+# Busy beaver search
+#
+# Machines with n states (A, B, C...) and k symbols (0, 1, 2..., 0 is the
+# blank) are generated in tree normal form: the search starts with a machine
+# without transitions and runs it from a blank tape. When it reaches an
+# undefined transition the machine is a halting candidate (that transition
+# would be its halt transition) and it's expanded with every possible
+# definition of the missing transition. So only reachable transitions are
+# ever defined, and:
+#   - States and symbols are numbered in order of first use, the new
+#     transition can only go to the used states plus the next unused one,
+#     and write the used symbols plus the next unused one
+#   - The first transition only moves right, machines moving left first are
+#     their mirror images
+#   - The last undefined transition is never defined, machines without an
+#     undefined transition never halt
+#
+# Machines are written in the usual compact notation: the transitions of
+# every state separated by '_', every transition is the written symbol, the
+# movement (L or R) and the next state, 'Z' being the halt state, or '---' if
+# it's undefined. For example the 2 states champion is 1RB1LB_1LA1RZ.
+#
+# The search is a depth first traversal of the tree. The pending nodes and the
+# results are saved to a checkpoint file every checkpoint interval, so the
+# search can be resumed from it.
+#
+
+STATE_NAMES = 'ABCDEFGHIJKLMNOPQRSTUVWXY'
+HALT_NAME = 'Z'
+UNDEFINED = '---'
+
+DEF_MAX_STEPS = 100000
+DEF_CHECKPOINT_INTERVAL = 60
+
+# Nodes evaluated between checks of the checkpoint interval, per worker
+BATCH_NODES = 64
+
+# Machines kept for every record
+MAX_HOLDERS = 16
+
+CHECKPOINT_VERSION = 1
+
+# Evaluation results
+HALTED = 'halted'
+MAX_STEPS = 'max_steps'
+MAX_TAPE = 'max_tape'
+
+_MOVE_NAMES = {
+    TuringMachine.MOVE_LEFT: 'L',
+    TuringMachine.MOVE_RIGHT: 'R',
+}
+_NAME_MOVES = dict((v, k) for k, v in _MOVE_NAMES.iteritems())
+
+_PARSER_MOVES = {
+    TuringMachine.MOVE_LEFT: TuringMachineParser.MOVE_LEFT,
+    TuringMachine.MOVE_RIGHT: TuringMachineParser.MOVE_RIGHT,
+}
+
+#
+#
+def formatTable(table, n, k):
+    """
+    Returns the compact notation of table, a tuple of n * k transitions
+    (None or (next state, written symbol, movement)), being the next state
+    -1 for the halt state
+    """
+    parts = []
+    for s in xrange(n):
+        row = []
+        for c in xrange(k):
+            t = table[s * k + c]
+            if t is None:
+                row.append(UNDEFINED)
+            else:
+                row.append('%d%s%s' % (t[1], _MOVE_NAMES[t[2]],
+                                       HALT_NAME if t[0] < 0 else
+                                       STATE_NAMES[t[0]]))
+        parts.append(''.join(row))
+    return '_'.join(parts)
+
+#
+#
+def parseTable(text):
+    """
+    Returns (table, n, k) from the compact notation of a machine
+    """
+    rows = text.split('_')
+    n = len(rows)
+    k = len(rows[0]) // 3
+    if not k or any(len(r) != k * 3 for r in rows):
+        raise Exception('Invalid machine %s' % text)
+
+    table = []
+    for row in rows:
+        for c in xrange(k):
+            t = row[c * 3:c * 3 + 3]
+            if t == UNDEFINED:
+                table.append(None)
+            elif t[2] == HALT_NAME:
+                table.append((-1, int(t[0]), _NAME_MOVES[t[1]]))
+            else:
+                table.append((STATE_NAMES.index(t[2]), int(t[0]),
+                              _NAME_MOVES[t[1]]))
+    return tuple(table), n, k
+
+#
+#
+def createMachine(table, n, k):
+    """
+    Returns the TuringMachine of table, created with a TuringMachineBuilder
+    """
+    builder = TuringMachineBuilder()
+    builder.setBlankSymbol('0')
+    builder.setHaltState(HALT_NAME)
+    builder.setInitialState(STATE_NAMES[0])
+    for i, t in enumerate(table):
+        if t is not None:
+            s, c = divmod(i, k)
+            builder.addTransition(STATE_NAMES[s], str(c),
+                                  HALT_NAME if t[0] < 0 else STATE_NAMES[t[0]],
+                                  str(t[1]), t[2])
+    return builder.create()
+
+#
+#
+def machineSource(table, n, k):
+    """
+    Returns the source of table in the simulator language
+    """
+    lines = ['%% %s' % formatTable(table, n, k),
+             'HALT %s' % HALT_NAME,
+             'BLANK 0',
+             'INITIAL %s' % STATE_NAMES[0]]
+    for i, t in enumerate(table):
+        if t is not None:
+            s, c = divmod(i, k)
+            lines.append('%s, %d -> %s, %d, %s' %
+                         (STATE_NAMES[s], c,
+                          HALT_NAME if t[0] < 0 else STATE_NAMES[t[0]],
+                          t[1], _PARSER_MOVES[t[2]]))
+    return '\n'.join(lines) + '\n'
+
+#
+#
+def evaluateTable(table, n, k, max_steps, max_tape_cells=None):
+    """
+    Runs table from a blank tape. Returns:
+        (HALTED, steps, non blank symbols, state, symbol) if it reaches the
+            undefined transition (state, symbol)
+        (MAX_STEPS, steps) or (MAX_TAPE, steps) if it exceeds a limit
+    """
+    tm = createMachine(table, n, k)
+    tm.setTape('')
+    governor = tmgovernor.TuringMachineGovernor(
+                    max_steps, max_tape_cells=max_tape_cells,
+                    check_interval=min(max_steps,
+                        tmgovernor.TuringMachineGovernor.DEF_CHECK_INTERVAL))
+
+    end_cond = tm.run(None, None, governor)
+    steps = tm.getExecutedStepsCounter()
+    if end_cond == TuringMachine.END_MAX_STEPS:
+        return (MAX_STEPS, steps)
+    if end_cond == TuringMachine.END_MAX_TAPE_CELLS:
+        return (MAX_TAPE, steps)
+
+    blank = tm.getBlankSymbol()
+    ones = sum(1 for s in tm.getTapeIterator() if s != blank)
+    return (HALTED, steps, ones, STATE_NAMES.index(tm.getCurrentState()),
+            int(tm.getSymbolAt(tm.getHeadPosition())))
+
+
+#
+# Worker process state
+#
+_worker_args = None
+
+#
+#
+def _initWorker(n, k, max_steps, max_tape_cells):
+    global _worker_args
+    _worker_args = (n, k, max_steps, max_tape_cells)
+
+#
+#
+def _evaluateWorkerTable(table):
+    return evaluateTable(table, *_worker_args)
+
+
+#
+#
+class BusyBeaverSearch:
+    """
+    Busy beaver search over the n states, k symbols machines, see the module
+    comments
+    """
+
+    #
+    #
+    def __init__(self, n, k, max_steps=DEF_MAX_STEPS, max_tape_cells=None):
+        """
+        BusyBeaverSearch(n, k, max_steps=DEF_MAX_STEPS, max_tape_cells=None)
+            - max_steps, max_tape_cells: limits of every machine, the ones
+              exceeding them are undecided
+        """
+        if not 1 <= n <= len(STATE_NAMES):
+            raise Exception('States must be between 1 and %d' %
+                            len(STATE_NAMES))
+        if not 2 <= k <= 10:
+            raise Exception('Symbols must be between 2 and 10')
+        if max_steps <= 0:
+            raise Exception('Max steps must be greater than 0')
+
+        self._n = n
+        self._k = k
+        self._max_steps = max_steps
+        self._max_tape_cells = max_tape_cells
+
+        # Pending nodes, the root is the machine without transitions
+        self._stack = [(None,) * (n * k)]
+        self._results = {
+            'explored': 0,
+            'halting': 0,
+            'undecided_count': 0,
+            'max_steps': {'value': 0, 'machines': []},
+            'max_symbols': {'value': 0, 'machines': []},
+            'undecided': [],
+        }
+
+    #
+    #
+    @staticmethod
+    def loadCheckpoint(fname):
+        """
+        Returns the BusyBeaverSearch saved at fname
+        """
+        f = open(fname, 'r')
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+
+        if data.get('version') != CHECKPOINT_VERSION:
+            raise Exception('Invalid checkpoint %s' % fname)
+
+        search = BusyBeaverSearch(data['n'], data['k'], data['max_steps'],
+                                  data['max_tape_cells'])
+        search._stack = [parseTable(t)[0] for t in data['stack']]
+        search._results = data['results']
+        return search
+
+    #
+    #
+    def saveCheckpoint(self, fname):
+        """
+        Saves the pending nodes and the results to fname. The file is
+        replaced atomically, so an interrupted save keeps the previous one
+        """
+        data = {
+            'version': CHECKPOINT_VERSION,
+            'n': self._n,
+            'k': self._k,
+            'max_steps': self._max_steps,
+            'max_tape_cells': self._max_tape_cells,
+            'stack': [formatTable(t, self._n, self._k) for t in self._stack],
+            'results': self._results,
+        }
+        tmp = fname + '.tmp'
+        f = open(tmp, 'w')
+        try:
+            json.dump(data, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmp, fname)
+
+    #
+    #
+    def getResults(self):
+        """
+        Returns the results dict:
+            - explored: amount of evaluated machines
+            - halting: amount of halting machines found
+            - undecided_count: amount of machines exceeding the limits
+            - max_steps, max_symbols: record value and holders (up to
+              MAX_HOLDERS machines)
+            - undecided: the undecided machines
+        """
+        return self._results
+
+    #
+    #
+    def getPendingCount(self):
+        """
+        Returns the amount of nodes pending to explore
+        """
+        return len(self._stack)
+
+    #
+    #
+    def isFinished(self):
+        return not self._stack
+
+    #
+    #
+    def run(self, workers=1, checkpoint=None,
+            checkpoint_interval=DEF_CHECKPOINT_INTERVAL, progress=None):
+        """
+        Explores the pending nodes until the search ends. If checkpoint is
+        given it's saved every checkpoint_interval seconds and at the end,
+        even if the search is interrupted. progress(search) is called after
+        every batch of nodes
+        """
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, _initWorker,
+                                        (self._n, self._k, self._max_steps,
+                                         self._max_tape_cells))
+            evaluate = lambda tables: pool.map(_evaluateWorkerTable, tables,
+                                               BATCH_NODES // 4)
+        else:
+            pool = None
+            evaluate = lambda tables: [evaluateTable(t, self._n, self._k,
+                                                     self._max_steps,
+                                                     self._max_tape_cells)
+                                       for t in tables]
+
+        last_save = time.time()
+        try:
+            while self._stack:
+                nbatch = BATCH_NODES * max(1, workers)
+                batch = self._stack[-nbatch:]
+                results = evaluate(batch)
+                # Only removed once evaluated, an interrupted batch is
+                # evaluated again after resuming
+                del self._stack[-len(batch):]
+
+                for table, result in zip(batch, results):
+                    self._addResult(table, result)
+
+                if progress:
+                    progress(self)
+                if checkpoint and \
+                   time.time() - last_save >= checkpoint_interval:
+                    self.saveCheckpoint(checkpoint)
+                    last_save = time.time()
+
+            if pool:
+                pool.close()
+        except:
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.join()
+            if checkpoint:
+                self.saveCheckpoint(checkpoint)
+
+    #
+    #
+    def _addResult(self, table, result):
+        n, k = self._n, self._k
+        results = self._results
+        results['explored'] += 1
+
+        if result[0] != HALTED:
+            results['undecided_count'] += 1
+            results['undecided'].append(formatTable(table, n, k))
+            return
+
+        steps, ones, state, symbol = result[1:]
+
+        # The undefined transition as halt transition, writing a non blank
+        halting = list(table)
+        halting[state * k + symbol] = (-1, 1, TuringMachine.MOVE_RIGHT)
+        halting = formatTable(halting, n, k)
+        results['halting'] += 1
+        _updateRecord(results['max_steps'], steps + 1, halting)
+        _updateRecord(results['max_symbols'], ones + (symbol == 0), halting)
+
+        self._stack.extend(reversed(self._children(table, state, symbol)))
+
+    #
+    #
+    def _children(self, table, state, symbol):
+        """
+        Returns the nodes defining the undefined transition (state, symbol)
+        """
+        n, k = self._n, self._k
+        if table.count(None) <= 1:
+            return []
+
+        # States and symbols used until now
+        used_states = 1
+        used_symbols = 1
+        for i, t in enumerate(table):
+            if t is not None:
+                used_states = max(used_states, i // k + 1, t[0] + 1)
+                used_symbols = max(used_symbols, i % k + 1, t[1] + 1)
+        used_symbols = max(used_symbols, symbol + 1)
+
+        if table.count(None) == len(table):
+            moves = (TuringMachine.MOVE_RIGHT,)
+        else:
+            moves = (TuringMachine.MOVE_RIGHT, TuringMachine.MOVE_LEFT)
+
+        children = []
+        i = state * k + symbol
+        for nstate in xrange(min(n, used_states + 1)):
+            for nsymbol in xrange(min(k, used_symbols + 1)):
+                for move in moves:
+                    child = list(table)
+                    child[i] = (nstate, nsymbol, move)
+                    children.append(tuple(child))
+        return children
+
+#
+#
+def _updateRecord(record, value, machine):
+    if value > record['value']:
+        record['value'] = value
+        record['machines'] = [machine]
+    elif value == record['value'] and len(record['machines']) < MAX_HOLDERS:
+        record['machines'].append(machine)
+
+#
+#
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog=__prog__,
+        description='Busy beaver search over the n states, k symbols Turing '
+                    'machines')
+    argparser.add_argument('states', type=int, help='Amount of states')
+    argparser.add_argument('symbols', type=int, nargs='?', default=2,
+                           help='Amount of symbols (default: 2)')
+    argparser.add_argument('-o', '--output', default='-',
+                           help='JSON results file (default: stdout)')
+    argparser.add_argument('--max-steps', type=int, default=DEF_MAX_STEPS,
+                           help='Maximum steps per machine (default: %d)' %
+                                DEF_MAX_STEPS)
+    argparser.add_argument('--max-tape-cells', type=int, default=None,
+                           help='Maximum tape size per machine')
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='Amount of worker processes (default: 1)')
+    argparser.add_argument('--checkpoint', default=None, metavar='FILE',
+                           help='Resume from FILE if it exists and save the '
+                                'search state there periodically')
+    argparser.add_argument('--checkpoint-interval', type=float,
+                           default=DEF_CHECKPOINT_INTERVAL, metavar='SECS',
+                           help='Seconds between checkpoints (default: %d)' %
+                                DEF_CHECKPOINT_INTERVAL)
+    argparser.add_argument('--source', action='store_true',
+                           help='Include the source of the record holders')
+
+    args = argparser.parse_args(argv)
+    if args.workers <= 0:
+        argparser.error('--workers must be greater than 0')
+
+    try:
+        if args.checkpoint and os.path.exists(args.checkpoint):
+            search = BusyBeaverSearch.loadCheckpoint(args.checkpoint)
+            if (search._n, search._k) != (args.states, args.symbols):
+                raise Exception('Checkpoint is a %d states, %d symbols search'
+                                % (search._n, search._k))
+        else:
+            search = BusyBeaverSearch(args.states, args.symbols,
+                                      args.max_steps, args.max_tape_cells)
+    except Exception as e:
+        sys.stderr.write('%s: %s\n' % (__prog__, e))
+        return 2
+
+    def progress(search):
+        results = search.getResults()
+        sys.stderr.write('\r%s: explored %d, pending %d, undecided %d, '
+                         'max steps %d' %
+                         (__prog__, results['explored'],
+                          search.getPendingCount(),
+                          results['undecided_count'],
+                          results['max_steps']['value']))
+
+    try:
+        search.run(args.workers, args.checkpoint, args.checkpoint_interval,
+                   progress if sys.stderr.isatty() else None)
+    except KeyboardInterrupt:
+        sys.stderr.write('\n%s: interrupted\n' % __prog__)
+        return 1
+
+    results = dict(search.getResults())
+    if args.source:
+        results['sources'] = dict(
+            (m, machineSource(*parseTable(m)))
+            for m in results['max_steps']['machines'] +
+                     results['max_symbols']['machines'])
+
+    fout = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        json.dump(results, fout, indent=1, sort_keys=True)
+        fout.write('\n')
+    finally:
+        if fout is not sys.stdout:
+            fout.close()
+    return 0
+
+#
+#
+if __name__ == '__main__':
+    sys.exit(main())
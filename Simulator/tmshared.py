@@ -0,0 +1,695 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import mmap
+import ctypes
+import struct
+import cPickle
+import tempfile
+
+import tmexceptions
+from tm import TuringMachine
+
+#
+# Machines and word corpora shared by worker processes
+#
+# A machine is published once as a named shared memory segment (a file in
+# /dev/shm, or in the temporary directory if there is no /dev/shm) holding
+# its validated transition table translated to dense integers:
+#   - header, magic and sizes
+#   - pickled metadata: alphabets, initial, halt and final states and
+#     fingerprint. Its size depends on the alphabet, not on the transitions
+#   - sorted state names, packed with an offsets array
+#   - table of nstates x nsymbols entries of (next state index or -1,
+#     symbol code to write, movement) as 32 bits integers
+# Workers attach to it by name (attachMachine). The segment is mapped and
+# read in place through ctypes arrays, nothing is unpickled or copied, so
+# attaching costs the same for any machine size.
+#
+# A corpus of words is published the same way as an offsets array and the
+# concatenated words, and tasks refer to words by index instead of sending
+# them (see tmbatch.runBatch).
+#
+# Only machines with string states and corpora of string words can be
+# shared. Segments are removed by their publisher with unlink(), the
+# processes already attached keep them mapped until they close them.
+#
+
+if os.path.isdir('/dev/shm'):
+    SEGMENT_DIR = '/dev/shm'
+else:
+    SEGMENT_DIR = tempfile.gettempdir()
+
+SEGMENT_PREFIX = 'tmshared-'
+
+MACHINE_MAGIC = 'TMSM'
+CORPUS_MAGIC = 'TMSC'
+VERSION = 1
+
+# magic, version, metadata bytes, states, symbols, names bytes
+_MACHINE_HEADER = struct.Struct('<4sIIIII')
+# magic, version, words, words bytes
+_CORPUS_HEADER = struct.Struct('<4sIQQ')
+
+_ALIGNMENT = 8
+
+#
+#
+class SharedSegment:
+    """
+    Named shared memory segment mapped in the current process
+    """
+
+    #
+    #
+    def __init__(self, name, size=None):
+        """
+        SharedSegment(name, size=None)
+        Creates a new segment of size bytes, or attaches to an existing one
+        if size is None
+
+        Raises an Exception if the segment exists and size is given or it
+        does not exist and size is None
+        """
+        self.name = name
+        self._path = os.path.join(SEGMENT_DIR, name)
+        try:
+            if size is None:
+                fd = os.open(self._path, os.O_RDWR)
+                size = os.fstat(fd).st_size
+            else:
+                fd = os.open(self._path, os.O_RDWR | os.O_CREAT | os.O_EXCL,
+                             0600)
+                os.ftruncate(fd, max(size, 1))
+        except OSError as e:
+            raise Exception('Shared segment %s: %s' % (name, e.strerror))
+        try:
+            self.buf = mmap.mmap(fd, max(size, 1))
+        finally:
+            os.close(fd)
+        self.size = size
+
+    #
+    #
+    def close(self):
+        """
+        Unmaps the segment from the current process, its file descriptor is
+        already closed once mapped. The views of the segment must not be
+        used after closing it
+        """
+        self.buf.close()
+
+    #
+    #
+    def unlink(self):
+        """
+        Removes the segment name, the processes attached to it keep it
+        mapped
+        """
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+    #
+    #
+    def view(self, ctype, offset, count):
+        """
+        Returns a ctypes array of count ctype items at offset, without
+        copying
+        """
+        return (ctype * count).from_buffer(self.buf, offset)
+
+
+#
+#
+class SharedTuringMachine(TuringMachine):
+    """
+    TuringMachine that reads its transition table from a shared segment,
+    created by attachMachine
+
+    run and isWordAccepted execute on the shared table directly (see
+    SharedTableEngine). The step by step execution (observers, profiler,
+    breakpoints, bounded tapes) works through a mapping view of the table,
+    with the states visited so far cached by name
+    """
+
+    #
+    #
+    def __init__(self, segment):
+        magic, version, meta_len, nstates, ncols, names_len = \
+            _MACHINE_HEADER.unpack_from(segment.buf, 0)
+        if magic != MACHINE_MAGIC or version != VERSION:
+            raise Exception('%s is not a shared machine' % segment.name)
+
+        offset = _MACHINE_HEADER.size
+        meta = cPickle.loads(segment.buf[offset:offset + meta_len])
+        offset = _align(offset + meta_len)
+        self._name_offsets = segment.view(ctypes.c_uint32, offset,
+                                          nstates + 1)
+        offset = _align(offset + 4 * (nstates + 1))
+        self._names_offset = offset
+        offset = _align(offset + names_len)
+        self._table = segment.view(ctypes.c_int32, offset,
+                                   nstates * ncols * 3)
+        self._segment = segment
+        self._nstates = nstates
+        self._ncols = ncols
+
+        self._states = _SharedStates(self)
+        self._in_alphabet = frozenset(meta['in_alphabet'])
+        self._tape_alphabet = frozenset(meta['symbols'])
+        self._trans_function = _SharedTransitions(self, False)
+        self._istate = meta['istate']
+        self._fstates = frozenset(meta['fstates'])
+        self._hstate = meta['hstate']
+        self._blank = meta['blank']
+
+        # State index <-> name of the states visited so far
+        self._state_ids = {self._istate: meta['istate_index'],
+                           self._hstate: meta['hstate_index']}
+        self._state_names = {meta['istate_index']: self._istate,
+                             meta['hstate_index']: self._hstate}
+
+        self._initTapeCodes()
+        # Column of every symbol code, the columns are the sorted symbols
+        self._col_symbols = meta['symbols']
+        self._code_cols = [None] * len(self._code_syms)
+        for col, sym in enumerate(meta['symbols']):
+            self._code_cols[self._sym_codes[sym]] = col
+        self._code_trans = _SharedTransitions(self, True)
+
+        self._initExecution()
+        self._fingerprint = meta['fingerprint']
+        self._engine = SharedTableEngine(self)
+
+    #
+    #
+    def getTransitionFunction(self):
+        """
+        Returns a copy of the transition function dictionary, read from the
+        shared table
+        """
+        return dict(self._trans_function.iteritems())
+
+    #
+    #
+    def getSegmentName(self):
+        """
+        Returns the name of the shared segment of the machine
+        """
+        return self._segment.name
+
+    #
+    #
+    def _stateIndex(self, state):
+        """
+        Returns the index of state, None if it's not a state
+        """
+        index = self._state_ids.get(state)
+        if index is not None:
+            return index
+        if not isinstance(state, str):
+            return None
+
+        lo, hi = 0, self._nstates
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name = self._nameAt(mid)
+            if name < state:
+                lo = mid + 1
+            elif name > state:
+                hi = mid
+            else:
+                self._state_ids[state] = mid
+                self._state_names[mid] = state
+                return mid
+        return None
+
+    #
+    #
+    def _stateName(self, index):
+        """
+        Returns the name of the state at index
+        """
+        name = self._state_names.get(index)
+        if name is None:
+            name = self._state_names[index] = self._nameAt(index)
+            self._state_ids[name] = index
+        return name
+
+    #
+    #
+    def _nameAt(self, index):
+        start = self._names_offset + self._name_offsets[index]
+        end = self._names_offset + self._name_offsets[index + 1]
+        return intern(self._segment.buf[start:end])
+
+    #
+    #
+    def _entry(self, state, symbol_col):
+        """
+        Returns the (next state index, code, movement) of the transition
+        from the state index reading the symbol column, None if there is no
+        transition
+        """
+        i = (state * self._ncols + symbol_col) * 3
+        nstate = self._table[i]
+        if nstate < 0:
+            return None
+        return nstate, self._table[i + 1], self._table[i + 2]
+
+
+#
+#
+class _SharedStates:
+    """
+    Read only set view of the states of a SharedTuringMachine, iterated in
+    sorted order
+    """
+
+    def __init__(self, tm):
+        self._tm = tm
+
+    def __contains__(self, state):
+        return self._tm._stateIndex(state) is not None
+
+    def __iter__(self):
+        return (self._tm._stateName(i) for i in xrange(self._tm._nstates))
+
+    def __len__(self):
+        return self._tm._nstates
+
+    def __repr__(self):
+        return repr(frozenset(self))
+
+
+#
+#
+class _SharedTransitions:
+    """
+    Read only mapping view of the transitions of a SharedTuringMachine
+        (state, symbol) : (state, symbol, movement)
+    or with symbol codes instead of symbols if codes is True
+    """
+
+    def __init__(self, tm, codes):
+        self._tm = tm
+        self._codes = codes
+
+    def _col(self, symbol):
+        if self._codes:
+            if 0 <= symbol < len(self._tm._code_cols):
+                return self._tm._code_cols[symbol]
+            return None
+        code = self._tm._sym_codes.get(symbol)
+        if code is None:
+            return None
+        return self._tm._code_cols[code]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        tm = self._tm
+        state = tm._stateIndex(key[0])
+        col = self._col(key[1])
+        entry = None
+        if state is not None and col is not None:
+            entry = tm._entry(state, col)
+        if entry is None:
+            raise KeyError(key)
+        nstate, code, movement = entry
+        if not self._codes:
+            code = tm._code_syms[code]
+        return (tm._stateName(nstate), code, movement)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def iteritems(self):
+        tm = self._tm
+        for state in xrange(tm._nstates):
+            for col, sym in enumerate(tm._col_symbols):
+                entry = tm._entry(state, col)
+                if entry is not None:
+                    nstate, code, movement = entry
+                    key_sym = tm._sym_codes[sym] if self._codes else sym
+                    if not self._codes:
+                        code = tm._code_syms[code]
+                    yield ((tm._stateName(state), key_sym),
+                           (tm._stateName(nstate), code, movement))
+
+    def iterkeys(self):
+        return (k for k, v in self.iteritems())
+
+    def itervalues(self):
+        return (v for k, v in self.iteritems())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def __len__(self):
+        return sum(1 for k in self.iterkeys())
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+
+#
+#
+class SharedTableEngine:
+    """
+    Engine of a SharedTuringMachine, see TuringMachine.setEngine
+    """
+
+    #
+    #
+    def __init__(self, tm):
+        self._tm = tm
+        self._cols3 = [None if c is None else c * 3 for c in tm._code_cols]
+
+    #
+    #
+    def __call__(self, tm, max_steps=None):
+        """
+        Same as tm.run(max_steps), reading the shared table
+        """
+        if tm._tape is None:
+            raise tmexceptions.UnsetTapeException(
+                'Tape must be set before perform an step')
+
+        owner = self._tm
+        table = owner._table
+        cols3 = self._cols3
+        row = owner._ncols * 3
+        hstate = owner._stateIndex(tm._hstate)
+        blank = tm._blank_code
+        tape = tm._tape
+        head = tm._head
+        origin = tm._origin
+        state = owner._stateIndex(tm._cur_state)
+        limit = max_steps or sys.maxint
+        left = TuringMachine.MOVE_LEFT
+        right = TuringMachine.MOVE_RIGHT
+
+        n = 0
+        c = 0
+        end = TuringMachine.END_MAX_STEPS
+        try:
+            while n < limit:
+                if state == hstate:
+                    end = TuringMachine.END_HALT
+                    break
+                i = state * row + cols3[tape[head]]
+                nstate = table[i]
+                if nstate < 0:
+                    end = TuringMachine.END_UNKNOWN_TRANSITION
+                    break
+                tape[head] = table[i + 1]
+                movement = table[i + 2]
+                if nstate != state:
+                    state = nstate
+                    c += 1
+                if movement == left:
+                    if head == 0:
+                        tape.insert(0, blank)
+                        origin += 1
+                    else:
+                        head -= 1
+                elif movement == right:
+                    head += 1
+                    if head == len(tape):
+                        tape.append(blank)
+                n += 1
+        finally:
+            tm._head = head
+            tm._origin = origin
+            tm._cur_state = owner._stateName(state)
+            tm._nexecuted_steps += n
+            tm._nstate_changes += c
+        return end
+
+
+#
+#
+class SharedCorpus:
+    """
+    Read only sequence of the words of a shared corpus, created by
+    attachCorpus
+    """
+
+    #
+    #
+    def __init__(self, segment):
+        magic, version, nwords, nbytes = \
+            _CORPUS_HEADER.unpack_from(segment.buf, 0)
+        if magic != CORPUS_MAGIC or version != VERSION:
+            raise Exception('%s is not a shared corpus' % segment.name)
+
+        offset = _CORPUS_HEADER.size
+        self._offsets = segment.view(ctypes.c_uint64, offset, nwords + 1)
+        self._words_offset = _align(offset + 8 * (nwords + 1))
+        self._segment = segment
+        self._nwords = nwords
+
+    #
+    #
+    def getSegmentName(self):
+        """
+        Returns the name of the shared segment of the corpus
+        """
+        return self._segment.name
+
+    #
+    #
+    def close(self):
+        """
+        Unmaps the corpus segment, see SharedSegment.close
+        """
+        self._offsets = None
+        self._segment.close()
+
+    #
+    #
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._nwords
+        if not 0 <= index < self._nwords:
+            raise IndexError('Corpus index out of range')
+        start = self._words_offset + self._offsets[index]
+        end = self._words_offset + self._offsets[index + 1]
+        return self._segment.buf[start:end]
+
+    #
+    #
+    def __len__(self):
+        return self._nwords
+
+    #
+    #
+    def __iter__(self):
+        return (self[i] for i in xrange(self._nwords))
+
+
+#
+#
+def publishMachine(tm, name=None):
+    """
+    publishMachine(tm, name=None): SharedSegment
+
+    Publishes the transition table of tm in a new shared segment, by default
+    with a unique name, and returns it. Attach to it with attachMachine and
+    remove it with unlink() when the workers are done
+
+    Raises an Exception if some state of tm is not a string
+    """
+    states = sorted(tm._states)
+    if not all(isinstance(s, str) for s in states):
+        raise Exception('Only machines with string states can be shared')
+    symbols = sorted(tm.getTapeAlphabet())
+
+    state_ids = dict((s, i) for i, s in enumerate(states))
+    col_ids = dict((s, i) for i, s in enumerate(symbols))
+    meta = cPickle.dumps({
+        'symbols': symbols,
+        'in_alphabet': sorted(tm.getInputAlphabet()),
+        'istate': tm.getInitialState(),
+        'istate_index': state_ids[tm.getInitialState()],
+        'hstate': tm.getHaltState(),
+        'hstate_index': state_ids[tm.getHaltState()],
+        'fstates': sorted(tm._fstates),
+        'blank': tm.getBlankSymbol(),
+        'fingerprint': tm.getFingerprint(),
+    }, cPickle.HIGHEST_PROTOCOL)
+
+    name_offsets = [0]
+    for s in states:
+        name_offsets.append(name_offsets[-1] + len(s))
+    names = ''.join(states)
+
+    nstates = len(states)
+    ncols = len(symbols)
+    meta_at = _MACHINE_HEADER.size
+    offsets_at = _align(meta_at + len(meta))
+    names_at = _align(offsets_at + 4 * (nstates + 1))
+    table_at = _align(names_at + len(names))
+    size = table_at + 4 * nstates * ncols * 3
+
+    segment = SharedSegment(name or _uniqueName(), size)
+    try:
+        _MACHINE_HEADER.pack_into(segment.buf, 0, MACHINE_MAGIC, VERSION,
+                                  len(meta), nstates, ncols, len(names))
+        segment.buf[meta_at:meta_at + len(meta)] = meta
+        segment.view(ctypes.c_uint32, offsets_at,
+                     nstates + 1)[:] = name_offsets
+        segment.buf[names_at:names_at + len(names)] = names
+
+        table = segment.view(ctypes.c_int32, table_at, nstates * ncols * 3)
+        ctypes.memset(ctypes.addressof(table), 0xff, ctypes.sizeof(table))
+        code = tm.getSymbolCode
+        for k, v in tm.getTransitionFunction().iteritems():
+            i = (state_ids[k[0]] * ncols + col_ids[k[1]]) * 3
+            table[i] = state_ids[v[0]]
+            table[i + 1] = code(v[1])
+            table[i + 2] = v[2]
+        del table
+    except:
+        segment.unlink()
+        raise
+    return segment
+
+#
+#
+def attachMachine(name):
+    """
+    Returns the SharedTuringMachine published with the given segment name
+    """
+    return SharedTuringMachine(SharedSegment(name))
+
+#
+#
+def publishCorpus(words, name=None):
+    """
+    publishCorpus(words, name=None): SharedSegment
+
+    Publishes the string words of the iterable words in a new shared
+    segment, by default with a unique name, and returns it. Attach to it
+    with attachCorpus and remove it with unlink() when the workers are done
+    """
+    words = list(words)
+    if not all(isinstance(w, str) for w in words):
+        raise Exception('Only string words can be shared')
+
+    offsets = [0]
+    for w in words:
+        offsets.append(offsets[-1] + len(w))
+    data = ''.join(words)
+
+    offsets_at = _CORPUS_HEADER.size
+    words_at = _align(offsets_at + 8 * (len(words) + 1))
+    segment = SharedSegment(name or _uniqueName(), words_at + len(data))
+    try:
+        _CORPUS_HEADER.pack_into(segment.buf, 0, CORPUS_MAGIC, VERSION,
+                                 len(words), len(data))
+        segment.view(ctypes.c_uint64, offsets_at,
+                     len(words) + 1)[:] = offsets
+        segment.buf[words_at:words_at + len(data)] = data
+    except:
+        segment.unlink()
+        raise
+    return segment
+
+#
+#
+def attachCorpus(name):
+    """
+    Returns the SharedCorpus published with the given segment name
+    """
+    return SharedCorpus(SharedSegment(name))
+
+#
+#
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+#
+#
+def _uniqueName():
+    return '%s%d-%s' % (SEGMENT_PREFIX, os.getpid(),
+                        os.urandom(8).encode('hex'))
+
+
+#
+# Test
+if __name__ == '__main__':
+    import time
+    import multiprocessing
+    import tmcorpus
+    import tmbench
+    from tmparser import TuringMachineParser
+
+    for name in sorted(tmcorpus.CORPUS):
+        src, word, max_steps = tmcorpus.CORPUS[name]
+        tm = tmcorpus.createMachine(name)
+        segment = publishMachine(tm)
+        try:
+            shared = attachMachine(segment.name)
+            results = []
+            for machine in (tm, shared):
+                machine.setTape(word)
+                machine.setAtInitialState()
+                end_cond = machine.run(max_steps)
+                results.append((end_cond, machine.getCurrentState(),
+                                machine.getHeadPosition(),
+                                machine.getExecutedStepsCounter(),
+                                list(machine.getTapeIterator())))
+            print '%-20s same result: %-5s same table: %s' % \
+                (name, results[0] == results[1],
+                 shared.getTransitionFunction() == tm.getTransitionFunction())
+        finally:
+            segment.unlink()
+
+    # Attaching in a worker does not depend on the machine size
+    def attachTime(name):
+        start = time.time()
+        attachMachine(name)
+        return time.time() - start
+
+    pool = multiprocessing.Pool(1)
+    try:
+        for nstates in (100, 100000):
+            parser = TuringMachineParser()
+            parser.parseString(tmbench.generateSource(nstates))
+            tm = parser.create()
+            segment = publishMachine(tm)
+            try:
+                print '%d transitions, segment %d bytes, attach %.4fs' % \
+                    (len(tm.getTransitionFunction()), segment.size,
+                     pool.apply(attachTime, (segment.name,)))
+            finally:
+                segment.unlink()
+    finally:
+        pool.close()
+        pool.join()
+
+    segment = publishCorpus(['ab' * i for i in xrange(1000)])
+    try:
+        corpus = attachCorpus(segment.name)
+        print 'Corpus words:', len(corpus), 'word 3:', corpus[3], \
+            'same words:', list(corpus) == ['ab' * i for i in xrange(1000)]
+    finally:
+        segment.unlink()
@@ -0,0 +1,589 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import array
+import bisect
+import struct
+
+from tm import TuringMachine
+
+#
+# Binary execution traces
+#
+# A trace file starts with a header:
+#   magic 'TMTR', version, mode, keyframe interval, machine fingerprint,
+#   amount of transitions, and the bytes of every transition id and of every
+#   symbol index (1, 2 or 4, the smallest that fits)
+# followed by chunks, each one starting with a tag char:
+#   'K' keyframe: step, state id, head, origin, tape encoding, tape cells
+#       and the tape itself (one byte per cell if the machine tape is compact,
+#       otherwise the index of the symbol in the sorted tape alphabet)
+#   'S' block of steps: first step, amount of steps, the transition id of
+#       every step and, in MODE_FULL, the head delta of every step
+#
+# Transition ids are the positions in the sorted transition function, states
+# ids the positions in the sorted list of states. All the numbers are little
+# endian.
+#
+# A keyframe is written before the first step, every keyframe_interval steps
+# and after every setTape. TuringMachine.isWordAccepted restores the previous
+# tape without notifying the observers, so it must not be used while
+# recording.
+#
+
+MAGIC = 'TMTR'
+VERSION = 1
+
+MODE_FULL = 0
+MODE_IDS = 1
+
+DEF_KEYFRAME_INTERVAL = 65536
+BLOCK_STEPS = 4096
+WRITE_BUFFER = 1 << 16
+
+ENC_CODES = 0
+ENC_INDEXES = 1
+
+_HEADER = struct.Struct('<4sBBI40sIBB')
+_KEYFRAME = struct.Struct('<QIQqBQ')
+_BLOCK = struct.Struct('<QI')
+
+_DELTAS = {
+    TuringMachine.MOVE_LEFT: -1,
+    TuringMachine.MOVE_RIGHT: 1,
+    TuringMachine.NON_MOVEMENT: 0,
+}
+
+# Array typecodes by item size
+_TYPECODES = {1: 'B', 2: 'H', 4: 'I'}
+
+#
+#
+def _numberStates(tm):
+    """
+    Returns the sorted list of states of tm
+    """
+    states = set([tm.getInitialState(), tm.getHaltState()])
+    for k, v in tm.getTransitionFunction().iteritems():
+        states.add(k[0])
+        states.add(v[0])
+    return sorted(states)
+
+#
+#
+def _indexSize(count):
+    """
+    Returns the bytes of the smallest unsigned integer for count indexes
+    """
+    if count <= 1 << 8:
+        return 1
+    if count <= 1 << 16:
+        return 2
+    return 4
+
+#
+#
+def _packArray(arr):
+    """
+    Returns the little endian bytes of an array
+    """
+    if sys.byteorder == 'big' and arr.itemsize > 1:
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tostring()
+
+#
+#
+def _unpackArray(typecode, data):
+    """
+    Returns the array of the given type from its little endian bytes
+    """
+    arr = array.array(typecode, data)
+    if sys.byteorder == 'big' and arr.itemsize > 1:
+        arr.byteswap()
+    return arr
+
+
+#
+#
+class TraceRecorder:
+    """
+    TuringMachine observer that writes a binary trace of the executed steps
+    to a file. In MODE_FULL every step record holds the transition id and the
+    head delta, in MODE_IDS only the transition id.
+
+    The recorder attaches itself to the machine, close() flushes the trace
+    and detaches it. Keep in mind TuringMachine.run does not use the compiled
+    engine while there are observers
+    """
+
+    #
+    #
+    def __init__(self, tm, fname, mode=MODE_FULL,
+                 keyframe_interval=DEF_KEYFRAME_INTERVAL):
+        """
+        TraceRecorder(tm, fname, mode=MODE_FULL,
+                      keyframe_interval=DEF_KEYFRAME_INTERVAL)
+            - keyframe_interval: steps between keyframes, 0 to write them
+              only at the start and after every setTape
+        """
+        if mode not in (MODE_FULL, MODE_IDS):
+            raise Exception('Invalid trace mode %s' % str(mode))
+
+        self._tm = tm
+        self._mode = mode
+        self._interval = keyframe_interval
+        self._states = dict((s, i) for i, s in enumerate(_numberStates(tm)))
+        self._alphabet = dict((s, i) for i, s in
+                              enumerate(sorted(tm.getTapeAlphabet())))
+        # Symbol indexes are only written for tapes that are not compact
+        index_size = max(2, _indexSize(len(self._alphabet)))
+        self._index_type = _TYPECODES[index_size]
+
+        transitions = sorted(tm.getTransitionFunction().iteritems())
+        self._trans_index = dict((t[0], i) for i, t in enumerate(transitions))
+        id_size = _indexSize(len(transitions))
+        self._id_type = _TYPECODES[id_size]
+
+        self._nsteps = 0
+        self._last_key = None
+        self._block_start = 0
+        self._ids = array.array(self._id_type)
+        self._deltas = array.array('b')
+
+        self._file = open(fname, 'wb', WRITE_BUFFER)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, mode, keyframe_interval,
+                                      tm.getFingerprint(), len(transitions),
+                                      id_size, index_size))
+        tm.attachObserver(self)
+
+    #
+    #
+    def getStepCount(self):
+        """
+        Returns the amount of recorded steps
+        """
+        return self._nsteps
+
+    #
+    #
+    def close(self):
+        """
+        Writes the pending steps, closes the file and detaches the recorder
+        """
+        if self._file is None:
+            return
+        self._tm.detachObserver(self)
+        self._flushBlock()
+        self._file.close()
+        self._file = None
+
+    #
+    #
+    def onStepStart(self, current_state, current_tape_symbol):
+        tid = self._trans_index.get((current_state, current_tape_symbol))
+        if tid is None:
+            # The step fails with an UnknownTransitionException
+            return
+
+        if self._last_key is None or \
+           (self._interval and self._nsteps - self._last_key >= self._interval):
+            self._writeKeyframe()
+
+        self._ids.append(tid)
+        self._nsteps += 1
+
+    #
+    #
+    def onStepEnd(self, new_state, writed_symbol, movement):
+        if self._mode == MODE_FULL:
+            self._deltas.append(_DELTAS[movement])
+        if len(self._ids) >= BLOCK_STEPS:
+            self._flushBlock()
+
+    #
+    #
+    def onTapeChanged(self, head_pos):
+        # The state is usually set after the tape, the keyframe is written
+        # at the next step
+        self._last_key = None
+
+    #
+    #
+    def onHeadMoved(self, head_pos, old_head_pos):
+        pass
+
+    #
+    #
+    def _flushBlock(self):
+        if not self._ids:
+            return
+        self._file.write('S')
+        self._file.write(_BLOCK.pack(self._block_start, len(self._ids)))
+        self._file.write(_packArray(self._ids))
+        if self._mode == MODE_FULL:
+            self._file.write(self._deltas.tostring())
+        self._block_start = self._nsteps
+        self._ids = array.array(self._id_type)
+        self._deltas = array.array('b')
+
+    #
+    #
+    def _writeKeyframe(self):
+        self._flushBlock()
+
+        tm = self._tm
+        if tm.isTapeCompact():
+            encoding = ENC_CODES
+            tape = tm.getTapeView()
+        else:
+            encoding = ENC_INDEXES
+            tape = _packArray(array.array(self._index_type,
+                                          [self._alphabet[s] for s in
+                                           tm.getTapeIterator()]))
+
+        self._file.write('K')
+        self._file.write(_KEYFRAME.pack(self._nsteps,
+                                        self._states[tm.getCurrentState()],
+                                        tm.getHeadPosition(), tm._origin,
+                                        encoding, tm.getInternalTapeSize()))
+        self._file.write(tape)
+        self._last_key = self._nsteps
+
+
+#
+#
+class TraceReplayer:
+    """
+    Replays a trace on a machine with the same definition as the recorded
+    one. The replayer has its own observers, with the same interface as the
+    TuringMachine observers, so a GUI can redraw the replayed machine.
+
+    seek(step) restores the nearest previous keyframe and executes the
+    remaining steps without notifying the observers. step() executes the
+    next recorded step, checking it fires the recorded transition
+    """
+
+    #
+    #
+    def __init__(self, tm, fname):
+        self._tm = tm
+        self._file = open(fname, 'rb')
+
+        header = self._file.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise Exception('Invalid trace file')
+        magic, version, mode, interval, fingerprint, ntrans, id_size, \
+            index_size = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise Exception('Invalid trace file')
+        if fingerprint != tm.getFingerprint():
+            raise Exception('Trace was recorded from another machine')
+        if id_size not in _TYPECODES or index_size not in _TYPECODES:
+            raise Exception('Invalid trace file')
+
+        self._mode = mode
+        self._states = _numberStates(tm)
+        self._alphabet = sorted(tm.getTapeAlphabet())
+        self._transitions = sorted(tm.getTransitionFunction().iteritems())
+        self._id_type = _TYPECODES[id_size]
+        self._id_size = id_size
+        self._index_type = _TYPECODES[index_size]
+        self._index_size = index_size
+        self._observers = []
+
+        self._scan()
+        self._step = None
+        self._block = None
+        self._restored = None
+
+    #
+    #
+    def _scan(self):
+        """
+        Builds the index of keyframes and blocks
+        """
+        self._key_steps = []
+        self._key_offsets = []
+        self._block_steps = []
+        self._block_offsets = []
+        self._nsteps = 0
+
+        f = self._file
+        while True:
+            tag = f.read(1)
+            if not tag:
+                break
+            offset = f.tell()
+            if tag == 'K':
+                step, state, head, origin, encoding, ncells = \
+                    _KEYFRAME.unpack(f.read(_KEYFRAME.size))
+                self._key_steps.append(step)
+                self._key_offsets.append(offset)
+                f.seek(ncells * (1 if encoding == ENC_CODES
+                                 else self._index_size), 1)
+            elif tag == 'S':
+                first, count = _BLOCK.unpack(f.read(_BLOCK.size))
+                self._block_steps.append(first)
+                self._block_offsets.append(offset)
+                size = count * self._id_size
+                if self._mode == MODE_FULL:
+                    size += count
+                f.seek(size, 1)
+                self._nsteps = first + count
+            else:
+                raise Exception('Invalid trace chunk at %d' % (offset - 1))
+
+    #
+    #
+    def getStepCount(self):
+        """
+        Returns the amount of recorded steps
+        """
+        return self._nsteps
+
+    #
+    #
+    def getKeyframeSteps(self):
+        """
+        Returns the steps with a keyframe
+        """
+        return list(self._key_steps)
+
+    #
+    #
+    def getCurrentStep(self):
+        """
+        Returns the step the machine is at, None before the first seek
+        """
+        return self._step
+
+    #
+    #
+    def getTransitionAt(self, step):
+        """
+        Returns the recorded ((state, symbol), (state, symbol, movement))
+        transition of the given step
+        """
+        first, ids, deltas = self._loadBlock(step)
+        return self._transitions[ids[step - first]]
+
+    #
+    #
+    def getHeadDeltaAt(self, step):
+        """
+        Returns the recorded head delta (-1, 0 or 1) of the given step. Only
+        available on MODE_FULL traces
+        """
+        if self._mode != MODE_FULL:
+            raise Exception('Trace does not record head deltas')
+        first, ids, deltas = self._loadBlock(step)
+        return deltas[step - first]
+
+    #
+    #
+    def attachObserver(self, observer):
+        """
+        Attach an observer, see TuringMachine.attachObserver
+        """
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    #
+    #
+    def detachObserver(self, observer):
+        """
+        Remove the specified observer
+        """
+        try:
+            self._observers.remove(observer)
+        except ValueError:
+            pass
+
+    #
+    #
+    def seek(self, step):
+        """
+        Sets the machine as it was before executing the given step. Observers
+        get an onTapeChanged
+        """
+        if step < 0 or step > self._nsteps:
+            raise Exception('Step %d out of the trace' % step)
+
+        i = bisect.bisect_right(self._key_steps, step) - 1
+        if i < 0:
+            raise Exception('There are no keyframes before step %d' % step)
+        self._restoreKeyframe(self._key_offsets[i])
+
+        tm = self._tm
+        remaining = step - self._key_steps[i]
+        if remaining:
+            observers = tm._observers
+            tm._observers = []
+            try:
+                end_cond = tm.run(remaining)
+            finally:
+                tm._observers = observers
+            if end_cond != TuringMachine.END_MAX_STEPS:
+                raise Exception('Machine does not match the trace')
+
+        self._step = step
+        for obs in self._observers:
+            obs.onTapeChanged(tm.getHeadPosition())
+
+    #
+    #
+    def step(self):
+        """
+        Replays the next step. Returns False at the end of the trace
+        """
+        if self._step is None:
+            self.seek(0)
+        if self._step >= self._nsteps:
+            return False
+
+        # The tape could have been set again at this step
+        i = bisect.bisect_right(self._key_steps, self._step) - 1
+        if self._key_steps[i] == self._step and \
+           self._key_offsets[i] != self._restored:
+            self.seek(self._step)
+
+        tm = self._tm
+        (state, symbol), (nstate, nsymbol, movement) = \
+            self.getTransitionAt(self._step)
+        if tm.getCurrentState() != state or \
+           tm.getSymbolAt(tm.getHeadPosition()) != symbol:
+            raise Exception('Machine does not match the trace at step %d' %
+                            self._step)
+
+        for obs in self._observers:
+            obs.onStepStart(state, symbol)
+
+        old_head = tm.getHeadPosition()
+        tm.step()
+        self._step += 1
+
+        for obs in self._observers:
+            obs.onStepEnd(nstate, nsymbol, movement)
+            if old_head != tm.getHeadPosition():
+                obs.onHeadMoved(tm.getHeadPosition(), old_head)
+
+        return True
+
+    #
+    #
+    def close(self):
+        self._file.close()
+
+    #
+    #
+    def _restoreKeyframe(self, offset):
+        f = self._file
+        f.seek(offset)
+        step, state, head, origin, encoding, ncells = \
+            _KEYFRAME.unpack(f.read(_KEYFRAME.size))
+
+        tm = self._tm
+        if encoding == ENC_CODES:
+            if not tm.isTapeCompact():
+                raise Exception('Machine does not match the trace')
+            tape = bytearray(f.read(ncells))
+        else:
+            alphabet = self._alphabet
+            tape = tm._encodeTape([alphabet[i] for i in
+                                   _unpackArray(self._index_type,
+                                                f.read(ncells *
+                                                       self._index_size))])
+
+        tm._tape = tape
+        tm._head = head
+        tm._origin = origin
+        tm._cur_state = self._states[state]
+        tm._nexecuted_steps = step
+        self._restored = offset
+
+    #
+    #
+    def _loadBlock(self, step):
+        """
+        Returns (first step, ids, deltas) of the block with the given step
+        """
+        if step < 0 or step >= self._nsteps:
+            raise Exception('Step %d out of the trace' % step)
+
+        if self._block is None or \
+           not self._block[0] <= step < self._block[0] + len(self._block[1]):
+            i = bisect.bisect_right(self._block_steps, step) - 1
+            f = self._file
+            f.seek(self._block_offsets[i])
+            first, count = _BLOCK.unpack(f.read(_BLOCK.size))
+            ids = _unpackArray(self._id_type, f.read(count * self._id_size))
+            if self._mode == MODE_FULL:
+                deltas = array.array('b', f.read(count))
+            else:
+                deltas = None
+            self._block = (first, ids, deltas)
+
+        return self._block
+
+
+#
+# Test
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import tmcorpus
+
+    class PrintObserver:
+        def onStepStart(self, current_state, current_tape_symbol):
+            print '  start', current_state, current_tape_symbol,
+        def onStepEnd(self, new_state, writed_symbol, movement):
+            print '-> end', new_state, writed_symbol, movement
+        def onTapeChanged(self, head_pos):
+            print '  tape changed, head at', head_pos
+        def onHeadMoved(self, head_pos, old_head_pos):
+            pass
+
+    src, word, max_steps = tmcorpus.CORPUS['unary_addition']
+    fd, fname = tempfile.mkstemp()
+    os.close(fd)
+
+    try:
+        for mode in (MODE_FULL, MODE_IDS):
+            tm = tmcorpus.createMachine('unary_addition')
+            recorder = TraceRecorder(tm, fname, mode, 100)
+            tm.setTape(word)
+            tm.setAtInitialState()
+            tm.run(max_steps)
+            tm.setTape('1+1')
+            tm.setAtInitialState()
+            tm.run(max_steps)
+            recorder.close()
+            print 'Mode', mode, 'steps', recorder.getStepCount(), \
+                'bytes', os.path.getsize(fname)
+
+        print 'Replay'
+        tm = tmcorpus.createMachine('unary_addition')
+        replayer = TraceReplayer(tm, fname)
+        print 'Steps:', replayer.getStepCount(), 'Keyframes:', \
+            len(replayer.getKeyframeSteps())
+
+        # Reference execution
+        ref = tmcorpus.createMachine('unary_addition')
+        ref.setTape(word)
+        ref.setAtInitialState()
+        ref.run(250)
+
+        replayer.seek(250)
+        print 'Tape at step 250 matches:', \
+            list(tm.getTapeIterator()) == list(ref.getTapeIterator())
+
+        replayer.attachObserver(PrintObserver())
+        replayer.seek(replayer.getStepCount() - 3)
+        while replayer.step():
+            pass
+        print 'Final state:', tm.getCurrentState(), \
+            'Tape:', ''.join(tm.getTapeIterator())
+        replayer.close()
+    finally:
+        os.remove(fname)
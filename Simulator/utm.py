@@ -52,6 +52,10 @@ class GUI(QtGui.QWidget):
         # Turing machine and Turing machine parser
         self.parser = tmparser.TuringMachineParser()
         self.turing_machine = None
+        # Directory of the loaded source, for its imports
+        self.src_dir = None
+        # (kind, value) breakpoints set from the source editor
+        self.breakpoints = set()
         
     #
     #
@@ -84,6 +88,7 @@ class GUI(QtGui.QWidget):
         self.run_all_btn.clicked.connect(self.onRunUntilHaltClicked)  
         self.src_load_btn.clicked.connect(self.onLoadClicked)
         self.src_save_btn.clicked.connect(self.onSaveClicked)
+        self.src_break_btn.clicked.connect(self.onToggleBreakpointClicked)
         self.clear_log_btn.clicked.connect(self.onClearLogClicked)
         self.print_all_tape_btn.clicked.connect(self.onPrintAllTape)
         
@@ -99,9 +104,10 @@ class GUI(QtGui.QWidget):
         tmstr = str(self.src_textbox.toPlainText())
         try:
             self.parser.clean()
-            self.parser.parseString(tmstr)
+            self.parser.parseString(tmstr, self.src_dir)
             self.turing_machine = self.parser.create()
             self.turing_machine.attachObserver(self)
+            self._applyBreakpoints()
             
             self._printInfoLog('Turing machine created')
             self._printInfoLog('Current state: ' + 
@@ -155,19 +161,47 @@ class GUI(QtGui.QWidget):
                 self._printInfoLog('---------- Run Until Halt ----------')
                 
                 try:
-                    while not self.turing_machine.isAtHaltState():
-                        self.turing_machine.step()
+                    end_cond = self.turing_machine.run()
                     
-                except tmexceptions.UnsetTapeException, e:
-                    self._printErrorLog(str(e))
+                    if end_cond == tm.TuringMachine.END_BREAKPOINT:
+                        kind, value = self.turing_machine.getLastBreakpoint()
+                        self._printStrikingInfoLog('Breakpoint hit: %s %s' %
+                                                   (kind, str(value)))
+                    elif end_cond == tm.TuringMachine.END_UNKNOWN_TRANSITION:
+                        head = self.turing_machine.getHeadPosition()
+                        self._printErrorLog('There are no transition for %s'
+                            % str((self.turing_machine.getCurrentState(),
+                                   self.turing_machine.getSymbolAt(head))))
                     
-                except tmexceptions.UnknownTransitionException, e:
+                except tmexceptions.UnsetTapeException, e:
                     self._printErrorLog(str(e))
                 
         except AttributeError:
             self._printErrorLog('Error: Turing machine is unset')
     #
     #
+    def onToggleBreakpointClicked(self):
+        
+        line = str(self.src_textbox.textCursor().block().text())
+        bp = self.parser.parseBreakpoint(line)
+        if bp is None:
+            self._printErrorLog('Error: Breakpoints can only be set on '
+                                'transition, INITIAL, FINAL and HALT lines')
+            return
+            
+        if bp in self.breakpoints:
+            self.breakpoints.remove(bp)
+            if self.turing_machine:
+                self.turing_machine.removeBreakpoint(*bp)
+            self._printInfoLog('Breakpoint removed: %s %s' % 
+                               (bp[0], str(bp[1])))
+        else:
+            self.breakpoints.add(bp)
+            self._printInfoLog('Breakpoint set: %s %s' % (bp[0], str(bp[1])))
+            self._applyBreakpoints()
+            
+    #
+    #
     def onLoadClicked(self):
         
         fname = QtGui.QFileDialog.getOpenFileName(self, 'Load file',
@@ -178,6 +212,7 @@ class GUI(QtGui.QWidget):
             fstr = f.read()
             self.src_textbox.setPlainText(fstr)
             f.close()
+            self.src_dir = os.path.dirname(str(fname))
             
             self._printInfoLog('Loaded file: %s' % fname)            
     #
@@ -333,6 +368,10 @@ class GUI(QtGui.QWidget):
         highlighters.TMSourceHightlighter(self.src_textbox, "Classic" )
         self.src_load_btn = QtGui.QPushButton('Load', self)
         self.src_save_btn = QtGui.QPushButton('Save', self)
+        self.src_break_btn = QtGui.QPushButton('Toggle Breakpoint', self)
+        self.src_break_btn.setToolTip('Stops Run Until Halt before the '
+                                      'transition, or when entering the '
+                                      'state, of the current line')
         
         self.ctrl_lvbox = QtGui.QVBoxLayout()
         self.ctrl_lvbox.addWidget(ctrl_llabel, 0, Qt.AlignCenter)
@@ -340,6 +379,7 @@ class GUI(QtGui.QWidget):
         ctrl_btn_hbox = QtGui.QHBoxLayout()
         ctrl_btn_hbox.addWidget(self.src_load_btn)
         ctrl_btn_hbox.addWidget(self.src_save_btn)
+        ctrl_btn_hbox.addWidget(self.src_break_btn)
         self.ctrl_lvbox.addLayout(ctrl_btn_hbox)
         
         # Add control buttons
@@ -368,6 +408,22 @@ class GUI(QtGui.QWidget):
         self.ctrl_hbox.addLayout(self.ctrl_rvbox, 1)
         self.main_vbox.addLayout(self.ctrl_hbox, 2)
         
+    #
+    #
+    def _applyBreakpoints(self):
+        """
+        Sets the breakpoints on the current Turing machine
+        """
+        if not self.turing_machine:
+            return
+            
+        self.turing_machine.clearBreakpoints()
+        for bp in self.breakpoints:
+            try:
+                self.turing_machine.addBreakpoint(*bp)
+            except Exception, e:
+                self._printErrorLog('Breakpoint ignored: %s' % str(e))
+                
     #
     #
     def _redrawTape(self, head_pos):